@@ -0,0 +1,205 @@
+"""
+Pre-aggregated sales analytics for WORLD DISTRIBUTION
+
+Daily rollups per user, per user and product, and per user and category are
+updated in the same transaction as order creation (orders.place_order) and
+status changes (webhooks.process_batch), so dashboard reads cost the same no
+matter how many orders an account has.
+
+Rows are keyed by the order's current status: a status change removes the
+order's contribution under the old status and adds it back under the new one.
+Category rollups use the category recorded on each order line when the order
+was placed, so recategorising a product never moves or strands past spend.
+
+    python analytics.py backfill     # rebuild all rollups from orders
+"""
+import sqlite3
+import sys
+import time
+from typing import Optional, List, Dict, Any, Sequence, Tuple
+import migrations
+from database import get_db
+
+# Order statuses that count towards spend by default
+COUNTED_STATUSES = ('pending', 'processing', 'paid')
+BACKFILL_CHUNK_SIZE = 20000
+
+ROLLUP_TABLES = ("sales_daily_user", "sales_daily_product", "sales_daily_category")
+
+_UPSERTS = (
+    """INSERT INTO sales_daily_user (user_id, day, status, orders, spend, vat)
+       SELECT o.user_id, date(o.created_at), o.status, ? * count(*), ? * sum(o.total_amount), ? * sum(o.vat_amount)
+       FROM orders o WHERE {where}
+       GROUP BY 1, 2, 3
+       ON CONFLICT (user_id, day, status) DO UPDATE SET
+           orders = orders + excluded.orders,
+           spend = spend + excluded.spend,
+           vat = vat + excluded.vat""",
+    """INSERT INTO sales_daily_product (user_id, product_id, day, status, orders, quantity, spend)
+       SELECT o.user_id, oi.product_id, date(o.created_at), o.status,
+              ? * count(DISTINCT o.id), ? * sum(oi.quantity), ? * sum(oi.quantity * oi.price_per_unit)
+       FROM orders o JOIN order_items oi ON oi.order_id = o.id
+       WHERE {where}
+       GROUP BY 1, 2, 3, 4
+       ON CONFLICT (user_id, product_id, day, status) DO UPDATE SET
+           orders = orders + excluded.orders,
+           quantity = quantity + excluded.quantity,
+           spend = spend + excluded.spend""",
+    """INSERT INTO sales_daily_category (user_id, category, day, status, orders, quantity, spend)
+       SELECT o.user_id, coalesce(oi.category, 'Uncategorized'), date(o.created_at), o.status,
+              ? * count(DISTINCT o.id), ? * sum(oi.quantity), ? * sum(oi.quantity * oi.price_per_unit)
+       FROM orders o JOIN order_items oi ON oi.order_id = o.id
+       WHERE {where}
+       GROUP BY 1, 2, 3, 4
+       ON CONFLICT (user_id, category, day, status) DO UPDATE SET
+           orders = orders + excluded.orders,
+           quantity = quantity + excluded.quantity,
+           spend = spend + excluded.spend""",
+)
+
+
+def _apply(conn: sqlite3.Connection, where: str, params: Sequence[Any], sign: int):
+    for upsert in _UPSERTS:
+        conn.execute(upsert.format(where=where), (sign, sign, sign, *params))
+
+
+def record_orders(conn: sqlite3.Connection, order_ids: Sequence[int], sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) orders' current contribution; call inside the write transaction"""
+    if not order_ids:
+        return
+    placeholders = ", ".join("?" * len(order_ids))
+    _apply(conn, f"o.id IN ({placeholders})", tuple(order_ids), sign)
+
+
+def backfill(db_path: str, chunk_size: int = BACKFILL_CHUNK_SIZE, conn: Optional[sqlite3.Connection] = None) -> int:
+    """Rebuild every rollup from orders, one id range per transaction.
+
+    Meant for first-time setup and repair: status changes applied while the
+    backfill is still running can be counted twice, so run it while the
+    webhook worker is idle.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = migrations.connect(db_path)
+    try:
+        with migrations.atomic(conn):
+            for table in ROLLUP_TABLES:
+                conn.execute(f"DELETE FROM {table}")
+            max_id = conn.execute("SELECT coalesce(max(id), 0) FROM orders").fetchone()[0]
+
+        for start in range(1, max_id + 1, chunk_size):
+            with migrations.atomic(conn):
+                _apply(conn, "o.id BETWEEN ? AND ?", (start, min(start + chunk_size - 1, max_id)), 1)
+            time.sleep(migrations.MIGRATION_CHUNK_PAUSE)
+        return max_id
+    finally:
+        if own_conn:
+            conn.close()
+
+
+# ============================================================================
+# READS (rollups only)
+# ============================================================================
+
+def _filters(user_id: int, days: int, statuses: Sequence[str]) -> Tuple[str, List[Any]]:
+    placeholders = ", ".join("?" * len(statuses))
+    return (
+        f"user_id = ? AND day >= date('now', ?) AND status IN ({placeholders})",
+        [user_id, f"-{days - 1} days", *statuses],
+    )
+
+
+def user_summary(user_id: int, days: int = 30, statuses: Sequence[str] = COUNTED_STATUSES) -> Dict[str, Any]:
+    """Totals, a per-status breakdown and a daily series for one user"""
+    where, params = _filters(user_id, days, statuses)
+    with get_db() as conn:
+        rows = conn.execute(
+            f"""SELECT day, status, orders, spend, vat FROM sales_daily_user
+                WHERE {where} ORDER BY day""",
+            params
+        ).fetchall()
+
+    daily: Dict[str, Dict[str, Any]] = {}
+    by_status: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        for bucket in (
+            daily.setdefault(row['day'], {"day": row['day'], "orders": 0, "spend": 0.0, "vat": 0.0}),
+            by_status.setdefault(row['status'], {"status": row['status'], "orders": 0, "spend": 0.0, "vat": 0.0}),
+        ):
+            bucket["orders"] += row['orders']
+            bucket["spend"] += row['spend']
+            bucket["vat"] += row['vat']
+
+    def rounded(entry: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(entry, spend=round(entry["spend"], 2), vat=round(entry["vat"], 2))
+
+    daily_rows = [rounded(entry) for entry in daily.values() if entry["orders"]]
+    return {
+        "days": days,
+        "orders": sum(entry["orders"] for entry in daily_rows),
+        "spend": round(sum(entry["spend"] for entry in daily_rows), 2),
+        "vat": round(sum(entry["vat"] for entry in daily_rows), 2),
+        "by_status": [rounded(entry) for entry in by_status.values() if entry["orders"]],
+        "daily": daily_rows,
+    }
+
+
+def top_products(
+    user_id: int,
+    days: int = 30,
+    limit: int = 20,
+    statuses: Sequence[str] = COUNTED_STATUSES
+) -> List[Dict[str, Any]]:
+    """Products by spend for one user"""
+    where, params = _filters(user_id, days, statuses)
+    with get_db() as conn:
+        rows = conn.execute(
+            f"""SELECT product_id, sum(orders) AS orders, sum(quantity) AS quantity, sum(spend) AS spend
+                FROM sales_daily_product WHERE {where}
+                GROUP BY product_id HAVING sum(orders) > 0
+                ORDER BY spend DESC LIMIT ?""",
+            (*params, limit)
+        ).fetchall()
+    return [
+        {
+            "product_id": row['product_id'], "orders": row['orders'],
+            "quantity": row['quantity'], "spend": round(row['spend'], 2),
+        }
+        for row in rows
+    ]
+
+
+def category_breakdown(
+    user_id: int,
+    days: int = 30,
+    statuses: Sequence[str] = COUNTED_STATUSES
+) -> List[Dict[str, Any]]:
+    """Spend per product category for one user"""
+    where, params = _filters(user_id, days, statuses)
+    with get_db() as conn:
+        rows = conn.execute(
+            f"""SELECT category, sum(orders) AS orders, sum(quantity) AS quantity, sum(spend) AS spend
+                FROM sales_daily_category WHERE {where}
+                GROUP BY category HAVING sum(orders) > 0
+                ORDER BY spend DESC""",
+            params
+        ).fetchall()
+    return [
+        {
+            "category": row['category'], "orders": row['orders'],
+            "quantity": row['quantity'], "spend": round(row['spend'], 2),
+        }
+        for row in rows
+    ]
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        print("Usage: python analytics.py backfill")
+        sys.exit(1)
+    from database import DATABASE_PATH
+
+    started = time.perf_counter()
+    print("📊 Rebuilding sales rollups...")
+    max_id = backfill(DATABASE_PATH)
+    print(f"✅ Rolled up orders 1..{max_id} in {time.perf_counter() - started:.2f}s")
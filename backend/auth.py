@@ -1,17 +1,28 @@
 """
 Authentication utilities for WORLD DISTRIBUTION
 """
+import asyncio
 import bcrypt
+import os
 import secrets
 from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import HTTPException, Cookie, Response
-from database import execute_one, execute_insert, execute_update
+from fastapi import HTTPException, Cookie, Depends, Response
+from database import execute_one, execute_insert, execute_update, run_in_db
+from session_cache import session_cache
+from state_backend import state
+from starlette.requests import cookie_parser
+import tokens
 
+# Users allowed to manage the catalog (comma-separated emails)
+ADMIN_EMAILS = {
+    email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()
+}
 
-def hash_password(password: str) -> str:
+
+def hash_password(password: str, rounds: int = 12) -> str:
     """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -39,32 +50,59 @@ def create_session(user_id: int) -> str:
     return session_id
 
 
+def _load_session_user(session_id: str) -> Optional[dict]:
+    """Resolve a session to its user from the database and cache the result"""
+    # Get session (if not expired) and its user in a single lookup
+    row = execute_one(
+        """SELECT s.expires_at, u.id, u.email, u.company_name, u.country, u.region
+           FROM sessions s JOIN users u ON u.id = s.user_id
+           WHERE s.session_id = ? AND s.expires_at > ?""",
+        (session_id, datetime.now().isoformat())
+    )
+    
+    if not row:
+        return None
+    
+    expires_at = datetime.fromisoformat(row.pop('expires_at'))
+    session_cache.put(session_id, row, expires_at)
+    
+    return row
+
+
 def get_user_from_session(session_id: Optional[str]) -> Optional[dict]:
     """Get user data from session ID"""
     if not session_id:
         return None
     
-    # Get session and check if it's expired
-    session = execute_one(
-        "SELECT * FROM sessions WHERE session_id = ? AND expires_at > ?",
-        (session_id, datetime.now().isoformat())
-    )
+    cached = session_cache.get(session_id)
+    if cached is not None:
+        return cached
     
-    if not session:
+    return _load_session_user(session_id)
+
+
+async def get_user_from_session_async(session_id: Optional[str]) -> Optional[dict]:
+    """Get user data from session ID without blocking the event loop"""
+    if not session_id:
         return None
     
-    # Get user data
-    user = execute_one(
-        "SELECT id, email, company_name, country, region FROM users WHERE id = ?",
-        (session['user_id'],)
-    )
+    if not session_cache.local:
+        # A shared cache is a network round trip; keep it off the event loop too
+        return await run_in_db(get_user_from_session, session_id)
     
-    return user
+    cached = session_cache.get(session_id)
+    if cached is not None:
+        return cached
+    
+    return await run_in_db(_load_session_user, session_id)
 
 
 def delete_session(session_id: str):
     """Delete a session (logout)"""
     execute_update("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+    session_cache.invalidate(session_id)
+    if tokens.token_mode():
+        tokens.revoke_session(session_id)
 
 
 def cleanup_expired_sessions():
@@ -73,13 +111,14 @@ def cleanup_expired_sessions():
         "DELETE FROM sessions WHERE expires_at < ?",
         (datetime.now().isoformat(),)
     )
+    session_cache.purge_expired()
 
 
-def set_session_cookie(response: Response, session_id: str):
-    """Set session cookie in response"""
+def set_session_cookie(response: Response, session_id: str, user: Optional[dict] = None):
+    """Set session cookie in response (a signed token for `user` when AUTH_MODE=token)"""
     response.set_cookie(
         key="session_id",
-        value=session_id,
+        value=tokens.issue_token(user, session_id) if tokens.token_mode() and user else session_id,
         httponly=True,
         max_age=7 * 24 * 60 * 60,  # 7 days
         samesite="lax",
@@ -92,9 +131,87 @@ def clear_session_cookie(response: Response):
     response.delete_cookie(key="session_id")
 
 
-def require_auth(session_id: Optional[str] = Cookie(None)) -> dict:
+async def authenticate(cookie: Optional[str]) -> Optional[dict]:
+    """Resolve the session_id cookie (bare session id or signed token) to a user"""
+    if tokens.token_mode() and tokens.looks_like_token(cookie):
+        # Pure CPU for valid tokens; expired or revoked ones fall back to the database session
+        if state.shared:
+            user = await asyncio.to_thread(tokens.verify_token, cookie)
+        else:
+            user = tokens.verify_token(cookie)
+        if user is not None:
+            return user
+        cookie = tokens.session_id_of(cookie)
+    return await get_user_from_session_async(cookie)
+
+
+async def require_auth(session_id: Optional[str] = Cookie(None)) -> dict:
     """Dependency to require authentication"""
-    user = get_user_from_session(session_id)
+    user = await authenticate(session_id)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     return user
+
+
+async def require_admin(user: dict = Depends(require_auth)) -> dict:
+    """Dependency to require an authenticated user listed in ADMIN_EMAILS"""
+    if (user.get("email") or "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
+
+class TokenRefreshMiddleware:
+    """Re-issue expired session tokens from their database session.
+
+    The refreshed token replaces the cookie for the rest of the request and is
+    sent back in Set-Cookie, so the route itself only ever sees a valid token.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        cookies = {}
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                cookies = cookie_parser(value.decode("latin-1"))
+                break
+        token = cookies.get("session_id")
+        fresh = await self._refresh(token) if tokens.looks_like_token(token) else None
+        if fresh is None:
+            await self.app(scope, receive, send)
+            return
+
+        cookies["session_id"] = fresh
+        cookie_header = "; ".join(f"{name}={value}" for name, value in cookies.items())
+        headers = [(name, value) for name, value in scope["headers"] if name != b"cookie"]
+        headers.append((b"cookie", cookie_header.encode("latin-1")))
+        scope = dict(scope, headers=headers)
+
+        carrier = Response()
+        set_session_cookie(carrier, fresh)
+        set_cookie = [header for header in carrier.raw_headers if header[0] == b"set-cookie"]
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=list(message.get("headers", [])) + set_cookie)
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+    async def _refresh(self, token: str) -> Optional[str]:
+        try:
+            tokens.decode_token(token)
+            return None
+        except tokens.TokenExpired as e:
+            session_id = e.claims.get("sid")
+        except tokens.JWTError:
+            return None
+        user = await get_user_from_session_async(session_id)
+        if user is None:
+            return None
+        return tokens.issue_token(user, session_id)
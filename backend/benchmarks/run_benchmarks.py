@@ -0,0 +1,353 @@
+"""
+Load-test and benchmark suite for the WORLD DISTRIBUTION API
+
+Builds a throwaway database with generate_data.py at realistic volumes,
+then drives the main flows (catalog browse, login, /api/auth/me,
+create_order, get_user_orders) either in-process through the ASGI app or
+over HTTP against a real uvicorn server, and reports p50/p95/p99 latency
+and throughput per scenario.
+
+    python benchmarks/run_benchmarks.py --mode both --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/baseline.json
+
+With --compare the run exits with status 1 when any scenario's p95 latency
+or throughput regressed by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Callable, Awaitable
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+BENCH_PASSWORD = "bench-password"
+
+
+# ============================================================================
+# DATASET
+# ============================================================================
+
+def build_dataset(db_path: str, products: int, users: int, orders: int, items_per_order: int, seed: int):
+    """Create a benchmark database with generate_data.py"""
+    # Imported here so DATABASE_PATH is already set; importing database creates the schema
+    import database  # noqa: F401
+    from generate_data import generate
+
+    generate(
+        db_path, users=users, products=products, orders=orders, items_per_order=items_per_order,
+        seed=seed, password=BENCH_PASSWORD, stock=10 ** 9, verbose=False
+    )
+
+
+def create_sessions(db_path: str, count: int, users: int) -> List[str]:
+    """Insert ready-made sessions for the authenticated scenarios"""
+    from auth import generate_session_id
+
+    expires_at = (datetime.now() + timedelta(days=1)).isoformat()
+    sessions = [(generate_session_id(), (i % users) + 1, expires_at) for i in range(count)]
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO sessions (session_id, user_id, expires_at) VALUES (?, ?, ?)", sessions
+        )
+    conn.close()
+    return [session_id for session_id, _, _ in sessions]
+
+
+# ============================================================================
+# SCENARIOS
+# ============================================================================
+
+Scenario = Callable[[httpx.AsyncClient, random.Random], Awaitable[httpx.Response]]
+
+
+def make_scenarios(ctx: Dict[str, Any]) -> Dict[str, Scenario]:
+    """Request generators for each benchmarked flow"""
+    products = ctx['products']
+    categories = sorted({p['category'] for p in products})
+    sessions = ctx['sessions']
+    users = ctx['users']
+
+    def cookie(rng: random.Random) -> Dict[str, str]:
+        return {"Cookie": f"session_id={rng.choice(sessions)}"}
+
+    async def catalog_browse(client, rng):
+        pick = rng.random()
+        if pick < 0.4:
+            return await client.get("/api/products")
+        if pick < 0.7:
+            return await client.get("/api/products", params={"category": rng.choice(categories)})
+        return await client.get(f"/api/products/{rng.choice(products)['id']}")
+
+    async def login(client, rng):
+        return await client.post("/api/auth/login", json={
+            "email": f"user{rng.randint(1, users)}@example.com",
+            "password": BENCH_PASSWORD,
+        })
+
+    async def auth_me(client, rng):
+        return await client.get("/api/auth/me", headers=cookie(rng))
+
+    async def create_order(client, rng):
+        lines = rng.sample(products, k=min(5, len(products)))
+        return await client.post("/api/orders", headers=cookie(rng), json={
+            "payment_method": "bank",
+            "items": [
+                {
+                    "product_id": p['id'],
+                    "quantity": rng.randint(100, 499),
+                    "price_per_unit": p['base_price'],
+                    "volume_tier": "100kg",
+                }
+                for p in lines
+            ],
+        })
+
+    async def get_user_orders(client, rng):
+        return await client.get("/api/orders", params={"limit": 50}, headers=cookie(rng))
+
+    return {
+        "catalog_browse": catalog_browse,
+        "login": login,
+        "auth_me": auth_me,
+        "create_order": create_order,
+        "get_user_orders": get_user_orders,
+    }
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    requests: int,
+    concurrency: int,
+    seed: int
+) -> Dict[str, Any]:
+    """Issue `requests` calls with `concurrency` workers and summarise latency"""
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker(worker_id: int):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + worker_id)
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                response = await scenario(client, rng)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+async def run_all(client: httpx.AsyncClient, ctx: Dict[str, Any], args) -> Dict[str, Any]:
+    scenarios = make_scenarios(ctx)
+    results = {}
+    for name in args.scenarios:
+        requests = args.login_requests if name == "login" else args.requests
+        # Warm caches and connections before measuring
+        await run_scenario(client, scenarios[name], min(requests, args.concurrency), args.concurrency, args.seed)
+        results[name] = await run_scenario(client, scenarios[name], requests, args.concurrency, args.seed)
+        print(format_row(name, results[name]))
+    return results
+
+
+async def run_inprocess(ctx: Dict[str, Any], args) -> Dict[str, Any]:
+    """Drive the ASGI app directly (no network, no server overhead)"""
+    import main
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await run_all(client, ctx, args)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_uvicorn(ctx: Dict[str, Any], args) -> Dict[str, Any]:
+    """Drive a real uvicorn server over HTTP"""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=dict(os.environ),
+    )
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError("uvicorn did not start")
+                await asyncio.sleep(0.2)
+            return await run_all(client, ctx, args)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+# ============================================================================
+# REPORTING
+# ============================================================================
+
+def format_row(name: str, result: Dict[str, Any]) -> str:
+    return (
+        f"  {name:<18} {result['requests']:>6} req  {result['throughput_rps']:>9.1f} req/s  "
+        f"p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms  "
+        f"p99 {result['p99_ms']:>8.2f}ms  errors {result['errors']}"
+    )
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return human readable regressions against a saved baseline"""
+    regressions = []
+    for mode, scenarios in results["results"].items():
+        for name, current in scenarios.items():
+            previous = baseline.get("results", {}).get(mode, {}).get(name)
+            if not previous:
+                continue
+            if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{mode}/{name}: p95 {current['p95_ms']}ms vs baseline {previous['p95_ms']}ms"
+                )
+            if current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+                regressions.append(
+                    f"{mode}/{name}: {current['throughput_rps']} req/s vs baseline "
+                    f"{previous['throughput_rps']} req/s"
+                )
+            if current["errors"] > previous["errors"]:
+                regressions.append(f"{mode}/{name}: {current['errors']} errors vs baseline {previous['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the World Distribution API")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn", "both"], default="inprocess")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--items-per-order", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--login-requests", type=int, default=50,
+                        help="requests for the bcrypt-bound login scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--scenarios", nargs="+", default=[
+        "catalog_browse", "login", "auth_me", "create_order", "get_user_orders"
+    ])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default=None, help="database path (temporary when omitted)")
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    parser.add_argument("--save-baseline", default=None, help="write results JSON as the new baseline")
+    parser.add_argument("--compare", default=None, help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    tmpdir = None
+    db_path = args.db
+    if db_path is None:
+        tmpdir = tempfile.TemporaryDirectory(prefix="wd-bench-")
+        db_path = os.path.join(tmpdir.name, "bench.db")
+    if os.path.exists(db_path):
+        sys.exit(f"Refusing to overwrite existing database {db_path}")
+    os.environ["DATABASE_PATH"] = db_path
+    # Keep the benchmark focused on request handling
+    os.environ.setdefault("SESSION_REAPER_ENABLED", "0")
+    # All simulated clients share one address, so per-client limits would throttle the run
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+    print(f"🏗️  Building dataset: {args.products} products, {args.users} users, {args.orders} orders")
+    started = time.perf_counter()
+    build_dataset(db_path, args.products, args.users, args.orders, args.items_per_order, args.seed)
+    sessions = create_sessions(db_path, min(args.users, 500), args.users)
+    print(f"✅ Dataset ready in {time.perf_counter() - started:.1f}s")
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    products = [dict(row) for row in conn.execute("SELECT id, category, base_price FROM products")]
+    conn.close()
+    ctx = {"products": products, "sessions": sessions, "users": args.users}
+
+    modes = ["inprocess", "uvicorn"] if args.mode == "both" else [args.mode]
+    results: Dict[str, Any] = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "save_baseline", "compare")},
+        },
+        "results": {},
+    }
+    for mode in modes:
+        print(f"\n🚀 {mode} (concurrency {args.concurrency})")
+        runner = run_inprocess if mode == "inprocess" else run_uvicorn
+        results["results"][mode] = asyncio.run(runner(ctx, args))
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"\n💾 Results written to {path}")
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ Regressions beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"\n✅ No regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
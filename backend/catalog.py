@@ -0,0 +1,439 @@
+"""
+In-memory product catalog for WORLD DISTRIBUTION
+
+The catalog changes rarely but is the most requested public data, so it is
+loaded once into a snapshot indexed by id and by category, with the JSON
+bodies and strong ETags precomputed. Every write to products is recorded in
+the product_changes log (by triggers), so a stale snapshot is refreshed by
+re-reading only the products changed since the version it holds. Writers
+must call ``catalog.invalidate()`` so this and other workers notice.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional, List, Dict, Any, Tuple
+from fastapi import Response
+from database import execute_query, get_db
+from responses import dumps
+from state_backend import state, StateBackend, StateBackendError
+
+CATALOG_TTL = float(os.getenv("CATALOG_TTL", "300"))
+CATALOG_VERSION_CHECK_INTERVAL = float(os.getenv("CATALOG_VERSION_CHECK_INTERVAL", "1"))
+CATALOG_VERSION_KEY = "catalog:version"
+# Change log entries kept for incremental refreshes (older snapshots reload in full)
+CATALOG_CHANGES_RETAIN = int(os.getenv("CATALOG_CHANGES_RETAIN", "100000"))
+CATALOG_PRUNE_BATCH = 5000
+
+PRODUCT_FIELDS = (
+    "id", "sku", "name", "category", "base_price", "unit", "stock", "description", "image_url"
+)
+
+
+def serialize(payload: Any) -> Tuple[bytes, str]:
+    """Return (compact JSON body, strong ETag) for a payload"""
+    body = dumps(payload)
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    return body, etag
+
+
+class CatalogSnapshot:
+    """Immutable view of the products table; JSON bodies are serialized on first use"""
+
+    def __init__(
+        self,
+        rows: List[Dict[str, Any]],
+        load_id: int = 0,
+        loaded_at: Optional[float] = None,
+        version: int = 0,
+        change_id: int = 0
+    ):
+        self.load_id = load_id
+        self.version = version
+        # Last product_changes version reflected in this snapshot
+        self.change_id = change_id
+        # Newer per-product versions of stock levels applied by with_stock()
+        self.stock_change_ids: Dict[int, int] = {}
+        self.loaded_at = loaded_at if loaded_at is not None else time.time()
+        self.products = [{field: row.get(field) for field in PRODUCT_FIELDS} for row in rows]
+        self.by_id: Dict[int, Dict[str, Any]] = {p["id"]: p for p in self.products}
+        self.by_category: Dict[str, List[Dict[str, Any]]] = {}
+        for product in self.products:
+            self.by_category.setdefault(product["category"], []).append(product)
+        for products in self.by_category.values():
+            products.sort(key=lambda p: p["name"])
+
+        self._all: Optional[Tuple[bytes, str]] = None
+        self._categories: Dict[str, Tuple[bytes, str]] = {}
+        self._items: Dict[int, Tuple[bytes, str]] = {}
+
+    def list_body(self, category: Optional[str] = None) -> Tuple[bytes, str]:
+        """Serialized product list (optionally for one category) and its ETag"""
+        if category is None:
+            if self._all is None:
+                self._all = serialize(self.products)
+            return self._all
+        cached = self._categories.get(category)
+        if cached is None:
+            cached = serialize(self.by_category.get(category, []))
+            if category in self.by_category:
+                self._categories[category] = cached
+        return cached
+
+    def item_body(self, product_id: int) -> Optional[Tuple[bytes, str]]:
+        """Serialized product and its ETag, or None if unknown"""
+        cached = self._items.get(product_id)
+        if cached is None:
+            product = self.by_id.get(product_id)
+            if product is None:
+                return None
+            cached = self._items[product_id] = serialize(product)
+        return cached
+
+    def stock_change_id(self, product_id: int) -> int:
+        """product_changes version the product's stock level is known at"""
+        return max(self.change_id, self.stock_change_ids.get(product_id, 0))
+
+    def with_stock(self, levels: Dict[int, int], change_id: int) -> "CatalogSnapshot":
+        """Copy of this snapshot with stock levels committed at product_changes version `change_id`.
+
+        Levels older than what the snapshot already holds for a product are ignored, so
+        concurrent orders can apply theirs in any order. Serialized bodies of products and
+        categories whose stock did not change are carried over.
+        """
+        levels = {
+            pid: stock for pid, stock in levels.items()
+            if pid in self.by_id and change_id > self.stock_change_id(pid)
+        }
+        changed = {pid for pid, stock in levels.items() if self.by_id[pid]["stock"] != stock}
+        rows = [
+            dict(product, stock=levels[product["id"]]) if product["id"] in changed else product
+            for product in self.products
+        ]
+        snapshot = CatalogSnapshot(
+            rows, load_id=self.load_id, loaded_at=self.loaded_at,
+            version=self.version, change_id=self.change_id
+        )
+        snapshot.stock_change_ids = dict(self.stock_change_ids)
+        snapshot.stock_change_ids.update((pid, change_id) for pid in levels)
+        touched = {self.by_id[pid]["category"] for pid in changed}
+        snapshot._items = {pid: body for pid, body in self._items.items() if pid not in changed}
+        snapshot._categories = {
+            category: body for category, body in self._categories.items() if category not in touched
+        }
+        if not changed:
+            snapshot._all = self._all
+        return snapshot
+
+    def patched(
+        self,
+        rows: List[Dict[str, Any]],
+        changed_ids: set,
+        load_id: int,
+        version: int,
+        change_id: int
+    ) -> "CatalogSnapshot":
+        """Copy with the changed products replaced by `rows`; changed ids missing from rows were deleted.
+
+        Serialized bodies of products and categories that did not change are carried over.
+        """
+        products = [product for product in self.products if product["id"] not in changed_ids] + rows
+        products.sort(key=lambda p: (p["category"], p["name"], p["id"]))
+        snapshot = CatalogSnapshot(products, load_id=load_id, version=version, change_id=change_id)
+
+        touched = {product["category"] for product in rows}
+        touched.update(self.by_id[pid]["category"] for pid in changed_ids if pid in self.by_id)
+        snapshot.stock_change_ids = {
+            pid: stock_change_id for pid, stock_change_id in self.stock_change_ids.items()
+            if pid not in changed_ids and stock_change_id > change_id
+        }
+        snapshot._items = {pid: body for pid, body in self._items.items() if pid not in changed_ids}
+        snapshot._categories = {
+            category: body for category, body in self._categories.items() if category not in touched
+        }
+        return snapshot
+
+
+def change_head(conn) -> int:
+    """Latest catalog version in the product_changes log"""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'product_changes'").fetchone()
+    return row[0] if row else 0
+
+
+def prune_changes(retain: int = CATALOG_CHANGES_RETAIN, batch_size: int = CATALOG_PRUNE_BATCH) -> int:
+    """Trim the change log to its newest `retain` entries in bounded batches; returns rows deleted"""
+    with get_db() as conn:
+        cutoff = change_head(conn) - retain
+    total = 0
+    while cutoff > 0:
+        with get_db() as conn:
+            deleted = conn.execute(
+                """DELETE FROM product_changes WHERE version IN (
+                       SELECT version FROM product_changes WHERE version <= ? LIMIT ?
+                   )""",
+                (cutoff, batch_size)
+            ).rowcount
+        total += deleted
+        if deleted < batch_size:
+            break
+    return total
+
+
+class Catalog:
+    """Lazily (re)loaded catalog snapshot shared by all requests.
+
+    A stale snapshot is patched from the product_changes log when few
+    products changed, and reloaded in full otherwise. With a shared state backend, writers bump a catalog version there and
+    other workers reload once they notice (checked at most every
+    CATALOG_VERSION_CHECK_INTERVAL seconds, on a background thread so
+    current() never waits on the backend).
+    """
+
+    def __init__(
+        self,
+        ttl: float = CATALOG_TTL,
+        backend: Optional[StateBackend] = None,
+        check_interval: float = CATALOG_VERSION_CHECK_INTERVAL
+    ):
+        self.ttl = ttl
+        self.backend = backend
+        self.check_interval = check_interval
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._snapshot_generation = 0
+        self._peer_version = 0
+        self._peer_checked_at = 0.0
+        self._peer_checking = False
+        self.loads = 0
+        self.refreshes = 0
+
+    def _shared_version(self, refresh: bool = False) -> int:
+        """Catalog version published by all workers (0 without a shared backend).
+
+        Only refresh=True waits for the backend; otherwise the last known version
+        is returned and, once it is older than check_interval, re-read in the background.
+        """
+        if self.backend is None:
+            return 0
+        if refresh:
+            self._fetch_shared_version()
+        elif not self._peer_checking and time.time() - self._peer_checked_at >= self.check_interval:
+            self._peer_checking = True
+            threading.Thread(target=self._fetch_shared_version, name="catalog-version", daemon=True).start()
+        return self._peer_version
+
+    def _fetch_shared_version(self):
+        # Attempts count as checks, so an unreachable backend is retried once per interval
+        self._peer_checked_at = time.time()
+        try:
+            self._peer_version = int(self.backend.get(CATALOG_VERSION_KEY) or 0)
+        except StateBackendError:
+            # Fall back to TTL-based refresh while the backend is unreachable
+            pass
+        finally:
+            self._peer_checking = False
+
+    def _bump_shared_version(self) -> Optional[int]:
+        if self.backend is None:
+            return None
+        try:
+            self._peer_version = self.backend.incr(CATALOG_VERSION_KEY)
+            self._peer_checked_at = time.time()
+            return self._peer_version
+        except StateBackendError:
+            return None
+
+    def current(self) -> Optional[CatalogSnapshot]:
+        """Return the snapshot if it is loaded and fresh, without touching the database or waiting on the backend"""
+        snapshot = self._snapshot
+        if snapshot is not None and self._snapshot_generation == self._generation \
+                and time.time() - snapshot.loaded_at < self.ttl \
+                and snapshot.version == self._shared_version():
+            return snapshot
+        return None
+
+    def _load(self, previous: Optional[CatalogSnapshot], version: int) -> CatalogSnapshot:
+        """Bring `previous` up to date from the change log, or load a new snapshot"""
+        with get_db() as conn:
+            # One read transaction, so the rows and the change log agree
+            conn.execute("BEGIN")
+            head = change_head(conn)
+            if previous is not None:
+                if head == previous.change_id:
+                    previous.loaded_at = time.time()
+                    previous.version = version
+                    return previous
+                oldest = conn.execute("SELECT min(version) FROM product_changes").fetchone()[0]
+                if oldest is not None and oldest <= previous.change_id + 1:
+                    changed_ids = {
+                        row[0] for row in conn.execute(
+                            "SELECT DISTINCT product_id FROM product_changes WHERE version > ?",
+                            (previous.change_id,)
+                        )
+                    }
+                    # Past a quarter of the catalog a full reload is cheaper than patching
+                    if len(changed_ids) <= max(len(previous.products) // 4, 1):
+                        rows = [
+                            dict(row) for row in conn.execute(
+                                """SELECT * FROM products WHERE id IN (
+                                       SELECT product_id FROM product_changes WHERE version > ?
+                                   )""",
+                                (previous.change_id,)
+                            )
+                        ]
+                        self.refreshes += 1
+                        return previous.patched(
+                            [{field: row.get(field) for field in PRODUCT_FIELDS} for row in rows],
+                            changed_ids, load_id=self.loads + self.refreshes, version=version, change_id=head
+                        )
+            rows = [dict(row) for row in conn.execute("SELECT * FROM products ORDER BY category, name")]
+        self.loads += 1
+        return CatalogSnapshot(rows, load_id=self.loads + self.refreshes, version=version, change_id=head)
+
+    def snapshot(self) -> CatalogSnapshot:
+        """Return the current snapshot, loading it if missing or stale"""
+        snapshot = self.current()
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or self._snapshot_generation != self._generation \
+                    or time.time() - snapshot.loaded_at >= self.ttl \
+                    or snapshot.version != self._shared_version():
+                generation = self._generation
+                version = self._shared_version(refresh=True)
+                snapshot = self._load(snapshot, version)
+                self._snapshot = snapshot
+                # A write that raced with the load leaves the snapshot marked stale
+                self._snapshot_generation = generation
+            return snapshot
+
+    def update_stock(self, levels: Dict[int, int], change_id: int):
+        """Apply stock levels (product_id -> stock) committed at product_changes version `change_id`"""
+        if not levels:
+            return
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None:
+                snapshot = snapshot.with_stock(levels, change_id)
+                version = self._bump_shared_version()
+                # Keep the patched copy only if no other worker changed the catalog meanwhile
+                if version is not None and version == snapshot.version + 1:
+                    snapshot.version = version
+                self._snapshot = snapshot
+            else:
+                self._bump_shared_version()
+
+    def invalidate(self):
+        """Mark the snapshot stale; the next read (on any worker) applies the logged changes"""
+        self._generation += 1
+        self._bump_shared_version()
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "loads": self.loads,
+            "refreshes": self.refreshes,
+            "products": len(snapshot.products) if snapshot is not None else 0,
+            "change_id": snapshot.change_id if snapshot is not None else 0,
+        }
+
+
+# ============================================================================
+# SEARCH
+# ============================================================================
+
+def encode_cursor(product: Dict[str, Any]) -> str:
+    """Opaque keyset cursor for the (category, name, id) ordering"""
+    key = json.dumps([product["category"], product["name"], product["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str, int]:
+    """Inverse of encode_cursor; raises ValueError on malformed input"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        category, name, product_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(category), str(name), int(product_id)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into a safe FTS5 query of quoted prefix terms"""
+    terms = ['"' + term.replace('"', '""') + '"*' for term in text.split()]
+    return " ".join(terms)
+
+
+def search_products(
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    in_stock: Optional[bool] = None,
+    limit: int = 50,
+    after: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Filtered, keyset-paginated product search ordered by (category, name, id).
+
+    Returns (products, next cursor); the cursor is None on the last page.
+    """
+    conditions = []
+    params: list = []
+    if q and q.strip():
+        conditions.append("p.id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)")
+        params.append(fts_query(q))
+    if category:
+        conditions.append("p.category = ?")
+        params.append(category)
+    if min_price is not None:
+        conditions.append("p.base_price >= ?")
+        params.append(min_price)
+    if max_price is not None:
+        conditions.append("p.base_price <= ?")
+        params.append(max_price)
+    if in_stock:
+        conditions.append("p.stock > 0")
+    if after:
+        conditions.append("(p.category, p.name, p.id) > (?, ?, ?)")
+        params.extend(decode_cursor(after))
+
+    query = "SELECT p.* FROM products p"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY p.category, p.name, p.id LIMIT ?"
+    params.append(limit + 1)
+
+    rows = execute_query(query, tuple(params))
+    products = [{field: row.get(field) for field in PRODUCT_FIELDS} for row in rows]
+
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = encode_cursor(products[-1])
+    return products, next_cursor
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header value against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+def cached_json_response(body: bytes, etag: str, if_none_match: Optional[str]) -> Response:
+    """Serve a pre-serialized body with its ETag, or 304 if the client already has it"""
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+catalog = Catalog(backend=state if state.shared else None)
@@ -2,11 +2,34 @@
 Database connection and helper functions for WORLD DISTRIBUTION
 """
 import sqlite3
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, TypeVar
 import os
+import migrations
 
-DATABASE_PATH = os.path.join(os.path.dirname(__file__), "world_distribution.db")
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+DATABASE_PATH = os.getenv(
+    "DATABASE_PATH", os.path.join(os.path.dirname(__file__), "world_distribution.db")
+)
+
+# Connection pool tuning (override via environment)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16000"))
+MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+# Queries slower than this are logged (milliseconds)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
 
 
 def init_database():
@@ -18,24 +41,281 @@ def init_database():
     
     conn = sqlite3.connect(DATABASE_PATH)
     conn.executescript(schema)
+    # schema.sql is already the latest schema
+    migrations.stamp(conn)
     conn.commit()
     conn.close()
     print(f"✅ Database initialized at {DATABASE_PATH}")
 
 
-@contextmanager
-def get_db():
-    """Context manager for database connections"""
+def ensure_schema():
+    """Apply idempotent schema objects (new tables/indexes) to an existing database"""
+    schema_path = os.path.join(os.path.dirname(__file__), "schema.sql")
+
+    with open(schema_path, 'r') as f:
+        schema = f.read()
+
     conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        conn.executescript(schema)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# ============================================================================
+# INSTRUMENTATION
+# ============================================================================
+
+class QueryStats:
+    """SQL activity counters; one process-wide instance plus one per request"""
+
+    __slots__ = ("queries", "connection_opens", "checkouts", "sql_seconds", "slow_queries")
+
+    def __init__(self):
+        self.queries = 0
+        self.connection_opens = 0
+        self.checkouts = 0
+        self.sql_seconds = 0.0
+        self.slow_queries = 0
+
+
+db_stats = QueryStats()
+_db_stats_lock = threading.Lock()
+
+# Set by the metrics middleware; propagated to DB threads by run_in_db
+request_db_stats: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar(
+    "request_db_stats", default=None
+)
+
+
+def get_db_stats() -> Dict[str, float]:
+    """Process-wide SQL counters"""
+    with _db_stats_lock:
+        return {
+            "queries": db_stats.queries,
+            "connection_opens": db_stats.connection_opens,
+            "checkouts": db_stats.checkouts,
+            "sql_seconds": db_stats.sql_seconds,
+            "slow_queries": db_stats.slow_queries,
+        }
+
+
+def _record_query(sql: str, elapsed: float):
+    slow = elapsed * 1000 >= SLOW_QUERY_MS
+    with _db_stats_lock:
+        db_stats.queries += 1
+        db_stats.sql_seconds += elapsed
+        if slow:
+            db_stats.slow_queries += 1
+        stats = request_db_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_seconds += elapsed
+            if slow:
+                stats.slow_queries += 1
+    if slow:
+        logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, " ".join(sql.split())[:500])
+
+
+def _record_connection_open():
+    with _db_stats_lock:
+        db_stats.connection_opens += 1
+        stats = request_db_stats.get()
+        if stats is not None:
+            stats.connection_opens += 1
+
+
+def _record_checkout():
+    with _db_stats_lock:
+        db_stats.checkouts += 1
+        stats = request_db_stats.get()
+        if stats is not None:
+            stats.checkouts += 1
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times every statement"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_query(sql, time.perf_counter() - started)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose shortcut execute methods go through InstrumentedCursor"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def open_connection() -> sqlite3.Connection:
+    """Open a new tuned SQLite connection (PRAGMAs are applied once per connection)"""
+    conn = sqlite3.connect(
+        DATABASE_PATH, timeout=POOL_TIMEOUT, check_same_thread=False,
+        factory=InstrumentedConnection
+    )
+    _record_connection_open()
     conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of persistent SQLite connections"""
+
+    def __init__(self, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._checkouts = 0
+        self._waits = 0
+
+    def acquire(self) -> sqlite3.Connection:
+        """Check out a connection, opening a new one while under the size limit"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._open < self.size:
+                    self._open += 1
+                    create = True
+                else:
+                    self._waits += 1
+                    create = False
+            if create:
+                try:
+                    conn = open_connection()
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise RuntimeError("Timed out waiting for a database connection")
+        with self._lock:
+            self._checkouts += 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection to the pool"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def discard(self, conn: sqlite3.Connection):
+        """Close a broken connection instead of returning it to the pool"""
+        try:
+            conn.close()
+        finally:
+            with self._lock:
+                self._open -= 1
+
+    def close_all(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(conn)
+
+    def stats(self) -> Dict[str, int]:
+        """Pool counters: checkouts, waits and open connections"""
+        with self._lock:
+            return {
+                "size": self.size,
+                "open_connections": self._open,
+                "idle_connections": self._idle.qsize(),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def close_pool():
+    """Close all pooled connections (e.g. on shutdown or after DATABASE_PATH changes)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
+
+
+def get_pool_stats() -> Dict[str, int]:
+    """Expose connection pool statistics"""
+    return get_pool().stats()
+
+
+@contextmanager
+def get_db():
+    """Context manager for pooled database connections"""
+    pool = get_pool()
+    conn = pool.acquire()
+    _record_checkout()
     try:
         yield conn
         conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
+    except Exception:
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            # Connection is unusable; drop it so the pool can open a fresh one
+            pool.discard(conn)
+            conn = None
+        raise
     finally:
-        conn.close()
+        if conn is not None:
+            pool.release(conn)
+
+
+@contextmanager
+def transaction():
+    """Unit of work: a single connection and a single write transaction.
+
+    BEGIN IMMEDIATE takes the write lock up front, so everything inside either
+    commits together or rolls back together.
+    """
+    with get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
 
 
 def execute_query(query: str, params: tuple = ()) -> List[Dict[str, Any]]:
@@ -72,6 +352,84 @@ def execute_update(query: str, params: tuple = ()) -> int:
         return cursor.rowcount
 
 
-# Initialize database on module import if it doesn't exist
+# ============================================================================
+# ASYNC API
+# ============================================================================
+# Blocking sqlite3 work runs on a dedicated executor sized to the connection
+# pool, so every DB thread can hold a pooled connection without waiting and
+# the event loop keeps serving other requests meanwhile.
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Return the executor that runs blocking database calls"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="db")
+    return _executor
+
+
+def shutdown_db_executor():
+    """Stop the database executor threads"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+async def run_in_db(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking database function on the DB executor and await its result"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_db_executor(), call)
+
+
+async def execute_query_async(query: str, params: tuple = ()) -> List[Dict[str, Any]]:
+    """Async counterpart of execute_query"""
+    return await run_in_db(execute_query, query, params)
+
+
+async def execute_one_async(query: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
+    """Async counterpart of execute_one"""
+    return await run_in_db(execute_one, query, params)
+
+
+async def execute_insert_async(query: str, params: tuple = ()) -> int:
+    """Async counterpart of execute_insert"""
+    return await run_in_db(execute_insert, query, params)
+
+
+async def execute_update_async(query: str, params: tuple = ()) -> int:
+    """Async counterpart of execute_update"""
+    return await run_in_db(execute_update, query, params)
+
+
+def pending_migrations() -> List[int]:
+    """Versions of migrations not yet applied to DATABASE_PATH"""
+    conn = migrations.connect(DATABASE_PATH)
+    try:
+        return [version for version, _, _ in migrations.pending_migrations(conn)]
+    finally:
+        conn.close()
+
+
+def migrate_database(backup: bool = True, target: Optional[int] = None) -> List[int]:
+    """Apply pending migrations, then recreate schema objects they dropped; returns versions applied.
+
+    Run once per deployment (serve.py, migrate_db.py or the startup leader), never per import.
+    """
+    applied = migrations.migrate(DATABASE_PATH, backup=backup, target=target)
+    if target is None:
+        ensure_schema()
+    return applied
+
+
+# Create the database on module import if it doesn't exist; existing ones are migrated by migrate_database()
 if not os.path.exists(DATABASE_PATH):
     init_database()
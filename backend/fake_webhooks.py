@@ -0,0 +1,121 @@
+"""
+Local fake Stripe event generator for WORLD DISTRIBUTION
+
+Builds realistic, correctly signed webhook events and posts them to the API,
+so the webhook pipeline can be exercised and load-tested without Stripe.
+
+    python fake_webhooks.py --payment-intent pi_123 --type payment_intent.succeeded
+    python fake_webhooks.py --count 5000 --concurrency 32 --duplicates 0.1
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import secrets
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Tuple
+from dotenv import load_dotenv
+
+from webhooks import EVENT_STATUS
+
+
+def make_event(event_type: str, payment_intent_id: str, amount: int = 1000) -> Dict[str, Any]:
+    """Build a minimal Stripe event for a PaymentIntent"""
+    if event_type.startswith('charge.'):
+        obj = {
+            "id": "ch_" + secrets.token_hex(12),
+            "object": "charge",
+            "payment_intent": payment_intent_id,
+            "amount": amount,
+            "amount_refunded": amount,
+        }
+    else:
+        obj = {
+            "id": payment_intent_id,
+            "object": "payment_intent",
+            "amount": amount,
+            "currency": "eur",
+            "status": event_type.split('.', 1)[1],
+        }
+    return {
+        "id": "evt_" + secrets.token_hex(12),
+        "object": "event",
+        "type": event_type,
+        "created": int(time.time()),
+        "livemode": False,
+        "data": {"object": obj},
+    }
+
+
+def sign_payload(payload: bytes, secret: str, timestamp: Optional[int] = None) -> str:
+    """Produce a Stripe-Signature header for a payload"""
+    timestamp = timestamp or int(time.time())
+    signed = f"{timestamp}.".encode('utf-8') + payload
+    signature = hmac.new(secret.encode('utf-8'), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def encode_event(event: Dict[str, Any], secret: str) -> Tuple[bytes, str]:
+    """Return (payload, Stripe-Signature header) for an event"""
+    payload = json.dumps(event).encode('utf-8')
+    return payload, sign_payload(payload, secret)
+
+
+def post_event(url: str, payload: bytes, signature: str) -> int:
+    """POST one event and return the HTTP status"""
+    request = urllib.request.Request(
+        url, data=payload, method="POST",
+        headers={"Content-Type": "application/json", "Stripe-Signature": signature}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Send fake signed Stripe webhook events")
+    parser.add_argument("--url", default="http://localhost:8000/api/webhook")
+    parser.add_argument("--secret", default=os.getenv("STRIPE_WEBHOOK_SECRET"))
+    parser.add_argument("--type", choices=sorted(EVENT_STATUS), default=None,
+                        help="event type (random when omitted)")
+    parser.add_argument("--payment-intent", default=None,
+                        help="PaymentIntent id (random per event when omitted)")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duplicates", type=float, default=0.0,
+                        help="fraction of events re-sent to exercise deduplication")
+    args = parser.parse_args()
+
+    if not args.secret:
+        parser.error("a webhook secret is required (--secret or STRIPE_WEBHOOK_SECRET)")
+
+    requests = []
+    for _ in range(args.count):
+        event_type = args.type or random.choice(sorted(EVENT_STATUS))
+        payment_intent = args.payment_intent or "pi_" + secrets.token_hex(12)
+        requests.append(encode_event(make_event(event_type, payment_intent), args.secret))
+        if random.random() < args.duplicates:
+            requests.append(requests[-1])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        statuses = list(pool.map(lambda r: post_event(args.url, *r), requests))
+    elapsed = time.perf_counter() - started
+
+    counts: Dict[int, int] = {}
+    for status in statuses:
+        counts[status] = counts.get(status, 0) + 1
+    print(f"✅ Sent {len(requests)} events in {elapsed:.2f}s ({len(requests) / elapsed:.0f}/s)")
+    print(f"   Responses: {counts}")
+
+
+if __name__ == "__main__":
+    main()
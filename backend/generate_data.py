@@ -0,0 +1,227 @@
+"""
+High-volume synthetic data generator for WORLD DISTRIBUTION
+
+Streams deterministic users, products, orders and order_items into SQLite
+with batched executemany calls inside large transactions, then rebuilds the
+sales rollups (analytics.backfill) so dashboards see the generated orders. Password hashes
+are computed once and reused, so building a benchmark-sized database takes
+seconds instead of hours.
+
+    python generate_data.py --db /tmp/big.db --users 100000 --products 20000 --orders 1000000
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import time
+from typing import Optional, Iterable, Iterator, Dict, Any, List, Tuple
+
+DEFAULT_PASSWORD = "password123"
+VOLUME_TIERS = (('100kg', 1.0, 100, 499), ('500kg', 0.85, 500, 999), ('1000kg+', 0.70, 1000, 5000))
+ORDER_STATUSES = ('pending', 'paid', 'paid', 'paid', 'processing', 'failed', 'cancelled')
+
+INSERT_ORDER = """INSERT INTO orders (id, user_id, total_amount, vat_amount, status, payment_method, payment_intent_id)
+                  VALUES (?, ?, ?, ?, ?, ?, ?)"""
+INSERT_ORDER_ITEM = """INSERT INTO order_items (order_id, product_id, quantity, price_per_unit, volume_tier, category)
+                       VALUES (?, ?, ?, ?, ?, ?)"""
+
+
+def batched(rows: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    iterator = iter(rows)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_insert(
+    conn: sqlite3.Connection,
+    sql: str,
+    rows: Iterable[tuple],
+    batch_size: int,
+    rows_per_transaction: int
+) -> int:
+    """executemany in batches, committing every `rows_per_transaction` rows"""
+    total = 0
+    pending = 0
+    conn.execute("BEGIN")
+    for batch in batched(rows, batch_size):
+        conn.executemany(sql, batch)
+        total += len(batch)
+        pending += len(batch)
+        if pending >= rows_per_transaction:
+            conn.execute("COMMIT")
+            conn.execute("BEGIN")
+            pending = 0
+    conn.execute("COMMIT")
+    return total
+
+
+def next_id(conn: sqlite3.Connection, table: str) -> int:
+    return (conn.execute(f"SELECT coalesce(max(id), 0) FROM {table}").fetchone()[0]) + 1
+
+
+def generate(
+    db_path: str,
+    users: int = 1000,
+    products: int = 1000,
+    orders: int = 10000,
+    items_per_order: int = 5,
+    seed: int = 42,
+    batch_size: int = 5000,
+    rows_per_transaction: int = 500000,
+    password: str = DEFAULT_PASSWORD,
+    stock: Optional[int] = None,
+    verbose: bool = True
+) -> Dict[str, Any]:
+    """Append synthetic rows to the database at db_path; returns per-table timings"""
+    # Imported lazily so callers can point DATABASE_PATH at db_path first
+    import analytics
+    from auth import hash_password
+    from passwords import BCRYPT_ROUNDS
+    from seed_data import PRODUCTS, USERS
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-200000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+    report: Dict[str, Any] = {}
+
+    def record(table: str, count: int, elapsed: float):
+        report[table] = {
+            "rows": count,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(count / elapsed) if elapsed else count,
+        }
+        if verbose:
+            print(f"✅ {table:<12} {count:>10,} rows in {elapsed:7.2f}s ({report[table]['rows_per_second']:,} rows/s)")
+
+    def timed(table: str, sql: str, rows: Iterable[tuple]):
+        started = time.perf_counter()
+        count = bulk_insert(conn, sql, rows, batch_size, rows_per_transaction)
+        record(table, count, time.perf_counter() - started)
+
+    # One bcrypt hash shared by every generated user
+    password_hash = hash_password(password, BCRYPT_ROUNDS)
+
+    first_user = next_id(conn, "users")
+    timed("users", """INSERT INTO users (id, email, password_hash, company_name, country, region)
+                      VALUES (?, ?, ?, ?, ?, ?)""", (
+        (
+            user_id, f"user{user_id}@example.com", password_hash,
+            f"{template['company_name']} {user_id}", template['country'], template['region']
+        )
+        for user_id in range(first_user, first_user + users)
+        for template in [USERS[user_id % len(USERS)]]
+    ))
+
+    first_product = next_id(conn, "products")
+    prices: List[float] = []
+    categories: List[str] = []
+
+    def product_rows() -> Iterator[tuple]:
+        for product_id in range(first_product, first_product + products):
+            template = PRODUCTS[product_id % len(PRODUCTS)]
+            price = round(template['base_price'] * rng.uniform(0.5, 2.0), 2)
+            prices.append(price)
+            categories.append(template['category'])
+            yield (
+                product_id, f"{template['name']} {product_id}", template['category'], price,
+                template['unit'], stock if stock is not None else rng.randint(1000, 100000),
+                template['description'], template['image_url']
+            )
+
+    timed("products", """INSERT INTO products (id, name, category, base_price, unit, stock, description, image_url)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", product_rows())
+
+    first_order = next_id(conn, "orders")
+
+    def order_batch(order_ids: range) -> Tuple[List[tuple], List[tuple]]:
+        orders_batch, items_batch = [], []
+        for order_id in order_ids:
+            total = 0.0
+            for _ in range(rng.randint(1, max(1, items_per_order * 2 - 1))):
+                index = rng.randrange(products)
+                tier, multiplier, low, high = rng.choice(VOLUME_TIERS)
+                quantity, price = rng.randint(low, high), prices[index] * multiplier
+                items_batch.append((order_id, first_product + index, quantity, price, tier, categories[index]))
+                total += quantity * price
+            orders_batch.append((
+                order_id, rng.randrange(first_user, first_user + users), total, total * 0.19,
+                rng.choice(ORDER_STATUSES), rng.choice(('card', 'bank')), None
+            ))
+        return orders_batch, items_batch
+
+    if users and products:
+        # Each batch of orders is inserted together with its items and then
+        # dropped, so memory stays flat however many orders are generated
+        seconds = {"orders": 0.0, "order_items": 0.0}
+        counts = {"orders": 0, "order_items": 0}
+        pending = 0
+        conn.execute("BEGIN")
+        for batch_start in range(first_order, first_order + orders, batch_size):
+            batch = order_batch(range(batch_start, min(batch_start + batch_size, first_order + orders)))
+            for table, sql, rows in zip(("orders", "order_items"), (INSERT_ORDER, INSERT_ORDER_ITEM), batch):
+                started = time.perf_counter()
+                conn.executemany(sql, rows)
+                seconds[table] += time.perf_counter() - started
+                counts[table] += len(rows)
+                pending += len(rows)
+            if pending >= rows_per_transaction:
+                conn.execute("COMMIT")
+                conn.execute("BEGIN")
+                pending = 0
+        conn.execute("COMMIT")
+        for table in ("orders", "order_items"):
+            record(table, counts[table], seconds[table])
+
+        # Dashboards read only the sales_daily_* rollups
+        started = time.perf_counter()
+        rolled_up = analytics.backfill(db_path, conn=conn)
+        if verbose:
+            print(f"✅ {'rollups':<12} {rolled_up:>10,} orders in {time.perf_counter() - started:7.2f}s")
+
+    conn.execute("PRAGMA optimize")
+    conn.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic WORLD DISTRIBUTION data")
+    parser.add_argument("--db", default=None, help="database path (defaults to DATABASE_PATH)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--items-per-order", type=int, default=5, help="average line items per order")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--rows-per-transaction", type=int, default=500000)
+    parser.add_argument("--password", default=DEFAULT_PASSWORD, help="password for every generated user")
+    parser.add_argument("--stock", type=int, default=None, help="fixed stock per product (random when omitted)")
+    args = parser.parse_args()
+
+    if args.db:
+        os.environ["DATABASE_PATH"] = args.db
+    # Importing database creates the schema if the file doesn't exist yet
+    import database
+
+    print(f"🏭 Generating into {database.DATABASE_PATH}")
+    started = time.perf_counter()
+    report = generate(
+        database.DATABASE_PATH, users=args.users, products=args.products, orders=args.orders,
+        items_per_order=args.items_per_order, seed=args.seed, batch_size=args.batch_size,
+        rows_per_transaction=args.rows_per_transaction, password=args.password, stock=args.stock
+    )
+    elapsed = time.perf_counter() - started
+    total = sum(table["rows"] for table in report.values())
+    print(f"\n✅ {total:,} rows in {elapsed:.2f}s ({total / elapsed:,.0f} rows/s)")
+    print(f"   Login as user<id>@example.com with password '{args.password}'")
+
+
+if __name__ == "__main__":
+    main()
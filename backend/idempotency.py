@@ -0,0 +1,122 @@
+"""
+Idempotency keys for WORLD DISTRIBUTION
+
+Clients may send an ``Idempotency-Key`` header with order and payment
+requests. The first successful response is stored under (scope, key) for
+IDEMPOTENCY_TTL seconds; a retry with the same key and body gets the stored
+response back without touching orders or the payment provider. Order
+responses are stored in the same transaction as the order, so a duplicate
+that races the original rolls back and replays it instead. Failed requests
+are not stored and may be retried with the same key.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Optional, Any, NamedTuple
+from fastapi import Response
+from database import get_db, execute_one
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 60 * 60)))
+IDEMPOTENCY_REAP_BATCH = 1000
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a different request body"""
+
+
+class IdempotencyConflict(Exception):
+    """Another request stored a response under the key first"""
+
+
+class IdempotentRequest(NamedTuple):
+    scope: str
+    key: str
+    fingerprint: str
+
+
+class StoredResponse(NamedTuple):
+    status_code: int
+    body: bytes
+
+
+def fingerprint(payload: Any) -> str:
+    """Stable hash of a JSON-compatible request body"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def idempotent_request(scope: str, key: Optional[str], payload: Any) -> Optional[IdempotentRequest]:
+    return IdempotentRequest(scope, key, fingerprint(payload)) if key else None
+
+
+def provider_key(request: IdempotentRequest) -> str:
+    """Key forwarded to the payment provider, namespaced by scope like the stored response"""
+    return hashlib.sha256(f"{request.scope}:{request.key}".encode("utf-8")).hexdigest()
+
+
+def lookup(request: IdempotentRequest) -> Optional[StoredResponse]:
+    """Stored response for an unexpired key, or None; raises IdempotencyKeyReused"""
+    row = execute_one(
+        """SELECT fingerprint, status_code, response FROM idempotency_keys
+           WHERE scope = ? AND key = ? AND expires_at > ?""",
+        (request.scope, request.key, datetime.now().isoformat())
+    )
+    if row is None:
+        return None
+    if row['fingerprint'] != request.fingerprint:
+        raise IdempotencyKeyReused("Idempotency-Key was already used with a different request")
+    return StoredResponse(row['status_code'], bytes(row['response']))
+
+
+def store(conn, request: IdempotentRequest, body: bytes, status_code: int = 200):
+    """Record a response on the caller's transaction; raises IdempotencyConflict if the key is taken"""
+    now = datetime.now()
+    stored = conn.execute(
+        """INSERT INTO idempotency_keys
+               (scope, key, fingerprint, status_code, response, created_at, expires_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?)
+           ON CONFLICT(scope, key) DO UPDATE SET
+               fingerprint = excluded.fingerprint, status_code = excluded.status_code,
+               response = excluded.response, created_at = excluded.created_at,
+               expires_at = excluded.expires_at
+           WHERE idempotency_keys.expires_at <= excluded.created_at""",
+        (request.scope, request.key, request.fingerprint, status_code, body,
+         now.isoformat(), (now + timedelta(seconds=IDEMPOTENCY_TTL)).isoformat())
+    ).rowcount
+    if not stored:
+        raise IdempotencyConflict(request.key)
+
+
+def store_response(request: IdempotentRequest, body: bytes, status_code: int = 200):
+    """store() in its own transaction, keeping the first response if the key is already taken"""
+    try:
+        with get_db() as conn:
+            store(conn, request, body, status_code)
+    except IdempotencyConflict:
+        pass
+
+
+def replay(stored: StoredResponse) -> Response:
+    return Response(
+        content=stored.body, status_code=stored.status_code,
+        media_type="application/json", headers={REPLAY_HEADER: "true"}
+    )
+
+
+def delete_expired_keys(batch_size: int = IDEMPOTENCY_REAP_BATCH) -> int:
+    """Delete expired keys in bounded batches; returns rows deleted"""
+    now = datetime.now().isoformat()
+    total = 0
+    while True:
+        with get_db() as conn:
+            deleted = conn.execute(
+                """DELETE FROM idempotency_keys WHERE rowid IN (
+                       SELECT rowid FROM idempotency_keys WHERE expires_at < ? LIMIT ?
+                   )""",
+                (now, batch_size)
+            ).rowcount
+        total += deleted
+        if deleted < batch_size:
+            return total
@@ -0,0 +1,71 @@
+"""
+Inventory reservations for WORLD DISTRIBUTION
+
+Stock is reserved with conditional UPDATEs (``stock = stock - ? WHERE stock >= ?``)
+on the caller's write transaction, so concurrent buyers of the same SKU can
+never oversell: SQLite serializes writers and a failed condition aborts the
+whole order. Every movement is appended to inventory_ledger, including stock
+set directly by admins and catalog imports (record_adjustments).
+"""
+from typing import List, Dict, Iterable, Tuple
+from models import OrderItem
+
+
+class InsufficientStock(Exception):
+    """Raised when one or more products can't cover the requested quantity"""
+
+    def __init__(self, product_ids: List[int]):
+        super().__init__(f"Insufficient stock for products: {product_ids}")
+        self.product_ids = product_ids
+
+
+def reserve_stock(conn, order_id: int, items: List[OrderItem]) -> Dict[int, int]:
+    """Reserve stock for all items of an order; returns product_id -> remaining stock.
+
+    Must run inside a write transaction (see database.transaction); on
+    InsufficientStock the caller's transaction rolls back every reservation.
+    """
+    quantities: Dict[int, int] = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+    levels: Dict[int, int] = {}
+    shortages = []
+    # Fixed product order keeps reservations deterministic across orders
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        row = conn.execute(
+            "UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ? RETURNING stock",
+            (quantity, product_id, quantity)
+        ).fetchone()
+        if row is None:
+            shortages.append(product_id)
+        else:
+            levels[product_id] = row[0]
+
+    if shortages:
+        raise InsufficientStock(shortages)
+
+    conn.executemany(
+        """INSERT INTO inventory_ledger (product_id, order_id, delta, stock_after, reason)
+           VALUES (?, ?, ?, ?, 'order')""",
+        [
+            (product_id, order_id, -quantities[product_id], stock_after)
+            for product_id, stock_after in levels.items()
+        ]
+    )
+    return levels
+
+
+def record_adjustments(conn, changes: Iterable[Tuple[int, int, int]], reason: str) -> int:
+    """Append a ledger row for each (product_id, stock_before, stock_after) whose stock changed"""
+    rows = [
+        (product_id, stock_after - stock_before, stock_after, reason)
+        for product_id, stock_before, stock_after in changes
+        if stock_after != stock_before
+    ]
+    if rows:
+        conn.executemany(
+            "INSERT INTO inventory_ledger (product_id, delta, stock_after, reason) VALUES (?, ?, ?, ?)", rows
+        )
+    return len(rows)
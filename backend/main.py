@@ -1,25 +1,95 @@
-from fastapi import FastAPI, HTTPException, Depends, Response, Cookie
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, Cookie, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager, suppress
 from typing import Optional, List
-import stripe
+import asyncio
+import io
 import os
+import tempfile
 from dotenv import load_dotenv
 
+# Load .env before importing modules that read their configuration at import time
+load_dotenv()
+
 # Import our modules
 from models import (
     UserRegister, UserLogin, UserResponse,
-    Product, OrderCreate, OrderResponse, OrderItem,
+    Product, ProductCreate, ProductImportReport, OrderCreate, BulkOrderCreate, OrderResponse,
+    QuoteRequest, QuoteResponse,
+    SalesSummary, ProductSales, CategorySales,
     PaymentIntentRequest, PaymentIntentResponse
 )
-from database import execute_query, execute_one, execute_insert
+from database import (
+    execute_one_async, execute_insert_async, execute_update_async,
+    run_in_db, shutdown_db_executor, close_pool, get_pool_stats, get_db_stats,
+    pending_migrations, migrate_database
+)
 from auth import (
-    hash_password, verify_password, create_session, get_user_from_session,
-    delete_session, set_session_cookie, clear_session_cookie, require_auth
+    create_session, authenticate, TokenRefreshMiddleware,
+    delete_session, set_session_cookie, clear_session_cookie, require_auth, require_admin
+)
+from passwords import password_service, PasswordServiceBusy
+from orders import (
+    fetch_user_orders, iter_user_orders, place_order, place_orders,
+    export_orders_csv, export_orders_ndjson
 )
+from catalog import catalog, cached_json_response, search_products, serialize
+from pricing import get_price_table, PricingError
+from inventory import InsufficientStock
+from payments import payment_client, PaymentProviderError, PaymentProviderUnavailable
+from webhooks import (
+    webhook_worker, get_webhook_secret, verify_event, enqueue_event, queue_depth,
+    WebhookVerificationError
+)
+import analytics
+import idempotency
+from idempotency import IdempotentRequest, IdempotencyKeyReused, IdempotencyConflict, idempotent_request
+import products
+import tokens
+import session_reaper
+from session_reaper import run_session_reaper, SESSION_REAPER_ENABLED
+from session_cache import session_cache
+from state_backend import state, run_as_leader
+from ratelimit import RateLimitMiddleware, rate_limiter
+from metrics import MetricsMiddleware, register_collector, render_metrics
+from responses import dumps, json_response, ndjson_response, wants_ndjson, NDJSON_MEDIA_TYPE
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Apply pending migrations, start background maintenance tasks and release resources on shutdown"""
+    # The admission semaphore binds to the loop that first uses it
+    rate_limiter.concurrency.reset()
+    # serve.py and migrate_db.py migrate before workers start; otherwise one worker does it here
+    if await run_in_db(pending_migrations):
+        await run_as_leader("migrations", lambda: run_in_db(migrate_database))
+
+    tasks = []
+    # With several workers only the leader runs each job (see state_backend.run_as_leader)
+    if SESSION_REAPER_ENABLED:
+        tasks.append(asyncio.create_task(run_as_leader("session_reaper", run_session_reaper)))
+    tasks.append(asyncio.create_task(run_as_leader("webhook_worker", webhook_worker.run)))
+    
+    yield
+    
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        with suppress(asyncio.CancelledError):
+            await task
+    await payment_client.aclose()
+    password_service.shutdown()
+    shutdown_db_executor()
+    close_pool()
+    state.close()
 
-load_dotenv()
 
-app = FastAPI(title="World Distribution API", version="2.0.0")
+app = FastAPI(title="World Distribution API", version="2.0.0", lifespan=lifespan)
+
+# Per-client token buckets and global admission control; added before CORS so that
+# 429/503 responses still carry CORS headers
+app.add_middleware(RateLimitMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -34,11 +104,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Server-Timing", "Retry-After", idempotency.REPLAY_HEADER],
 )
 
-# Configure Stripe
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+# Per-route latency, SQL counters and Server-Timing headers
+app.add_middleware(MetricsMiddleware)
 
+# Signed-token sessions: re-issue expired tokens before routes see them
+if tokens.token_mode():
+    app.add_middleware(TokenRefreshMiddleware)
 
 # ============================================================================
 # HEALTH & INFO ENDPOINTS
@@ -58,6 +132,30 @@ def health_check():
     return {"status": "healthy"}
 
 
+register_collector("db_pool", "SQLite connection pool", get_pool_stats)
+register_collector("db", "SQL activity", get_db_stats)
+register_collector("session_cache", "Session cache", session_cache.stats)
+register_collector("password_service", "Password hashing service", password_service.stats)
+register_collector("payment_client", "Payment provider client", payment_client.stats)
+register_collector("webhook_worker", "Webhook worker", webhook_worker.stats)
+register_collector("catalog", "Product catalog cache", catalog.stats)
+register_collector("state_backend", "Shared state backend", state.stats)
+register_collector("rate_limiter", "Rate limiting and admission control", rate_limiter.stats)
+register_collector(
+    "session_reaper", "Session reaper last run", lambda: session_reaper.last_report or {}
+)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics"""
+    webhook_queue = await run_in_db(queue_depth)
+    return PlainTextResponse(
+        render_metrics({"webhook_queue": webhook_queue}),
+        media_type="text/plain; version=0.0.4"
+    )
+
+
 # ============================================================================
 # AUTHENTICATION ENDPOINTS
 # ============================================================================
@@ -66,7 +164,7 @@ def health_check():
 async def register(user_data: UserRegister, response: Response):
     """Register a new user"""
     # Check if user already exists
-    existing_user = execute_one(
+    existing_user = await execute_one_async(
         "SELECT id FROM users WHERE email = ?",
         (user_data.email,)
     )
@@ -74,9 +172,12 @@ async def register(user_data: UserRegister, response: Response):
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    # Hash password and create user
-    password_hash = hash_password(user_data.password)
-    user_id = execute_insert(
+    # Hash password (off the event loop) and create user
+    try:
+        password_hash = await password_service.hash(user_data.password)
+    except PasswordServiceBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+    user_id = await execute_insert_async(
         """INSERT INTO users (email, password_hash, company_name, country, region, 
            street_address, city, postal_code, phone)
            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
@@ -86,8 +187,11 @@ async def register(user_data: UserRegister, response: Response):
     )
     
     # Create session
-    session_id = create_session(user_id)
-    set_session_cookie(response, session_id)
+    session_id = await run_in_db(create_session, user_id)
+    set_session_cookie(response, session_id, {
+        "id": user_id, "email": user_data.email, "company_name": user_data.company_name,
+        "country": user_data.country, "region": user_data.region
+    })
     
     return UserResponse(
         id=user_id,
@@ -106,17 +210,32 @@ async def register(user_data: UserRegister, response: Response):
 async def login(credentials: UserLogin, response: Response):
     """Login user and create session"""
     # Get user from database
-    user = execute_one(
+    user = await execute_one_async(
         "SELECT * FROM users WHERE email = ?",
         (credentials.email,)
     )
     
-    if not user or not verify_password(credentials.password, user['password_hash']):
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
+    try:
+        valid = await password_service.verify(credentials.password, user['password_hash'])
+        if not valid:
+            raise HTTPException(status_code=401, detail="Invalid email or password")
+        
+        # Transparently upgrade hashes made with an outdated work factor
+        if password_service.needs_rehash(user['password_hash']):
+            new_hash = await password_service.hash(credentials.password)
+            await execute_update_async(
+                "UPDATE users SET password_hash = ? WHERE id = ?",
+                (new_hash, user['id'])
+            )
+    except PasswordServiceBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+    
     # Create session
-    session_id = create_session(user['id'])
-    set_session_cookie(response, session_id)
+    session_id = await run_in_db(create_session, user['id'])
+    set_session_cookie(response, session_id, user)
     
     return UserResponse(
         id=user['id'],
@@ -134,8 +253,9 @@ async def login(credentials: UserLogin, response: Response):
 @app.post("/api/auth/logout")
 async def logout(response: Response, session_id: Optional[str] = Cookie(None)):
     """Logout user and clear session"""
+    session_id = tokens.session_id_of(session_id)
     if session_id:
-        delete_session(session_id)
+        await run_in_db(delete_session, session_id)
     clear_session_cookie(response)
     return {"message": "Logged out successfully"}
 
@@ -143,7 +263,7 @@ async def logout(response: Response, session_id: Optional[str] = Cookie(None)):
 @app.get("/api/auth/me", response_model=UserResponse)
 async def get_current_user(session_id: Optional[str] = Cookie(None)):
     """Get current user from session"""
-    user = get_user_from_session(session_id)
+    user = await authenticate(session_id)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -155,103 +275,326 @@ async def get_current_user(session_id: Optional[str] = Cookie(None)):
 # ============================================================================
 
 @app.get("/api/products", response_model=List[Product])
-async def get_products(category: Optional[str] = None):
-    """Get all products (public endpoint)"""
-    if category:
-        products = execute_query(
-            "SELECT * FROM products WHERE category = ? ORDER BY name",
-            (category,)
+async def get_products(
+    response: Response,
+    category: Optional[str] = None,
+    q: Optional[str] = Query(None, max_length=200),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    in_stock: Optional[bool] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    after: Optional[str] = None,
+    format: Optional[str] = Query(None, pattern="^(json|ndjson)$"),
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Get products (public endpoint).
+    Plain and category listings come from the cached catalog; full-text search (?q=),
+    price/stock filters and pagination (?limit=, ?after= from X-Next-Cursor) query the database.
+    ?format=ndjson (or Accept: application/x-ndjson) streams one product per line.
+    """
+    ndjson = wants_ndjson(format, accept)
+    if q is None and min_price is None and max_price is None and not in_stock \
+            and limit is None and after is None:
+        snapshot = catalog.current() or await run_in_db(catalog.snapshot)
+        if ndjson:
+            products = snapshot.products if category is None else snapshot.by_category.get(category, [])
+            return ndjson_response(products)
+        body, etag = snapshot.list_body(category)
+        return cached_json_response(body, etag, if_none_match)
+    
+    try:
+        products, next_cursor = await run_in_db(
+            search_products, q=q, category=category, min_price=min_price,
+            max_price=max_price, in_stock=in_stock, limit=limit or 50, after=after
         )
-    else:
-        products = execute_query("SELECT * FROM products ORDER BY category, name")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return [Product(**p) for p in products]
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor is not None else None
+    if ndjson:
+        return ndjson_response(products, headers=headers)
+    body, etag = serialize(products)
+    result = cached_json_response(body, etag, if_none_match)
+    if headers:
+        result.headers.update(headers)
+    return result
 
 
 @app.get("/api/products/{product_id}", response_model=Product)
-async def get_product(product_id: int):
-    """Get single product by ID (public endpoint)"""
-    product = execute_one("SELECT * FROM products WHERE id = ?", (product_id,))
+async def get_product(product_id: int, if_none_match: Optional[str] = Header(None)):
+    """Get single product by ID (public endpoint, served from the cached catalog)"""
+    snapshot = catalog.current() or await run_in_db(catalog.snapshot)
+    cached = snapshot.item_body(product_id)
     
-    if not product:
+    if not cached:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    return Product(**product)
+    body, etag = cached
+    return cached_json_response(body, etag, if_none_match)
+
+
+@app.post("/api/quote", response_model=QuoteResponse)
+async def create_quote(quote_request: QuoteRequest):
+    """Price a list of products and quantities at their best volume tier (public endpoint)"""
+    snapshot = catalog.current() or await run_in_db(catalog.snapshot)
+    try:
+        quote = get_price_table(snapshot).quote(
+            (item.product_id, item.quantity) for item in quote_request.items
+        )
+    except PricingError as e:
+        raise HTTPException(status_code=400, detail=e.errors)
+    
+    return quote
+
+
+# ============================================================================
+# PRODUCT ADMIN ENDPOINTS (ADMIN_EMAILS only)
+# ============================================================================
+
+# Uploaded feeds above this size are spooled to a temporary file
+IMPORT_SPOOL_SIZE = 8 * 1024 * 1024
+
+
+@app.post("/api/admin/products", response_model=Product)
+async def create_product(product: ProductCreate, admin: dict = Depends(require_admin)):
+    """Add a product to the catalog"""
+    try:
+        return await run_in_db(products.create_product, product)
+    except products.ProductConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.put("/api/admin/products/{product_id}", response_model=Product)
+async def update_product(product_id: int, product: ProductCreate, admin: dict = Depends(require_admin)):
+    """Replace a product's fields"""
+    try:
+        updated = await run_in_db(products.update_product, product_id, product)
+    except products.ProductConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return updated
+
+
+@app.delete("/api/admin/products/{product_id}")
+async def delete_product(product_id: int, admin: dict = Depends(require_admin)):
+    """Remove a product that has never been ordered"""
+    try:
+        deleted = await run_in_db(products.delete_product, product_id)
+    except products.ProductConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return {"message": "Product deleted"}
+
+
+@app.post("/api/admin/products/import", response_model=ProductImportReport)
+async def import_products(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    admin: dict = Depends(require_admin)
+):
+    """
+    Bulk upsert products from a CSV (with header) or NDJSON request body.
+    Rows are matched by id, else by sku, and applied in batched transactions;
+    invalid rows are skipped and reported.
+    """
+    feed_format = "ndjson" if wants_ndjson(format, request.headers.get("content-type")) else "csv"
+    spool = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    stream = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+    try:
+        return await run_in_db(products.import_products, stream, feed_format)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Feed must be UTF-8 encoded")
+    finally:
+        stream.close()
 
 
 # ============================================================================
 # ORDER ENDPOINTS (PROTECTED)
 # ============================================================================
 
+async def validate_order_prices(orders: List[OrderCreate]):
+    """Reject orders whose tiers or unit prices don't match the server price table and reprice the rest"""
+    snapshot = catalog.current() or await run_in_db(catalog.snapshot)
+    table = get_price_table(snapshot)
+    for index, order_data in enumerate(orders):
+        try:
+            table.validate(order_data.items)
+        except PricingError as e:
+            detail = e.errors if len(orders) == 1 else [f"orders[{index}].{error}" for error in e.errors]
+            raise HTTPException(status_code=400, detail=detail)
+
+
+async def stored_response(idempotent: Optional[IdempotentRequest]) -> Optional[Response]:
+    """Replay of the response stored for a retried Idempotency-Key, if any"""
+    if idempotent is None:
+        return None
+    try:
+        stored = await run_in_db(idempotency.lookup, idempotent)
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return idempotency.replay(stored) if stored else None
+
+
+async def replay_concurrent(idempotent: IdempotentRequest) -> Response:
+    """Response for a duplicate that lost the race to a concurrent request with the same key"""
+    replayed = await stored_response(idempotent)
+    if replayed is None:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is in progress")
+    return replayed
+
+
 @app.post("/api/orders", response_model=OrderResponse)
 async def create_order(
     order_data: OrderCreate,
-    user: dict = Depends(require_auth)
+    user: dict = Depends(require_auth),
+    idempotency_key: Optional[str] = Header(None, max_length=255)
 ):
-    """Create a new order (requires authentication)"""
-    # Calculate totals
-    total_amount = sum(
-        item.quantity * item.price_per_unit
-        for item in order_data.items
-    )
-    vat_amount = total_amount * 0.19
+    """
+    Create a new order (requires authentication).
+    Retries with the same Idempotency-Key header get the original response back.
+    """
+    idempotent = idempotent_request(f"orders:{user['id']}", idempotency_key, order_data.model_dump(mode="json"))
+    replayed = await stored_response(idempotent)
+    if replayed is not None:
+        return replayed
     
-    # Create order
-    order_id = execute_insert(
-        """INSERT INTO orders (user_id, total_amount, vat_amount, status, payment_method, payment_intent_id)
-           VALUES (?, ?, ?, ?, ?, ?)""",
-        (user['id'], total_amount, vat_amount, 'pending',
-         order_data.payment_method, order_data.payment_intent_id)
-    )
+    await validate_order_prices([order_data])
     
-    # Create order items
-    for item in order_data.items:
-        execute_insert(
-            """INSERT INTO order_items (order_id, product_id, quantity, price_per_unit, volume_tier)
-               VALUES (?, ?, ?, ?, ?)""",
-            (order_id, item.product_id, item.quantity, item.price_per_unit, item.volume_tier)
-        )
+    # Order header, all items, stock reservations and the stored response are written in a single transaction
+    try:
+        order = await run_in_db(place_order, user['id'], order_data, idempotent)
+    except InsufficientStock as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except IdempotencyConflict:
+        return await replay_concurrent(idempotent)
     
-    return OrderResponse(
-        id=order_id,
-        user_id=user['id'],
-        total_amount=total_amount,
-        vat_amount=vat_amount,
-        status='pending',
-        payment_method=order_data.payment_method,
-        created_at="",  # Will be set by database
-        items=order_data.items
-    )
+    return json_response(order)
 
 
-@app.get("/api/orders", response_model=List[OrderResponse])
-async def get_user_orders(user: dict = Depends(require_auth)):
-    """Get all orders for current user"""
-    orders = execute_query(
-        "SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC",
-        (user['id'],)
+@app.post("/api/orders/bulk", response_model=List[OrderResponse])
+async def create_orders_bulk(
+    bulk_data: BulkOrderCreate,
+    user: dict = Depends(require_auth),
+    idempotency_key: Optional[str] = Header(None, max_length=255)
+):
+    """Create many orders at once; all of them are written or none (requires authentication)"""
+    idempotent = idempotent_request(
+        f"orders_bulk:{user['id']}", idempotency_key, bulk_data.model_dump(mode="json")
     )
+    replayed = await stored_response(idempotent)
+    if replayed is not None:
+        return replayed
     
-    result = []
-    for order in orders:
-        # Get order items
-        items = execute_query(
-            "SELECT * FROM order_items WHERE order_id = ?",
-            (order['id'],)
-        )
-        
-        result.append(OrderResponse(
-            id=order['id'],
-            user_id=order['user_id'],
-            total_amount=order['total_amount'],
-            vat_amount=order['vat_amount'],
-            status=order['status'],
-            payment_method=order['payment_method'],
-            created_at=order['created_at'],
-            items=[OrderItem(**item) for item in items]
-        ))
+    await validate_order_prices(bulk_data.orders)
     
-    return result
+    try:
+        orders = await run_in_db(place_orders, user['id'], bulk_data.orders, idempotent)
+    except InsufficientStock as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except IdempotencyConflict:
+        return await replay_concurrent(idempotent)
+    
+    return json_response(orders)
+
+
+@app.get("/api/orders", response_model=List[OrderResponse])
+async def get_user_orders(
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    after: Optional[int] = None,
+    format: Optional[str] = Query(None, pattern="^(json|ndjson)$"),
+    accept: Optional[str] = Header(None),
+    user: dict = Depends(require_auth)
+):
+    """
+    Get orders for current user, newest first.
+    Pass ?limit= to paginate; the X-Next-Cursor header holds the value for ?after=
+    ?format=ndjson (or Accept: application/x-ndjson) without ?limit= streams every order page by page.
+    """
+    ndjson = wants_ndjson(format, accept)
+    if ndjson and limit is None and after is None:
+        return ndjson_response(iter_user_orders(user['id']))
+
+    orders, next_cursor = await run_in_db(fetch_user_orders, user['id'], limit=limit, after=after)
+    headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else None
+    if ndjson:
+        return ndjson_response(orders, headers=headers)
+    return json_response(orders, headers=headers)
+
+
+@app.get("/api/orders/export")
+async def export_user_orders(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    user: dict = Depends(require_auth)
+):
+    """
+    Stream the current user's full order history, one row per order line (requires authentication).
+    Rows are read in chunks from a single cursor, so memory use doesn't grow with the account's history.
+    """
+    if format == "csv":
+        chunks, media_type = export_orders_csv(user['id']), "text/csv; charset=utf-8"
+    else:
+        chunks, media_type = export_orders_ndjson(user['id']), NDJSON_MEDIA_TYPE
+    return StreamingResponse(chunks, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="orders-{user["id"]}.{format}"'
+    })
+
+
+# ============================================================================
+# ANALYTICS ENDPOINTS (PROTECTED)
+# ============================================================================
+# Served from the sales rollup tables only (see analytics.py)
+
+@app.get("/api/analytics/summary", response_model=SalesSummary)
+async def get_sales_summary(
+    days: int = Query(30, ge=1, le=366),
+    status: Optional[List[str]] = Query(None),
+    user: dict = Depends(require_auth)
+):
+    """Order count, spend and VAT over the last ?days=, per status and per day"""
+    summary = await run_in_db(
+        analytics.user_summary, user['id'], days, status or analytics.COUNTED_STATUSES
+    )
+    return json_response(summary)
+
+
+@app.get("/api/analytics/products", response_model=List[ProductSales])
+async def get_product_sales(
+    days: int = Query(30, ge=1, le=366),
+    limit: int = Query(20, ge=1, le=500),
+    status: Optional[List[str]] = Query(None),
+    user: dict = Depends(require_auth)
+):
+    """Products by spend over the last ?days="""
+    products = await run_in_db(
+        analytics.top_products, user['id'], days, limit, status or analytics.COUNTED_STATUSES
+    )
+    # Names come from the cached catalog rather than a join
+    snapshot = catalog.current() or await run_in_db(catalog.snapshot)
+    for entry in products:
+        product = snapshot.by_id.get(entry['product_id'])
+        entry['name'] = product['name'] if product else None
+        entry['unit'] = product['unit'] if product else None
+    return json_response(products)
+
+
+@app.get("/api/analytics/categories", response_model=List[CategorySales])
+async def get_category_sales(
+    days: int = Query(30, ge=1, le=366),
+    status: Optional[List[str]] = Query(None),
+    user: dict = Depends(require_auth)
+):
+    """Spend per product category over the last ?days="""
+    categories = await run_in_db(
+        analytics.category_breakdown, user['id'], days, status or analytics.COUNTED_STATUSES
+    )
+    return json_response(categories)
 
 
 # ============================================================================
@@ -259,40 +602,74 @@ async def get_user_orders(user: dict = Depends(require_auth)):
 # ============================================================================
 
 @app.post("/api/create-payment-intent", response_model=PaymentIntentResponse)
-async def create_payment_intent(request: PaymentIntentRequest):
+async def create_payment_intent(
+    request: PaymentIntentRequest,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    session_id: Optional[str] = Cookie(None)
+):
     """
     Create a Stripe PaymentIntent for the checkout process.
     Amount should be in cents (e.g., €45.00 = 4500)
+    For signed-in callers an Idempotency-Key header is scoped to the user, forwarded to
+    Stripe, and retries replay the stored response; anonymous callers' keys are ignored.
     """
+    user = await authenticate(session_id) if idempotency_key else None
+    idempotent = idempotent_request(
+        f"payment_intent:{user['id']}", idempotency_key, request.model_dump(mode="json")
+    ) if user else None
+    replayed = await stored_response(idempotent)
+    if replayed is not None:
+        return replayed
+    
+    if not payment_client.configured:
+        raise HTTPException(
+            status_code=503,
+            detail="Payment processing is currently unavailable. Please contact support or try bank transfer."
+        )
+    
     try:
-        if not stripe.api_key or stripe.api_key == "sk_test_your_secret_key_here":
-            raise HTTPException(
-                status_code=503,
-                detail="Payment processing is currently unavailable. Please contact support or try bank transfer."
-            )
-
-        payment_intent = stripe.PaymentIntent.create(
+        payment_intent = await payment_client.create_payment_intent(
             amount=request.amount,
             currency=request.currency,
-            metadata=request.metadata or {},
-            automatic_payment_methods={"enabled": True},
+            metadata=request.metadata,
+            idempotency_key=idempotency.provider_key(idempotent) if idempotent else None,
         )
-
-        return PaymentIntentResponse(
-            clientSecret=payment_intent.client_secret,
-            paymentIntentId=payment_intent.id
-        )
-
-    except stripe.error.StripeError as e:
+    except PaymentProviderError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    except PaymentProviderUnavailable:
+        raise HTTPException(
+            status_code=503,
+            detail="Payment processing is temporarily unavailable. Please retry shortly or try bank transfer.",
+            headers={"Retry-After": "30"}
+        )
+    
+    result = PaymentIntentResponse(
+        clientSecret=payment_intent["client_secret"],
+        paymentIntentId=payment_intent["id"]
+    )
+    if idempotent is not None:
+        await run_in_db(idempotency.store_response, idempotent, dumps(result.model_dump()))
+    return result
 
 
 @app.post("/api/webhook")
-async def stripe_webhook():
+async def stripe_webhook(request: Request, stripe_signature: Optional[str] = Header(None)):
     """
     Stripe webhook endpoint for handling payment events.
-    In production, this would verify webhook signatures and update order status.
+    Verifies the signature, queues the event and acknowledges immediately;
+    order statuses are updated by the background webhook worker.
     """
+    secret = get_webhook_secret()
+    if not secret:
+        raise HTTPException(status_code=503, detail="Webhook processing is not configured")
+    
+    payload = await request.body()
+    try:
+        event = verify_event(payload, stripe_signature, secret)
+    except WebhookVerificationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid webhook: {e}")
+    
+    if await run_in_db(enqueue_event, event, payload):
+        webhook_worker.notify()
+    
     return {"received": True}
@@ -0,0 +1,180 @@
+"""
+Request-level performance metrics for WORLD DISTRIBUTION
+
+MetricsMiddleware times every request per route template and counts the SQL
+work it caused (queries, pool checkouts, connection opens, SQL time) via
+database.request_db_stats. Results are exposed as a Prometheus text page at
+/metrics and per response in a Server-Timing header.
+"""
+import threading
+import time
+from typing import Optional, List, Dict, Tuple, Callable, Iterable
+from database import QueryStats, request_db_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a label tuple"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [bucket counts..., count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in sorted(items):
+            base = format_labels(self.label_names, labels)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound:g}"}} {count:g}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-2]:g}')
+            lines.append(f"{self.name}_count{{{base}}} {series[-2]:g}")
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]:.6f}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by a label tuple"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{{{format_labels(self.label_names, labels)}}} {value:g}")
+        return lines
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    return ",".join(f'{name}="{escape_label(str(value))}"' for name, value in zip(names, values))
+
+
+def render_gauges(prefix: str, values: Dict[str, object], help_text: str) -> List[str]:
+    """Render a flat dict of numeric stats as gauges named <prefix>_<key>"""
+    lines = []
+    for key, value in values.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        name = f"{prefix}_{key}"
+        lines.append(f"# HELP {name} {help_text}: {key.replace('_', ' ')}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value:g}")
+    return lines
+
+
+request_latency = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ("method", "route"), LATENCY_BUCKETS
+)
+request_queries = Histogram(
+    "http_request_db_queries", "SQL statements executed per request by route",
+    ("method", "route"), QUERY_COUNT_BUCKETS
+)
+request_sql_seconds = Counter(
+    "http_request_db_seconds_total", "Time spent in SQL per route", ("method", "route")
+)
+requests_total = Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+
+# name -> callable returning a dict of numeric stats, rendered as gauges
+_collectors: Dict[str, Tuple[str, Callable[[], Dict[str, object]]]] = {}
+
+
+def register_collector(prefix: str, help_text: str, collect: Callable[[], Dict[str, object]]):
+    """Expose a component's stats() dict on /metrics"""
+    _collectors[prefix] = (help_text, collect)
+
+
+def render_metrics(extra: Optional[Dict[str, Dict[str, object]]] = None) -> str:
+    """Prometheus text exposition of all metrics"""
+    lines: List[str] = []
+    for metric in (request_latency, request_queries, request_sql_seconds, requests_total):
+        lines.extend(metric.render())
+    for prefix, (help_text, collect) in sorted(_collectors.items()):
+        lines.extend(render_gauges(prefix, collect(), help_text))
+    for prefix, values in (extra or {}).items():
+        lines.extend(render_gauges(prefix, values, prefix.replace('_', ' ')))
+    return "\n".join(lines) + "\n"
+
+
+def route_template(scope) -> str:
+    """Route path template (e.g. /api/products/{product_id}) to keep label cardinality bounded"""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path or "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (works with streaming responses) recording per-request metrics"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = request_db_stats.set(stats)
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                timing = (
+                    f'db;dur={stats.sql_seconds * 1000:.2f};desc="{stats.queries} queries", '
+                    f"app;dur={elapsed_ms:.2f}"
+                )
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timing.encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_db_stats.reset(token)
+            elapsed = time.perf_counter() - started
+            labels = (scope["method"], route_template(scope))
+            request_latency.observe(labels, elapsed)
+            request_queries.observe(labels, stats.queries)
+            request_sql_seconds.inc(labels, stats.sql_seconds)
+            requests_total.inc(labels + (str(status["code"]),))
@@ -1,52 +1,51 @@
 """
-Database migration script to add delivery address fields to users table
+Apply pending schema migrations (see migrations.py)
+
+    python migrate_db.py             # back up online, then migrate
+    python migrate_db.py --status    # list applied and pending migrations
 """
-import sqlite3
-import shutil
-from datetime import datetime
+import argparse
+import logging
+import os
+import time
+
+import migrations
+
+DB_PATH = os.getenv(
+    "DATABASE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "world_distribution.db")
+)
 
-DB_PATH = "world_distribution.db"
-BACKUP_PATH = f"world_distribution_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
 
 def migrate_database():
-    """Migrate database to add address fields"""
-    print(f"Creating backup at {BACKUP_PATH}...")
-    shutil.copy(DB_PATH, BACKUP_PATH)
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    try:
-        # Check if columns already exist
-        cursor.execute("PRAGMA table_info(users)")
-        columns = [col[1] for col in cursor.fetchall()]
-        
-        if 'street_address' in columns:
-            print("Address fields already exist. No migration needed.")
-            return
-        
-        print("Adding address fields to users table...")
-        
-        # Add new columns
-        cursor.execute("ALTER TABLE users ADD COLUMN street_address TEXT")
-        cursor.execute("ALTER TABLE users ADD COLUMN city TEXT")
-        cursor.execute("ALTER TABLE users ADD COLUMN postal_code TEXT")
-        cursor.execute("ALTER TABLE users ADD COLUMN phone TEXT")
-        
-        conn.commit()
-        print("✓ Migration completed successfully!")
-        
-        # Verify
-        cursor.execute("PRAGMA table_info(users)")
-        columns = [col[1] for col in cursor.fetchall()]
-        print(f"\nUsers table columns: {', '.join(columns)}")
-        
-    except Exception as e:
-        print(f"✗ Migration failed: {e}")
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
+    parser = argparse.ArgumentParser(description="Migrate the WORLD DISTRIBUTION database")
+    parser.add_argument("--db", default=DB_PATH, help="database path (defaults to DATABASE_PATH)")
+    parser.add_argument("--status", action="store_true", help="show migration status and exit")
+    parser.add_argument("--no-backup", action="store_true", help="skip the online backup")
+    parser.add_argument("--target", type=int, default=None, help="stop after this version")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if not os.path.exists(args.db):
+        print(f"✗ No database at {args.db}; it is created from schema.sql on first start")
+        return
+
+    if args.status:
+        for entry in migrations.migration_status(args.db):
+            state = f"applied {entry['applied_at']}" if entry['applied_at'] else "pending"
+            print(f"  {entry['version']:03d} {entry['name']:<32} {state}")
+        return
+
+    os.environ["DATABASE_PATH"] = args.db
+    import database
+
+    started = time.perf_counter()
+    applied = database.migrate_database(backup=not args.no_backup, target=args.target)
+    if not applied:
+        print("No pending migrations.")
+        return
+    print(f"✓ Applied migrations {', '.join(f'{v:03d}' for v in applied)} in {time.perf_counter() - started:.2f}s")
+
 
 if __name__ == "__main__":
     migrate_database()
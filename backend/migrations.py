@@ -0,0 +1,384 @@
+"""
+Versioned schema migrations for WORLD DISTRIBUTION
+
+schema.sql describes the current schema and creates it for new databases.
+Existing databases are brought up to date by the numbered migrations below,
+applied in order and recorded in the schema_migrations table. Migrations run
+on their own autocommit connection, so backfills and table rebuilds commit in
+small chunks and the API keeps serving while they run.
+
+Adding a migration: change schema.sql, then register a function here with the
+next version number that makes the same change to an existing database using
+the chunked helpers (add_column, backfill, rebuild_table, create_index).
+Dropped indexes and triggers are recreated by ensure_schema() afterwards.
+"""
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Callable, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_CHUNK_SIZE = int(os.getenv("MIGRATION_CHUNK_SIZE", "5000"))
+# Pause between chunks so API writers can take the write lock
+MIGRATION_CHUNK_PAUSE = float(os.getenv("MIGRATION_CHUNK_PAUSE", "0.01"))
+# Pages copied per online backup step
+MIGRATION_BACKUP_PAGES = int(os.getenv("MIGRATION_BACKUP_PAGES", "1024"))
+
+Migration = Tuple[int, str, Callable[[sqlite3.Connection], None]]
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str):
+    """Register a migration function under a version number"""
+    def register(func: Callable[[sqlite3.Connection], None]):
+        if any(existing == version for existing, _, _ in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append((version, name, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return register
+
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """Autocommit connection for running migrations"""
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+@contextmanager
+def atomic(conn: sqlite3.Connection):
+    """Short write transaction on an autocommit connection"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def columns_of(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def add_column(conn: sqlite3.Connection, table: str, column: str, definition: str) -> bool:
+    """ALTER TABLE ADD COLUMN if missing (metadata-only, no table rewrite)"""
+    if column in columns_of(conn, table):
+        return False
+    with atomic(conn):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
+
+def backfill(
+    conn: sqlite3.Connection,
+    table: str,
+    assignments: str,
+    where: str,
+    params: Sequence[Any] = (),
+    chunk_size: int = MIGRATION_CHUNK_SIZE
+) -> int:
+    """UPDATE rows matching `where` in chunks; the update must make `where` false"""
+    total = 0
+    while True:
+        with atomic(conn):
+            updated = conn.execute(
+                f"""UPDATE {table} SET {assignments} WHERE rowid IN
+                    (SELECT rowid FROM {table} WHERE {where} LIMIT ?)""",
+                (*params, chunk_size)
+            ).rowcount
+        total += updated
+        if updated < chunk_size:
+            return total
+        time.sleep(MIGRATION_CHUNK_PAUSE)
+
+
+def rebuild_table(
+    conn: sqlite3.Connection,
+    table: str,
+    create_sql: str,
+    columns: Sequence[str],
+    select_exprs: Optional[Sequence[str]] = None,
+    chunk_size: int = MIGRATION_CHUNK_SIZE
+) -> int:
+    """Rewrite a table into a new definition without holding a long write lock.
+
+    create_sql is the new CREATE TABLE statement with `{table}` in place of the
+    name. Rows are copied in rowid order in chunks; rows updated or deleted
+    meanwhile are tracked by temporary triggers and re-copied in the short final
+    transaction that swaps the tables. Indexes and triggers on the old table are
+    dropped with it, so ensure_schema() must run afterwards.
+    """
+    new_table = f"{table}__rebuild"
+    column_list = ", ".join(columns)
+    select_list = ", ".join(select_exprs or columns)
+
+    with atomic(conn):
+        conn.execute(f"DROP TABLE IF EXISTS {new_table}")
+        conn.execute(create_sql.format(table=new_table))
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS migration_changed_rows (
+                   table_name TEXT NOT NULL, row_id INTEGER NOT NULL,
+                   PRIMARY KEY (table_name, row_id)
+               ) WITHOUT ROWID"""
+        )
+        for event in ("UPDATE", "DELETE"):
+            conn.execute(
+                f"""CREATE TRIGGER IF NOT EXISTS {table}__rebuild_{event.lower()} AFTER {event} ON {table}
+                    BEGIN
+                        INSERT OR IGNORE INTO migration_changed_rows VALUES ('{table}', old.rowid);
+                    END"""
+            )
+
+    copy_sql = f"INSERT INTO {new_table} ({column_list}) SELECT {select_list} FROM {table}"
+    last_rowid = 0
+    copied = 0
+    while True:
+        with atomic(conn):
+            count = conn.execute(
+                f"{copy_sql} WHERE rowid > ? ORDER BY rowid LIMIT ?", (last_rowid, chunk_size)
+            ).rowcount
+            last_rowid = conn.execute(f"SELECT coalesce(max(rowid), 0) FROM {new_table}").fetchone()[0]
+        copied += count
+        if count < chunk_size:
+            break
+        time.sleep(MIGRATION_CHUNK_PAUSE)
+
+    with atomic(conn):
+        changed = f"SELECT row_id FROM migration_changed_rows WHERE table_name = '{table}'"
+        conn.execute(f"DELETE FROM {new_table} WHERE rowid IN ({changed})")
+        conn.execute(f"{copy_sql} WHERE rowid IN ({changed}) AND rowid <= ?", (last_rowid,))
+        copied += conn.execute(f"{copy_sql} WHERE rowid > ?", (last_rowid,)).rowcount
+        conn.execute(f"DROP TRIGGER {table}__rebuild_update")
+        conn.execute(f"DROP TRIGGER {table}__rebuild_delete")
+        conn.execute("DELETE FROM migration_changed_rows WHERE table_name = ?", (table,))
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+    return copied
+
+
+def create_index(conn: sqlite3.Connection, sql: str):
+    """Build an index in its own transaction.
+
+    SQLite cannot build an index incrementally; in WAL mode readers carry on
+    during the build and only writers wait for it.
+    """
+    with atomic(conn):
+        conn.execute(sql)
+
+
+def backup_database(
+    db_path: str,
+    backup_path: Optional[str] = None,
+    pages: int = MIGRATION_BACKUP_PAGES
+) -> str:
+    """Online backup: copies `pages` pages per step so writers are never blocked for long"""
+    if backup_path is None:
+        base, ext = os.path.splitext(db_path)
+        backup_path = f"{base}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(backup_path)
+    try:
+        source.backup(target, pages=pages, sleep=MIGRATION_CHUNK_PAUSE)
+    finally:
+        target.close()
+        source.close()
+    return backup_path
+
+
+# ============================================================================
+# RUNNER
+# ============================================================================
+
+def ensure_migrations_table(conn: sqlite3.Connection):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS schema_migrations (
+               version INTEGER PRIMARY KEY,
+               name TEXT NOT NULL,
+               duration_ms REAL,
+               applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )"""
+    )
+
+
+def applied_versions(conn: sqlite3.Connection) -> Dict[int, str]:
+    ensure_migrations_table(conn)
+    return {row[0]: row[1] for row in conn.execute("SELECT version, applied_at FROM schema_migrations")}
+
+
+def pending_migrations(conn: sqlite3.Connection) -> List[Migration]:
+    applied = applied_versions(conn)
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def stamp(conn: sqlite3.Connection):
+    """Mark every migration as applied (for databases just created from schema.sql)"""
+    ensure_migrations_table(conn)
+    conn.executemany(
+        "INSERT OR IGNORE INTO schema_migrations (version, name, duration_ms) VALUES (?, ?, 0)",
+        [(version, name) for version, name, _ in MIGRATIONS]
+    )
+
+
+def migrate(db_path: str, backup: bool = True, target: Optional[int] = None) -> List[int]:
+    """Apply pending migrations up to `target`; returns the versions applied"""
+    conn = connect(db_path)
+    try:
+        pending = [m for m in pending_migrations(conn) if target is None or m[0] <= target]
+        if not pending:
+            return []
+        if backup:
+            started = time.perf_counter()
+            backup_path = backup_database(db_path)
+            logger.info("Backed up %s to %s in %.2fs", db_path, backup_path, time.perf_counter() - started)
+
+        applied = []
+        for version, name, apply in pending:
+            logger.info("Applying migration %03d %s", version, name)
+            started = time.perf_counter()
+            apply(conn)
+            with atomic(conn):
+                conn.execute(
+                    "INSERT INTO schema_migrations (version, name, duration_ms) VALUES (?, ?, ?)",
+                    (version, name, (time.perf_counter() - started) * 1000)
+                )
+            applied.append(version)
+        return applied
+    finally:
+        conn.close()
+
+
+def migration_status(db_path: str) -> List[Dict[str, Any]]:
+    """Every known migration with its applied_at timestamp (None when pending)"""
+    conn = connect(db_path)
+    try:
+        applied = applied_versions(conn)
+    finally:
+        conn.close()
+    return [
+        {"version": version, "name": name, "applied_at": applied.get(version)}
+        for version, name, _ in MIGRATIONS
+    ]
+
+
+# ============================================================================
+# MIGRATIONS
+# ============================================================================
+
+@migration(1, "user_address_columns")
+def add_user_address_columns(conn: sqlite3.Connection):
+    """Delivery address fields on users (formerly migrate_db.py)"""
+    for column in ("street_address", "city", "postal_code", "phone"):
+        add_column(conn, "users", column, "TEXT")
+
+
+@migration(2, "sales_rollups")
+def create_sales_rollups(conn: sqlite3.Connection):
+    """Daily sales rollups, backfilled from existing orders (see analytics.py)"""
+    import analytics
+
+    with atomic(conn):
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS sales_daily_user (
+                   user_id INTEGER NOT NULL, day TEXT NOT NULL, status TEXT NOT NULL,
+                   orders INTEGER NOT NULL DEFAULT 0, spend REAL NOT NULL DEFAULT 0,
+                   vat REAL NOT NULL DEFAULT 0,
+                   PRIMARY KEY (user_id, day, status)
+               ) WITHOUT ROWID"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS sales_daily_product (
+                   user_id INTEGER NOT NULL, product_id INTEGER NOT NULL, day TEXT NOT NULL,
+                   status TEXT NOT NULL, orders INTEGER NOT NULL DEFAULT 0,
+                   quantity INTEGER NOT NULL DEFAULT 0, spend REAL NOT NULL DEFAULT 0,
+                   PRIMARY KEY (user_id, product_id, day, status)
+               ) WITHOUT ROWID"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS sales_daily_category (
+                   user_id INTEGER NOT NULL, category TEXT NOT NULL, day TEXT NOT NULL,
+                   status TEXT NOT NULL, orders INTEGER NOT NULL DEFAULT 0,
+                   quantity INTEGER NOT NULL DEFAULT 0, spend REAL NOT NULL DEFAULT 0,
+                   PRIMARY KEY (user_id, category, day, status)
+               ) WITHOUT ROWID"""
+        )
+    # The rollups group order lines by the category they were placed under
+    add_order_item_category(conn)
+    analytics.backfill(None, conn=conn)
+
+
+@migration(3, "product_sku")
+def add_product_sku(conn: sqlite3.Connection):
+    """Natural key for catalog feeds; the change log and its triggers come from schema.sql"""
+    add_column(conn, "products", "sku", "TEXT")
+    create_index(conn, "CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku ON products(sku)")
+
+
+@migration(4, "idempotency_keys")
+def create_idempotency_keys(conn: sqlite3.Connection):
+    """Response cache for Idempotency-Key retries (see idempotency.py)"""
+    with atomic(conn):
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS idempotency_keys (
+                   scope TEXT NOT NULL,
+                   key TEXT NOT NULL,
+                   fingerprint TEXT NOT NULL,
+                   status_code INTEGER NOT NULL,
+                   response BLOB NOT NULL,
+                   created_at TIMESTAMP NOT NULL,
+                   expires_at TIMESTAMP NOT NULL,
+                   PRIMARY KEY (scope, key)
+               )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at)")
+
+
+@migration(5, "order_item_category")
+def add_order_item_category(conn: sqlite3.Connection):
+    """Category as of order time on order lines, copied from products for existing rows.
+
+    Also run by migration 2, so this is a no-op unless 2 was applied before the column existed.
+    """
+    if not add_column(conn, "order_items", "category", "TEXT"):
+        return
+    max_id = conn.execute("SELECT coalesce(max(id), 0) FROM order_items").fetchone()[0]
+    # Id ranges rather than backfill(): rows whose product is gone stay NULL
+    for start in range(1, max_id + 1, MIGRATION_CHUNK_SIZE):
+        with atomic(conn):
+            conn.execute(
+                """UPDATE order_items SET category = (SELECT category FROM products WHERE id = product_id)
+                   WHERE id BETWEEN ? AND ? AND category IS NULL""",
+                (start, start + MIGRATION_CHUNK_SIZE - 1)
+            )
+        time.sleep(MIGRATION_CHUNK_PAUSE)
+
+
+@migration(6, "webhook_retry_backoff")
+def add_webhook_next_attempt(conn: sqlite3.Connection):
+    """Retry time for failed webhook events, so a failing event backs off instead of being re-read at once"""
+    with atomic(conn):
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS webhook_events (
+                   event_id TEXT PRIMARY KEY,
+                   event_type TEXT NOT NULL,
+                   payment_intent_id TEXT,
+                   payload TEXT NOT NULL,
+                   status TEXT NOT NULL DEFAULT 'pending',
+                   attempts INTEGER NOT NULL DEFAULT 0,
+                   error TEXT,
+                   received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                   processed_at TIMESTAMP
+               )"""
+        )
+    add_column(conn, "webhook_events", "next_attempt_at", "TIMESTAMP")
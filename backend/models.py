@@ -39,6 +39,7 @@ class UserResponse(BaseModel):
 # Product Models
 class Product(BaseModel):
     id: int
+    sku: Optional[str] = None
     name: str
     category: str
     base_price: float
@@ -49,15 +50,26 @@ class Product(BaseModel):
 
 
 class ProductCreate(BaseModel):
-    name: str
-    category: str
-    base_price: float
-    unit: str
-    stock: int
+    sku: Optional[str] = None
+    name: str = Field(min_length=1)
+    category: str = Field(min_length=1)
+    base_price: float = Field(ge=0)
+    unit: str = Field(min_length=1)
+    stock: int = Field(ge=0)
     description: Optional[str] = None
     image_url: Optional[str] = None
 
 
+class ProductImportReport(BaseModel):
+    inserted: int
+    updated: int
+    rejected: int
+    batches: int
+    seconds: float
+    rows_per_second: float
+    errors: List[str]
+
+
 # Order Models
 class OrderItem(BaseModel):
     product_id: int
@@ -72,6 +84,10 @@ class OrderCreate(BaseModel):
     payment_intent_id: Optional[str] = None
 
 
+class BulkOrderCreate(BaseModel):
+    orders: List[OrderCreate] = Field(min_length=1, max_length=500)
+
+
 class OrderResponse(BaseModel):
     id: int
     user_id: int
@@ -83,6 +99,71 @@ class OrderResponse(BaseModel):
     items: List[OrderItem]
 
 
+# Quote Models
+class QuoteItem(BaseModel):
+    product_id: int
+    quantity: int = Field(gt=0)
+
+
+class QuoteRequest(BaseModel):
+    items: List[QuoteItem] = Field(min_length=1, max_length=10000)
+
+
+class QuoteLine(BaseModel):
+    product_id: int
+    quantity: int
+    volume_tier: str
+    price_per_unit: float
+    line_total: float
+
+
+class QuoteResponse(BaseModel):
+    items: List[QuoteLine]
+    subtotal: float
+    vat_amount: float
+    total: float
+
+
+# Analytics Models
+class SalesTotals(BaseModel):
+    orders: int
+    spend: float
+    vat: float
+
+
+class DailySales(SalesTotals):
+    day: str
+
+
+class StatusSales(SalesTotals):
+    status: str
+
+
+class SalesSummary(BaseModel):
+    days: int
+    orders: int
+    spend: float
+    vat: float
+    by_status: List[StatusSales]
+    daily: List[DailySales]
+
+
+class ProductSales(BaseModel):
+    product_id: int
+    name: Optional[str] = None
+    unit: Optional[str] = None
+    orders: int
+    quantity: int
+    spend: float
+
+
+class CategorySales(BaseModel):
+    category: str
+    orders: int
+    quantity: int
+    spend: float
+
+
 # Payment Models (existing)
 class PaymentIntentRequest(BaseModel):
     amount: int  # Amount in cents
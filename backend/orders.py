@@ -0,0 +1,267 @@
+"""
+Order persistence and hydration for WORLD DISTRIBUTION
+
+Orders are written as a single unit of work (header plus batched line items
+in one transaction) and read back a page at a time in a constant number of
+queries (one for the orders, one for all of their items).
+"""
+import csv
+import io
+import os
+from typing import Optional, List, Dict, Any, Tuple, Iterator, Iterable
+from database import get_db, transaction, open_connection
+from models import OrderCreate
+from inventory import reserve_stock
+from catalog import catalog, change_head
+import analytics
+import idempotency
+import webhooks
+from idempotency import IdempotentRequest
+from responses import dumps
+
+VAT_RATE = 0.19
+EXPORT_CHUNK_SIZE = int(os.getenv("ORDER_EXPORT_CHUNK_SIZE", "2000"))
+
+# Columns of models.OrderResponse, so fetched rows can be encoded without re-validation
+ORDER_COLUMNS = "id, user_id, total_amount, vat_amount, status, payment_method, created_at"
+
+
+def line_total(price_per_unit: float, quantity: int) -> float:
+    """Amount for one order line, rounded to cents"""
+    return round(price_per_unit * quantity, 2)
+
+
+def round_totals(line_totals: Iterable[float]) -> Tuple[float, float]:
+    """Return (subtotal, vat_amount) for line totals, both rounded to cents"""
+    subtotal = round(sum(line_totals), 2)
+    return subtotal, round(subtotal * VAT_RATE, 2)
+
+
+def calculate_totals(order_data: OrderCreate) -> Tuple[float, float]:
+    """Return (total_amount, vat_amount) for an order, rounded the same way as quotes"""
+    return round_totals(
+        line_total(item.price_per_unit, item.quantity)
+        for item in order_data.items
+    )
+
+
+def insert_order(
+    conn,
+    user_id: int,
+    order_data: OrderCreate,
+    stock_levels: Optional[Dict[int, int]] = None
+) -> Dict[str, Any]:
+    """Write an order header and all of its items and reserve their stock on an open transaction.
+
+    Remaining stock per product is recorded into ``stock_levels`` if given.
+    """
+    total_amount, vat_amount = calculate_totals(order_data)
+
+    cursor = conn.execute(
+        """INSERT INTO orders (user_id, total_amount, vat_amount, status, payment_method, payment_intent_id)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        (user_id, total_amount, vat_amount, 'pending',
+         order_data.payment_method, order_data.payment_intent_id)
+    )
+    order_id = cursor.lastrowid
+
+    conn.executemany(
+        """INSERT INTO order_items (order_id, product_id, quantity, price_per_unit, volume_tier, category)
+           VALUES (?, ?, ?, ?, ?, (SELECT category FROM products WHERE id = ?))""",
+        [
+            (order_id, item.product_id, item.quantity, item.price_per_unit, item.volume_tier, item.product_id)
+            for item in order_data.items
+        ]
+    )
+
+    levels = reserve_stock(conn, order_id, order_data.items)
+    if stock_levels is not None:
+        stock_levels.update(levels)
+
+    return {
+        'id': order_id,
+        'user_id': user_id,
+        'total_amount': total_amount,
+        'vat_amount': vat_amount,
+        'status': 'pending',
+        'payment_method': order_data.payment_method,
+        'created_at': "",  # Set by the database
+        'items': [item.model_dump() for item in order_data.items],
+    }
+
+
+def apply_early_payment_events(conn, created: List[Dict[str, Any]], orders: List[OrderCreate]):
+    """Apply webhook events that arrived before these orders existed, and refresh their statuses"""
+    intents = {order_data.payment_intent_id for order_data in orders if order_data.payment_intent_id}
+    if not sum(webhooks.apply_unmatched_events(conn, intent) for intent in intents):
+        return
+    for order in created:
+        order['status'] = conn.execute("SELECT status FROM orders WHERE id = ?", (order['id'],)).fetchone()[0]
+
+
+def place_order(
+    user_id: int,
+    order_data: OrderCreate,
+    idempotent: Optional[IdempotentRequest] = None
+) -> Dict[str, Any]:
+    """Create one order atomically (with its Idempotency-Key response, if any)"""
+    stock_levels: Dict[int, int] = {}
+    with transaction() as conn:
+        order = insert_order(conn, user_id, order_data, stock_levels)
+        analytics.record_orders(conn, [order['id']])
+        apply_early_payment_events(conn, [order], [order_data])
+        # Writers are serialized, so this orders our stock levels against other commits
+        change_id = change_head(conn)
+        if idempotent is not None:
+            idempotency.store(conn, idempotent, dumps(order))
+    catalog.update_stock(stock_levels, change_id)
+    return order
+
+
+def place_orders(
+    user_id: int,
+    orders: List[OrderCreate],
+    idempotent: Optional[IdempotentRequest] = None
+) -> List[Dict[str, Any]]:
+    """Create many orders in one transaction; either all are written or none"""
+    stock_levels: Dict[int, int] = {}
+    with transaction() as conn:
+        created = [insert_order(conn, user_id, order_data, stock_levels) for order_data in orders]
+        analytics.record_orders(conn, [order['id'] for order in created])
+        apply_early_payment_events(conn, created, orders)
+        # Writers are serialized, so this orders our stock levels against other commits
+        change_id = change_head(conn)
+        if idempotent is not None:
+            idempotency.store(conn, idempotent, dumps(created))
+    catalog.update_stock(stock_levels, change_id)
+    return created
+
+
+def hydrate_orders(conn, orders: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Attach order_items to a list of order rows belonging to one user.
+
+    The orders must come from a contiguous id range of a single user (as
+    produced by ``fetch_user_orders``) so all items load with a single range query.
+    """
+    if not orders:
+        return []
+
+    ids = [order['id'] for order in orders]
+    items_by_order: Dict[int, List[Dict[str, Any]]] = {order_id: [] for order_id in ids}
+
+    cursor = conn.execute(
+        """SELECT oi.order_id, oi.product_id, oi.quantity, oi.price_per_unit, oi.volume_tier
+           FROM order_items oi
+           JOIN orders o ON o.id = oi.order_id
+           WHERE o.user_id = ? AND o.id BETWEEN ? AND ?
+           ORDER BY oi.order_id, oi.id""",
+        (orders[0]['user_id'], min(ids), max(ids))
+    )
+    for row in cursor:
+        bucket = items_by_order.get(row['order_id'])
+        if bucket is not None:
+            bucket.append({
+                'product_id': row['product_id'],
+                'quantity': row['quantity'],
+                'price_per_unit': row['price_per_unit'],
+                'volume_tier': row['volume_tier'],
+            })
+
+    return [dict(order, items=items_by_order[order['id']]) for order in orders]
+
+
+def fetch_user_orders(
+    user_id: int,
+    limit: Optional[int] = None,
+    after: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Return (orders with items, next cursor) for a user, newest first.
+
+    ``after`` is the id of the last order of the previous page; the returned
+    cursor is None when there are no more orders.
+    """
+    query = f"SELECT {ORDER_COLUMNS} FROM orders WHERE user_id = ?"
+    params: list = [user_id]
+    if after is not None:
+        query += " AND id < ?"
+        params.append(after)
+    query += " ORDER BY id DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit + 1)
+
+    with get_db() as conn:
+        orders = [dict(row) for row in conn.execute(query, params).fetchall()]
+
+        next_cursor = None
+        if limit is not None and len(orders) > limit:
+            orders = orders[:limit]
+            next_cursor = orders[-1]['id']
+
+        return hydrate_orders(conn, orders), next_cursor
+
+
+def iter_user_orders(user_id: int, page_size: int = 500) -> Iterator[Dict[str, Any]]:
+    """Yield all of a user's orders newest first, holding a connection only per page"""
+    after = None
+    while True:
+        orders, after = fetch_user_orders(user_id, limit=page_size, after=after)
+        yield from orders
+        if after is None:
+            return
+
+
+# One row per order line, in order id order
+EXPORT_COLUMNS = (
+    "order_id", "created_at", "status", "payment_method", "order_total", "order_vat",
+    "product_id", "product_name", "category", "unit", "quantity", "volume_tier",
+    "price_per_unit", "line_total",
+)
+
+
+def iter_order_export(user_id: int, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[List[tuple]]:
+    """Yield a user's order lines in chunks from a single cursor.
+
+    Uses its own connection rather than a pooled one, so a long download
+    doesn't hold a pool slot; memory is bounded by chunk_size.
+    """
+    conn = open_connection()
+    try:
+        cursor = conn.execute(
+            """SELECT o.id, o.created_at, o.status, o.payment_method, o.total_amount, o.vat_amount,
+                      oi.product_id, p.name, p.category, p.unit, oi.quantity, oi.volume_tier,
+                      oi.price_per_unit, oi.quantity * oi.price_per_unit
+               FROM orders o
+               JOIN order_items oi ON oi.order_id = o.id
+               LEFT JOIN products p ON p.id = oi.product_id
+               WHERE o.user_id = ?
+               ORDER BY o.id, oi.id""",
+            (user_id,)
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield [tuple(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def export_orders_csv(user_id: int) -> Iterator[bytes]:
+    """Order lines as CSV, one encoded block per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in iter_order_export(user_id):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def export_orders_ndjson(user_id: int) -> Iterator[bytes]:
+    """Order lines as NDJSON objects, one encoded block per chunk"""
+    for rows in iter_order_export(user_id):
+        yield b"".join(dumps(dict(zip(EXPORT_COLUMNS, row))) + b"\n" for row in rows)
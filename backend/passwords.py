@@ -0,0 +1,111 @@
+"""
+Async password hashing service for WORLD DISTRIBUTION
+
+bcrypt is CPU bound (~250 ms per call at the default cost), so hashing and
+verification run on a bounded thread pool instead of the event loop. bcrypt
+releases the GIL while hashing, so threads give real parallelism.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict
+from auth import hash_password, verify_password
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_MAX_QUEUE = int(os.getenv("PASSWORD_MAX_QUEUE", "64"))
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when the hashing queue is full and the request should be shed"""
+
+
+def get_hash_rounds(hashed: str) -> int:
+    """Extract the bcrypt work factor from a hash like $2b$12$..."""
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+class PasswordService:
+    """Bounded, non-blocking front end for bcrypt"""
+
+    def __init__(
+        self,
+        workers: int = PASSWORD_WORKERS,
+        max_queue: int = PASSWORD_MAX_QUEUE,
+        rounds: int = BCRYPT_ROUNDS
+    ):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.rounds = rounds
+        # Created on first use and dropped on shutdown, so a later app lifespan gets a fresh pool
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        # Only touched from the event loop thread, so no lock is needed
+        self._pending = 0
+        self.peak_queue_depth = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        """Requests waiting for a free worker"""
+        return max(0, self._pending - self.workers)
+
+    async def _run(self, func, *args):
+        if self._pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise PasswordServiceBusy("Password service is at capacity")
+        self._pending += 1
+        self.peak_queue_depth = max(self.peak_queue_depth, self.queue_depth)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self._pending -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        """Hash a password at the configured work factor"""
+        return await self._run(hash_password, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        """Verify a password against a hash"""
+        return await self._run(verify_password, password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True when a stored hash was made with a different work factor"""
+        return get_hash_rounds(hashed) != self.rounds
+
+    def stats(self) -> Dict[str, int]:
+        """Concurrency and queue-depth counters"""
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "rounds": self.rounds,
+            "in_flight": min(self._pending, self.workers),
+            "queue_depth": self.queue_depth,
+            "peak_queue_depth": self.peak_queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        """Stop the worker threads"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+password_service = PasswordService()
@@ -0,0 +1,212 @@
+"""
+Async payment provider client for WORLD DISTRIBUTION
+
+Talks to the Stripe REST API over a pooled httpx.AsyncClient so checkout
+never blocks the event loop. Requests have timeouts, are retried with a
+stable Idempotency-Key (so a retry can never create a second PaymentIntent),
+and a circuit breaker fails fast while the provider is down.
+
+Point STRIPE_API_BASE at stripe_stub.py to load-test checkout offline.
+"""
+import asyncio
+import os
+import random
+import time
+import uuid
+from typing import Optional, Dict, Any
+import httpx
+
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "https://api.stripe.com")
+PAYMENT_TIMEOUT = float(os.getenv("PAYMENT_TIMEOUT", "10"))
+PAYMENT_MAX_RETRIES = int(os.getenv("PAYMENT_MAX_RETRIES", "2"))
+PAYMENT_MAX_CONNECTIONS = int(os.getenv("PAYMENT_MAX_CONNECTIONS", "50"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("PAYMENT_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("PAYMENT_BREAKER_RESET", "30"))
+
+
+class PaymentProviderError(Exception):
+    """The provider rejected the request (e.g. invalid amount); not retried"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class PaymentProviderUnavailable(Exception):
+    """The provider could not be reached or the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures and allows one probe request at a time after a cool-down"""
+
+    def __init__(
+        self,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_TIMEOUT
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        # Only touched from the event loop thread, so no lock is needed
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a request may be attempted right now; half-open admits a single probe"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open" or self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def end_probe(self):
+        """Let the next request probe if the current one ended without an outcome"""
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self._probing = False
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            # A failed half-open probe re-opens the breaker for another cool-down
+            if self.opened_at is None:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+
+
+class StripeClient:
+    """Minimal async Stripe API client with connection reuse"""
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        base_url: str = STRIPE_API_BASE,
+        timeout: float = PAYMENT_TIMEOUT,
+        max_retries: int = PAYMENT_MAX_RETRIES
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.breaker = CircuitBreaker()
+        self._client: Optional[httpx.AsyncClient] = None
+        self.requests = 0
+        self.retries = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key) and self.api_key != "sk_test_your_secret_key_here"
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                auth=(self.api_key or "", ""),
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=PAYMENT_MAX_CONNECTIONS,
+                    max_keepalive_connections=PAYMENT_MAX_CONNECTIONS
+                ),
+            )
+        return self._client
+
+    async def _post(self, path: str, data: Dict[str, Any], idempotency_key: str) -> Dict[str, Any]:
+        if not self.breaker.allow():
+            raise PaymentProviderUnavailable("Payment provider circuit is open")
+        try:
+            return await self._attempt(path, data, idempotency_key)
+        finally:
+            self.breaker.end_probe()
+
+    async def _attempt(self, path: str, data: Dict[str, Any], idempotency_key: str) -> Dict[str, Any]:
+        last_error = "unknown error"
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+                # Exponential backoff with jitter: ~0.25s, 0.5s, 1s...
+                await asyncio.sleep(0.25 * (2 ** (attempt - 1)) * (0.5 + random.random()))
+            self.requests += 1
+            try:
+                response = await self._http().post(
+                    path, data=data, headers={"Idempotency-Key": idempotency_key}
+                )
+            except httpx.TransportError as e:
+                last_error = f"{type(e).__name__}: {e}"
+                continue
+
+            if response.status_code == 429 or response.status_code >= 500:
+                last_error = f"HTTP {response.status_code}"
+                if response.headers.get("Stripe-Should-Retry") == "false":
+                    break
+                continue
+
+            try:
+                body = response.json()
+            except ValueError:
+                # e.g. an HTML error page from a proxy in front of the provider
+                body = None
+            if response.status_code >= 400:
+                self.breaker.record_success()
+                error = body.get("error") if isinstance(body, dict) else None
+                message = (error.get("message") if isinstance(error, dict) else None) or f"HTTP {response.status_code}"
+                raise PaymentProviderError(response.status_code, message)
+            if not isinstance(body, dict):
+                self.breaker.record_failure()
+                raise PaymentProviderUnavailable("Payment provider returned an invalid response")
+            self.breaker.record_success()
+            return body
+
+        self.breaker.record_failure()
+        raise PaymentProviderUnavailable(f"Payment provider unavailable ({last_error})")
+
+    async def create_payment_intent(
+        self,
+        amount: int,
+        currency: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Create a PaymentIntent with automatic payment methods enabled"""
+        data: Dict[str, Any] = {
+            "amount": amount,
+            "currency": currency,
+            "automatic_payment_methods[enabled]": "true",
+        }
+        for key, value in (metadata or {}).items():
+            data[f"metadata[{key}]"] = str(value)
+        return await self._post(
+            "/v1/payment_intents", data, idempotency_key or str(uuid.uuid4())
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Request, retry and breaker counters"""
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "breaker_state": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+        }
+
+    async def aclose(self):
+        """Close pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+payment_client = StripeClient(api_key=os.getenv("STRIPE_SECRET_KEY"))
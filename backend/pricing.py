@@ -0,0 +1,120 @@
+"""
+Server-side volume-tier pricing for WORLD DISTRIBUTION
+
+Mirrors the tiers in frontend/src/data/products.ts. A product x tier price
+table is precomputed from products.base_price once per catalog snapshot, so
+pricing a cart is a single pass of dictionary lookups.
+"""
+from typing import Optional, List, Dict, Tuple, Iterable
+from catalog import CatalogSnapshot
+from models import OrderItem
+from orders import line_total, round_totals
+
+# tier -> (multiplier, minimum quantity)
+VOLUME_TIERS: Dict[str, Tuple[float, int]] = {
+    '100kg': (1.0, 0),
+    '500kg': (0.85, 500),
+    '1000kg+': (0.70, 1000),
+}
+
+# Client prices may differ from ours by float rounding only
+PRICE_TOLERANCE = 0.005
+
+
+class PricingError(ValueError):
+    """Raised when items reference unknown products/tiers or carry wrong prices"""
+
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def tier_for_quantity(quantity: int) -> str:
+    """Best tier a quantity qualifies for"""
+    for tier, (_, min_quantity) in sorted(VOLUME_TIERS.items(), key=lambda t: -t[1][1]):
+        if quantity >= min_quantity:
+            return tier
+    return '100kg'
+
+
+class PriceTable:
+    """Unit prices for every (product_id, tier) pair of one catalog snapshot"""
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.load_id = snapshot.load_id
+        self.prices: Dict[Tuple[int, str], float] = {
+            (product['id'], tier): product['base_price'] * multiplier
+            for product in snapshot.products
+            for tier, (multiplier, _) in VOLUME_TIERS.items()
+        }
+
+    def quote(self, lines: Iterable[Tuple[int, int]]) -> Dict:
+        """Price (product_id, quantity) lines at their best tier"""
+        priced = []
+        errors = []
+        prices = self.prices
+        for index, (product_id, quantity) in enumerate(lines):
+            tier = tier_for_quantity(quantity)
+            price = prices.get((product_id, tier))
+            if price is None:
+                errors.append(f"items[{index}]: unknown product {product_id}")
+                continue
+            price_per_unit = round(price, 4)
+            priced.append({
+                'product_id': product_id,
+                'quantity': quantity,
+                'volume_tier': tier,
+                'price_per_unit': price_per_unit,
+                'line_total': line_total(price_per_unit, quantity),
+            })
+        if errors:
+            raise PricingError(errors)
+
+        subtotal, vat_amount = round_totals(line['line_total'] for line in priced)
+        return {
+            'items': priced,
+            'subtotal': subtotal,
+            'vat_amount': vat_amount,
+            'total': round(subtotal + vat_amount, 2),
+        }
+
+    def validate(self, items: List[OrderItem]):
+        """Check client-sent tiers and unit prices against the table and replace the prices with ours"""
+        errors = []
+        prices = self.prices
+        for index, item in enumerate(items):
+            tier = VOLUME_TIERS.get(item.volume_tier)
+            if tier is None:
+                errors.append(f"items[{index}]: unknown volume tier '{item.volume_tier}'")
+                continue
+            if item.quantity < tier[1]:
+                errors.append(
+                    f"items[{index}]: quantity {item.quantity} does not qualify for tier '{item.volume_tier}'"
+                )
+                continue
+            price = prices.get((item.product_id, item.volume_tier))
+            if price is None:
+                errors.append(f"items[{index}]: unknown product {item.product_id}")
+            elif abs(price - item.price_per_unit) > PRICE_TOLERANCE:
+                errors.append(
+                    f"items[{index}]: price {item.price_per_unit} does not match {round(price, 4)} "
+                    f"for product {item.product_id} at tier '{item.volume_tier}'"
+                )
+        if errors:
+            raise PricingError(errors)
+        # Orders are stored at server prices; client prices only had to be within tolerance
+        for item in items:
+            item.price_per_unit = round(prices[(item.product_id, item.volume_tier)], 4)
+
+
+_price_table: Optional[PriceTable] = None
+
+
+def get_price_table(snapshot: CatalogSnapshot) -> PriceTable:
+    """Price table for a snapshot, rebuilt only when the catalog reloads from the database"""
+    global _price_table
+    table = _price_table
+    if table is None or table.load_id != snapshot.load_id:
+        table = PriceTable(snapshot)
+        _price_table = table
+    return table
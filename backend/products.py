@@ -0,0 +1,297 @@
+"""
+Product administration for WORLD DISTRIBUTION
+
+Admin create/update/delete and bulk catalog imports. Feeds are CSV (with a
+header row) or NDJSON with the ProductCreate fields plus an optional id; each
+row is upserted by id when given, otherwise by sku. Rows are validated and
+applied in batches of PRODUCT_IMPORT_BATCH, one short write transaction per
+batch, so imports of hundreds of thousands of rows never hold the write lock
+for long and memory stays flat. Rows identical to the stored product are
+skipped, so re-importing an unchanged feed writes nothing. Stock changes are
+appended to inventory_ledger in the same transaction (reason 'admin' or
+'import').
+
+    python products.py import catalog.csv
+    python products.py import catalog.ndjson --format ndjson
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+import time
+from itertools import islice
+from typing import Optional, List, Dict, Any, IO, Iterator, Tuple
+from pydantic import ValidationError
+from database import transaction
+from models import ProductCreate
+from catalog import catalog
+from inventory import record_adjustments
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_IMPORT_BATCH = int(os.getenv("PRODUCT_IMPORT_BATCH", "1000"))
+# Rejected rows listed in an import report (all are counted)
+MAX_REPORTED_ERRORS = 100
+
+FIELDS = ("sku", "name", "category", "base_price", "unit", "stock", "description", "image_url")
+COLUMNS = ", ".join(FIELDS)
+PLACEHOLDERS = ", ".join("?" for _ in FIELDS)
+CHANGED = "(" + ", ".join(f"products.{f}" for f in FIELDS[1:]) + ") IS NOT (" + \
+    ", ".join(f"excluded.{f}" for f in FIELDS[1:]) + ")"
+UPDATES = ", ".join(f"{f} = excluded.{f}" for f in FIELDS[1:])
+
+UPSERT_BY_SKU = f"""INSERT INTO products ({COLUMNS}) VALUES ({PLACEHOLDERS})
+    ON CONFLICT(sku) DO UPDATE SET {UPDATES} WHERE {CHANGED}"""
+UPSERT_BY_ID = f"""INSERT INTO products (id, {COLUMNS}) VALUES (?, {PLACEHOLDERS})
+    ON CONFLICT(id) DO UPDATE SET sku = coalesce(excluded.sku, products.sku), {UPDATES}
+    WHERE {CHANGED} OR (excluded.sku IS NOT NULL AND excluded.sku IS NOT products.sku)"""
+
+
+class ProductConflict(Exception):
+    """The write clashes with another product's sku or with existing orders"""
+
+
+def _values(product: ProductCreate) -> Tuple:
+    return tuple(getattr(product, field) for field in FIELDS)
+
+
+# ============================================================================
+# SINGLE PRODUCTS
+# ============================================================================
+
+def create_product(product: ProductCreate) -> Dict[str, Any]:
+    """Insert a product and return it"""
+    try:
+        with transaction() as conn:
+            row = conn.execute(
+                f"INSERT INTO products ({COLUMNS}) VALUES ({PLACEHOLDERS}) RETURNING id, {COLUMNS}",
+                _values(product)
+            ).fetchone()
+            record_adjustments(conn, [(row['id'], 0, row['stock'])], "admin")
+    except sqlite3.IntegrityError:
+        raise ProductConflict(f"SKU {product.sku!r} is already in use")
+    catalog.invalidate()
+    return dict(row)
+
+
+def update_product(product_id: int, product: ProductCreate) -> Optional[Dict[str, Any]]:
+    """Replace a product's fields; None if it doesn't exist"""
+    assignments = ", ".join(f"{field} = ?" for field in FIELDS)
+    try:
+        with transaction() as conn:
+            before = conn.execute("SELECT stock FROM products WHERE id = ?", (product_id,)).fetchone()
+            row = conn.execute(
+                f"UPDATE products SET {assignments} WHERE id = ? RETURNING id, {COLUMNS}",
+                (*_values(product), product_id)
+            ).fetchone()
+            if row is not None:
+                record_adjustments(conn, [(product_id, before['stock'], row['stock'])], "admin")
+    except sqlite3.IntegrityError:
+        raise ProductConflict(f"SKU {product.sku!r} is already in use")
+    if row is None:
+        return None
+    catalog.invalidate()
+    return dict(row)
+
+
+def delete_product(product_id: int) -> bool:
+    """Delete a product that was never ordered; False if it doesn't exist"""
+    with transaction() as conn:
+        if conn.execute("SELECT 1 FROM order_items WHERE product_id = ? LIMIT 1", (product_id,)).fetchone():
+            raise ProductConflict("Product has orders; set its stock to 0 instead")
+        deleted = conn.execute("DELETE FROM products WHERE id = ?", (product_id,)).rowcount
+    if deleted:
+        catalog.invalidate()
+    return bool(deleted)
+
+
+# ============================================================================
+# BULK IMPORT
+# ============================================================================
+
+def read_csv(stream: IO[str]) -> Iterator[Tuple[int, Any]]:
+    """(line number, row dict) for each CSV record; empty cells become None"""
+    reader = csv.DictReader(stream)
+    for record in reader:
+        yield reader.line_num, {key: (value if value != "" else None) for key, value in record.items()}
+
+
+def read_ndjson(stream: IO[str]) -> Iterator[Tuple[int, Any]]:
+    """(line number, parsed object) for each non-blank line; malformed lines yield the error"""
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as e:
+            yield line_no, e
+
+
+FEED_READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+
+def parse_row(record: Any) -> Tuple[Optional[int], ProductCreate]:
+    """(id or None, validated product) for one feed record; raises ValueError"""
+    if isinstance(record, ValueError):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError("expected an object")
+    product_id = record.get("id")
+    try:
+        product = ProductCreate.model_validate(record)
+        product_id = int(product_id) if product_id is not None else None
+    except ValidationError as e:
+        raise ValueError("; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+        ))
+    except (TypeError, ValueError):
+        raise ValueError("id: must be an integer")
+    if product_id is None and not product.sku:
+        raise ValueError("row needs an id or a sku")
+    return product_id, product
+
+
+def _stock_levels(conn, by_id: Dict[int, Any], by_sku: Dict[str, Any]) -> Tuple[int, Dict[int, int]]:
+    """(number of keys that exist, product id -> stock) for a batch's keys"""
+    found = 0
+    levels: Dict[int, int] = {}
+    for column, keys in (("id", list(by_id)), ("sku", list(by_sku))):
+        if not keys:
+            continue
+        marks = ", ".join("?" for _ in keys)
+        for row in conn.execute(f"SELECT id, stock FROM products WHERE {column} IN ({marks})", keys):
+            found += 1
+            levels[row[0]] = row[1]
+    return found, levels
+
+
+def _upsert(conn, by_id: Dict[int, ProductCreate], by_sku: Dict[str, ProductCreate]) -> Tuple[int, int]:
+    """Apply one batch and log its stock changes; returns (inserted, updated)"""
+    known, stock_before = _stock_levels(conn, by_id, by_sku)
+    written = 0
+    if by_id:
+        written += conn.executemany(
+            UPSERT_BY_ID, [(product_id, *_values(product)) for product_id, product in by_id.items()]
+        ).rowcount
+    if by_sku:
+        written += conn.executemany(UPSERT_BY_SKU, [_values(product) for product in by_sku.values()]).rowcount
+    _, stock_after = _stock_levels(conn, by_id, by_sku)
+    record_adjustments(
+        conn,
+        [(product_id, stock_before.get(product_id, 0), stock) for product_id, stock in stock_after.items()],
+        "import"
+    )
+    inserted = len(by_id) + len(by_sku) - known
+    return inserted, written - inserted
+
+
+def apply_batch(rows: List[Tuple[int, Optional[int], ProductCreate]], errors: List[str]) -> Tuple[int, int, int]:
+    """Upsert parsed rows in one transaction; returns (inserted, updated, rejected).
+
+    If the batch violates a constraint (e.g. a sku already used by another
+    product) it is retried row by row and only the offending rows are rejected.
+    """
+    # Later rows for the same key win, as they would row by row
+    by_id: Dict[int, ProductCreate] = {}
+    by_sku: Dict[str, ProductCreate] = {}
+    for _, product_id, product in rows:
+        if product_id is not None:
+            by_id[product_id] = product
+        else:
+            by_sku[product.sku] = product
+    try:
+        with transaction() as conn:
+            inserted, updated = _upsert(conn, by_id, by_sku)
+        return inserted, updated, 0
+    except sqlite3.IntegrityError:
+        pass
+
+    inserted = updated = rejected = 0
+    with transaction() as conn:
+        for line_no, product_id, product in rows:
+            conn.execute("SAVEPOINT product_row")
+            try:
+                if product_id is not None:
+                    added, changed = _upsert(conn, {product_id: product}, {})
+                else:
+                    added, changed = _upsert(conn, {}, {product.sku: product})
+            except sqlite3.IntegrityError as e:
+                conn.execute("ROLLBACK TO product_row")
+                rejected += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append(f"line {line_no}: {e}")
+            else:
+                inserted += added
+                updated += changed
+            conn.execute("RELEASE product_row")
+    return inserted, updated, rejected
+
+
+def import_products(
+    stream: IO[str],
+    format: str = "csv",
+    batch_size: int = PRODUCT_IMPORT_BATCH
+) -> Dict[str, Any]:
+    """Stream a catalog feed into the products table in batches and return a report"""
+    if format not in FEED_READERS:
+        raise ValueError(f"Unsupported feed format: {format}")
+    started = time.perf_counter()
+    records = FEED_READERS[format](stream)
+    report: Dict[str, Any] = {"inserted": 0, "updated": 0, "rejected": 0, "batches": 0, "errors": []}
+    errors: List[str] = report["errors"]
+
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            break
+        rows = []
+        for line_no, record in chunk:
+            try:
+                rows.append((line_no, *parse_row(record)))
+            except ValueError as e:
+                report["rejected"] += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append(f"line {line_no}: {e}")
+        if rows:
+            inserted, updated, rejected = apply_batch(rows, errors)
+            report["inserted"] += inserted
+            report["updated"] += updated
+            report["rejected"] += rejected
+            if inserted or updated:
+                catalog.invalidate()
+        report["batches"] += 1
+
+    seconds = time.perf_counter() - started
+    report["seconds"] = round(seconds, 3)
+    report["rows_per_second"] = round((report["inserted"] + report["updated"]) / seconds, 1) if seconds else 0.0
+    logger.info(
+        "Product import: %(inserted)d inserted, %(updated)d updated, %(rejected)d rejected "
+        "in %(seconds)ss", report
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a product catalog feed")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    importer = subcommands.add_parser("import", help="Upsert products from a CSV or NDJSON feed")
+    importer.add_argument("path")
+    importer.add_argument("--format", choices=sorted(FEED_READERS))
+    importer.add_argument("--batch-size", type=int, default=PRODUCT_IMPORT_BATCH)
+    args = parser.parse_args()
+
+    feed_format = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    with open(args.path, encoding="utf-8-sig", newline="") as stream:
+        report = import_products(stream, feed_format, args.batch_size)
+    print(
+        f"📦 {report['inserted']} inserted, {report['updated']} updated, "
+        f"{report['rejected']} rejected in {report['seconds']}s ({report['rows_per_second']} rows/s)"
+    )
+    for error in report["errors"]:
+        print(f"   ⚠️  {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Rate limiting and admission control for WORLD DISTRIBUTION
+
+RateLimitMiddleware applies two checks before a request reaches the app:
+
+- Token buckets per (route class, client). Requests are classed as auth
+  (login/register, which spend bcrypt time), write or read, each with its
+  own rate and burst. Clients are keyed by IP, and additionally by session
+  when the session cookie belongs to a known session (the IP bucket then
+  allows RATE_LIMIT_IP_FACTOR times the class limit, for users behind one
+  NAT). Sessions are checked against the session cache or the token
+  signature only, never the database; unknown cookies and auth requests get
+  the plain IP limit. Over-limit requests get 429 with Retry-After.
+- A global concurrency limit. At most MAX_CONCURRENT_REQUESTS run at once;
+  up to MAX_QUEUED_REQUESTS more wait up to ADMISSION_TIMEOUT seconds for a
+  slot, and everything beyond that is shed with 503 and Retry-After before
+  queueing drives latency up for everyone.
+
+Buckets are three floats per active key in an LRU dict. A bucket idle long
+enough to have refilled is identical to a new one, so idle keys are evicted
+from the cold end as new ones arrive. With a shared state backend the limits
+are enforced across all workers instead, as fixed-window counters (burst
+requests per burst/rate seconds) kept with INCR; if the backend is
+unreachable each worker falls back to its own buckets. The concurrency limit
+is always per worker.
+"""
+import asyncio
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+import tokens
+from session_cache import session_cache
+from state_backend import state, StateBackend, StateBackendError
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+# <tokens per second>:<burst> per route class
+RATE_LIMIT_READ = os.getenv("RATE_LIMIT_READ", "20:100")
+RATE_LIMIT_WRITE = os.getenv("RATE_LIMIT_WRITE", "5:30")
+RATE_LIMIT_AUTH = os.getenv("RATE_LIMIT_AUTH", "0.2:10")
+RATE_LIMIT_IP_FACTOR = float(os.getenv("RATE_LIMIT_IP_FACTOR", "4"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Count requests in the shared state backend (when one is configured) so limits hold across workers
+RATE_LIMIT_SHARED = os.getenv("RATE_LIMIT_SHARED", "1") == "1"
+# Use the address appended by a trusted reverse proxy (last X-Forwarded-For hop)
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "0") == "1"
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "256"))
+MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", "512"))
+ADMISSION_TIMEOUT = float(os.getenv("ADMISSION_TIMEOUT", "1"))
+
+# Never limited: monitoring, and Stripe webhooks (Stripe retries on its own schedule)
+EXEMPT_PATHS = ("/", "/health", "/metrics", "/api/webhook")
+AUTH_PATHS = ("/api/auth/login", "/api/auth/register")
+
+
+def parse_limit(spec: str) -> Tuple[float, float]:
+    """'<rate>:<burst>' -> (tokens per second, bucket size)"""
+    rate, _, burst = spec.partition(":")
+    return float(rate), float(burst or rate)
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """auth, write or read; None for exempt requests"""
+    if path in EXEMPT_PATHS or method == "OPTIONS":
+        return None
+    if path in AUTH_PATHS:
+        return "auth"
+    if method in ("GET", "HEAD"):
+        return "read"
+    return "write"
+
+
+class TokenBuckets:
+    """Token buckets for many keys; O(1) memory per active key with idle eviction"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> [tokens, last refill time, idle time after which the bucket is full]
+        self._buckets: "OrderedDict[Any, List[float]]" = OrderedDict()
+        # Taken from the event loop, and from worker threads when a shared backend is down
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def take(self, key: Any, rate: float, burst: float, now: Optional[float] = None) -> float:
+        """Spend one token; returns 0 if allowed, else seconds until a token is available"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now, burst / rate]
+                self._evict(now)
+            else:
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+                self._buckets.move_to_end(key)
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / rate
+
+    def _evict(self, now: float):
+        buckets = self._buckets
+        while buckets:
+            tokens, last, refill = next(iter(buckets.values()))
+            if len(buckets) <= self.max_keys and now - last < refill:
+                break
+            buckets.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SharedWindows:
+    """TokenBuckets.take() as fixed-window counters in a shared state backend"""
+
+    def __init__(self, backend: StateBackend, prefix: str = "ratelimit:"):
+        self.backend = backend
+        self.prefix = prefix
+
+    def take(self, key: Tuple, rate: float, burst: float, now: Optional[float] = None) -> float:
+        """Count one request; returns 0 if allowed, else seconds until the window resets"""
+        now = time.time() if now is None else now
+        window = burst / rate
+        index = int(now // window)
+        count = self.backend.incr(
+            self.prefix + ":".join(str(part) for part in key) + f":{index}", ttl=window + 1
+        )
+        if count <= burst:
+            return 0.0
+        return (index + 1) * window - now
+
+
+class ConcurrencyLimiter:
+    """Bounded in-flight requests with a bounded, time-limited wait for a slot"""
+
+    def __init__(
+        self,
+        limit: int = MAX_CONCURRENT_REQUESTS,
+        max_queued: int = MAX_QUEUED_REQUESTS,
+        timeout: float = ADMISSION_TIMEOUT
+    ):
+        self.limit = limit
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.in_flight = 0
+        self.queued = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def reset(self):
+        """Forget the semaphore and counters; call when a new event loop starts serving"""
+        self.in_flight = 0
+        self.queued = 0
+        self._semaphore = None
+
+    async def acquire(self) -> bool:
+        """Take a slot; False if the request should be shed"""
+        if self.limit <= 0:
+            return True
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        if self._semaphore.locked():
+            if self.queued >= self.max_queued:
+                return False
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.queued -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        if self.limit <= 0:
+            return
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+def client_ip(scope) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[-1].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def session_cookie(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"cookie":
+            for part in value.split(b";"):
+                cookie, _, token = part.strip().partition(b"=")
+                if cookie == b"session_id" and token:
+                    return token.decode("latin-1")
+    return None
+
+
+def known_session(cookie: str) -> bool:
+    """True for a valid token or a cached session id; never queries the database"""
+    if tokens.token_mode() and tokens.looks_like_token(cookie):
+        return tokens.verify_token(cookie) is not None
+    return session_cache.contains(cookie)
+
+
+def session_key(cookie: str) -> str:
+    """Short digest of the session cookie (the raw value is a credential)"""
+    return hashlib.blake2b(cookie.encode("latin-1"), digest_size=12).hexdigest()
+
+
+class RateLimiter:
+    """Per-class token buckets plus the global concurrency limiter, with counters"""
+
+    def __init__(self, enabled: bool = RATE_LIMIT_ENABLED, backend: Optional[StateBackend] = None):
+        self.enabled = enabled
+        self.limits: Dict[str, Tuple[float, float]] = {
+            "read": parse_limit(RATE_LIMIT_READ),
+            "write": parse_limit(RATE_LIMIT_WRITE),
+            "auth": parse_limit(RATE_LIMIT_AUTH),
+        }
+        self.buckets = TokenBuckets()
+        self.windows = SharedWindows(backend) if backend is not None else None
+        self.concurrency = ConcurrencyLimiter()
+        self.allowed = 0
+        self.shed = 0
+        self.backend_errors = 0
+        self.limited: Dict[str, int] = {name: 0 for name in self.limits}
+
+    def _check(self, kind: str, ip: str, cookie: Optional[str]) -> float:
+        rate, burst = self.limits[kind]
+        # Login and register always get the plain IP limit: they are what a session is minted from
+        session = session_key(cookie) if cookie and kind != "auth" and known_session(cookie) else None
+        ip_factor = RATE_LIMIT_IP_FACTOR if session else 1
+        limits = [((kind, "ip", ip), rate * ip_factor, burst * ip_factor)]
+        if session:
+            limits.append(((kind, "session", session), rate, burst))
+        if self.windows is not None:
+            try:
+                return self._take(self.windows, limits)
+            except StateBackendError:
+                self.backend_errors += 1
+        return self._take(self.buckets, limits)
+
+    @staticmethod
+    def _take(counters, limits: List[Tuple[Tuple, float, float]]) -> float:
+        for key, rate, burst in limits:
+            wait = counters.take(key, rate, burst)
+            if wait:
+                return wait
+        return 0.0
+
+    async def check(self, scope, kind: str) -> float:
+        """0 if the request is within its class limits, else seconds to wait"""
+        if not self.enabled:
+            return 0.0
+        ip, cookie = client_ip(scope), session_cookie(scope)
+        if state.shared:
+            # Session and counter lookups are network round trips
+            wait = await asyncio.to_thread(self._check, kind, ip, cookie)
+        else:
+            wait = self._check(kind, ip, cookie)
+        if wait:
+            self.limited[kind] += 1
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "allowed": self.allowed,
+            "shed": self.shed,
+            "in_flight": self.concurrency.in_flight,
+            "queued": self.concurrency.queued,
+            "active_keys": len(self.buckets),
+            "evictions": self.buckets.evictions,
+            "shared": int(self.windows is not None),
+            "backend_errors": self.backend_errors,
+        }
+        for kind, count in self.limited.items():
+            stats[f"limited_{kind}"] = count
+        return stats
+
+
+rate_limiter = RateLimiter(backend=state if state.shared and RATE_LIMIT_SHARED else None)
+
+
+async def reject(send, status: int, retry_after: float, detail: str):
+    body = ('{"detail":"' + detail + '"}').encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware enforcing rate_limiter before the request reaches the app"""
+
+    def __init__(self, app, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        kind = route_class(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if kind is None:
+            await self.app(scope, receive, send)
+            return
+
+        wait = await self.limiter.check(scope, kind)
+        if wait:
+            await reject(send, 429, wait, "Too many requests")
+            return
+        if not await self.limiter.concurrency.acquire():
+            self.limiter.shed += 1
+            await reject(send, 503, 1, "Server busy, please retry")
+            return
+        self.limiter.allowed += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.concurrency.release()
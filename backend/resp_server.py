@@ -0,0 +1,132 @@
+"""
+Minimal Redis-protocol server for WORLD DISTRIBUTION tests and local runs
+
+Implements the commands state_backend.RespBackend uses on top of
+state_backend.MemoryBackend, so multi-worker mode can run without Redis:
+
+    python resp_server.py --port 6399
+    STATE_BACKEND_URL=redis://127.0.0.1:6399 python serve.py --workers 4
+
+Not a Redis replacement: no persistence, replication or eviction policy.
+"""
+import argparse
+import asyncio
+from typing import List, Any
+
+from state_backend import MemoryBackend, StateBackendError
+
+backend = MemoryBackend(max_keys=10_000_000)
+
+
+class SimpleString(str):
+    """Status reply (+OK) rather than a bulk string"""
+
+
+OK = SimpleString("OK")
+
+
+def encode_reply(value: Any) -> bytes:
+    if isinstance(value, SimpleString):
+        return f"+{value}\r\n".encode()
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        return f":{int(value)}\r\n".encode()
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, StateBackendError):
+        return f"-ERR {value}\r\n".encode()
+    if isinstance(value, list):
+        return f"*{len(value)}\r\n".encode() + b"".join(encode_reply(item) for item in value)
+    data = str(value).encode("utf-8")
+    return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+
+def handle_set(args: List[str]) -> Any:
+    key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+    ttl = None
+    if "PX" in options:
+        ttl = int(args[2 + options.index("PX") + 1]) / 1000
+    elif "EX" in options:
+        ttl = int(args[2 + options.index("EX") + 1])
+    done = backend.set(key, value, ttl=ttl, nx="NX" in options, xx="XX" in options)
+    return OK if done else None
+
+
+COMMANDS = {
+    "PING": lambda args: SimpleString("PONG"),
+    "GET": lambda args: backend.get(args[0]),
+    "SET": handle_set,
+    "DEL": lambda args: backend.delete(*args),
+    "INCR": lambda args: backend.incr(args[0]),
+    "INCRBY": lambda args: backend.incr(args[0], int(args[1])),
+    "PEXPIRE": lambda args: backend.expire(args[0], int(args[1]) / 1000),
+    "EXPIRE": lambda args: backend.expire(args[0], int(args[1])),
+    "FLUSHDB": lambda args: (backend.flush(), OK)[1],
+    "DBSIZE": lambda args: backend.stats()["keys"],
+    "SELECT": lambda args: OK,
+    "AUTH": lambda args: OK,
+}
+
+
+async def read_command(reader: asyncio.StreamReader) -> List[str]:
+    header = await reader.readline()
+    if not header:
+        raise ConnectionResetError
+    if not header.startswith(b"*"):
+        # Inline command (e.g. typed into telnet)
+        return header.decode().split()
+    args = []
+    for _ in range(int(header[1:])):
+        length = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(length + 2))[:-2].decode("utf-8"))
+    return args
+
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            args = await read_command(reader)
+            if not args:
+                continue
+            name = args[0].upper()
+            if name == "QUIT":
+                writer.write(b"+OK\r\n")
+                break
+            handler = COMMANDS.get(name)
+            try:
+                if handler is None:
+                    raise StateBackendError(f"unknown command '{args[0]}'")
+                result = handler(args[1:])
+            except (IndexError, ValueError) as e:
+                result = StateBackendError(f"wrong arguments for '{args[0]}': {e}")
+            except StateBackendError as e:
+                result = e
+            writer.write(encode_reply(result))
+            await writer.drain()
+    except (ConnectionResetError, asyncio.IncompleteReadError, BrokenPipeError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int):
+    server = await asyncio.start_server(handle_client, host, port)
+    print(f"🗄️  RESP stand-in listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimal Redis-protocol server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6399)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
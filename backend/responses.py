@@ -0,0 +1,48 @@
+"""
+Fast JSON and NDJSON responses for WORLD DISTRIBUTION
+
+List endpoints select exactly the columns of their models.py schema, so their
+rows are already valid and can be encoded straight to bytes instead of being
+turned into pydantic models, validated against response_model and serialized
+a second time. orjson is used when installed, with the stdlib json as fallback.
+"""
+import json
+from typing import Optional, Any, Iterable, Iterator, Dict
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def dumps(payload: Any) -> bytes:
+    """Compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def json_response(payload: Any, headers: Optional[Dict[str, str]] = None, status_code: int = 200) -> Response:
+    """Encode already-validated rows without going through response_model"""
+    return Response(content=dumps(payload), media_type="application/json", headers=headers, status_code=status_code)
+
+
+def wants_ndjson(format: Optional[str], accept: Optional[str]) -> bool:
+    """?format=ndjson or an Accept header asking for NDJSON"""
+    if format is not None:
+        return format == "ndjson"
+    return bool(accept) and NDJSON_MEDIA_TYPE in accept
+
+
+def ndjson_lines(rows: Iterable[Any]) -> Iterator[bytes]:
+    for row in rows:
+        yield dumps(row) + b"\n"
+
+
+def ndjson_response(rows: Iterable[Any], headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    """Stream one JSON document per line; a blocking row iterator is advanced in a worker thread"""
+    return StreamingResponse(ndjson_lines(rows), media_type=NDJSON_MEDIA_TYPE, headers=headers)
@@ -1,6 +1,10 @@
 -- WORLD DISTRIBUTION Database Schema
 -- SQLite database for production-ready demo
 
+-- Let the session reaper return freed pages with PRAGMA incremental_vacuum
+-- (takes effect for new databases; existing ones need a one-off VACUUM)
+PRAGMA auto_vacuum = INCREMENTAL;
+
 -- Users table
 CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -26,7 +30,8 @@ CREATE TABLE IF NOT EXISTS products (
     stock INTEGER NOT NULL,
     description TEXT,
     image_url TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sku TEXT
 );
 
 -- Orders table
@@ -50,6 +55,7 @@ CREATE TABLE IF NOT EXISTS order_items (
     quantity INTEGER NOT NULL,
     price_per_unit REAL NOT NULL,
     volume_tier TEXT NOT NULL,
+    category TEXT,  -- product category when ordered; sales rollups group by it
     FOREIGN KEY (order_id) REFERENCES orders(id),
     FOREIGN KEY (product_id) REFERENCES products(id)
 );
@@ -66,5 +72,147 @@ CREATE TABLE IF NOT EXISTS sessions (
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id);
+CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items(order_id);
+CREATE INDEX IF NOT EXISTS idx_orders_payment_intent_id ON orders(payment_intent_id);
 CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
 CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
+CREATE INDEX IF NOT EXISTS idx_products_category_name ON products(category, name);
+CREATE INDEX IF NOT EXISTS idx_products_base_price ON products(base_price);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku ON products(sku);
+
+-- Full-text search over product names and descriptions (kept in sync by triggers)
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    name,
+    description,
+    content='products',
+    content_rowid='id'
+);
+
+CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, name, description)
+    VALUES ('delete', old.id, old.name, old.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, name, description)
+    VALUES ('delete', old.id, old.name, old.description);
+    INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+END;
+
+-- Build the search index for databases that had products before it existed
+INSERT INTO products_fts(products_fts)
+SELECT 'rebuild'
+WHERE (SELECT count(*) FROM products_fts_docsize) != (SELECT count(*) FROM products);
+
+-- Catalog change log: every write to products gets the next catalog version,
+-- so caches re-read only the products changed since the version they hold
+CREATE TABLE IF NOT EXISTS product_changes (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS product_changes_ai AFTER INSERT ON products BEGIN
+    INSERT INTO product_changes (product_id) VALUES (new.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_changes_au AFTER UPDATE ON products BEGIN
+    INSERT INTO product_changes (product_id) VALUES (new.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_changes_ad AFTER DELETE ON products BEGIN
+    INSERT INTO product_changes (product_id) VALUES (old.id);
+END;
+
+-- Append-only inventory ledger: one row per stock movement
+CREATE TABLE IF NOT EXISTS inventory_ledger (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id INTEGER NOT NULL,
+    order_id INTEGER,
+    delta INTEGER NOT NULL,
+    stock_after INTEGER NOT NULL,
+    reason TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (product_id) REFERENCES products(id),
+    FOREIGN KEY (order_id) REFERENCES orders(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_inventory_ledger_product_id ON inventory_ledger(product_id);
+
+CREATE TRIGGER IF NOT EXISTS inventory_ledger_no_update BEFORE UPDATE ON inventory_ledger BEGIN
+    SELECT RAISE(ABORT, 'inventory_ledger is append-only');
+END;
+
+CREATE TRIGGER IF NOT EXISTS inventory_ledger_no_delete BEFORE DELETE ON inventory_ledger BEGIN
+    SELECT RAISE(ABORT, 'inventory_ledger is append-only');
+END;
+
+-- Durable queue of received Stripe webhook events (deduplicated by event id)
+CREATE TABLE IF NOT EXISTS webhook_events (
+    event_id TEXT PRIMARY KEY,
+    event_type TEXT NOT NULL,
+    payment_intent_id TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP,
+    -- Failed events are not retried before this time (see webhooks.WEBHOOK_RETRY_DELAY)
+    next_attempt_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_webhook_events_status ON webhook_events(status, received_at);
+CREATE INDEX IF NOT EXISTS idx_webhook_events_unmatched ON webhook_events(payment_intent_id)
+    WHERE status = 'unmatched';
+
+-- Sales rollups maintained by analytics.py in the same transaction as order writes and
+-- status changes; dashboards read only these. Rows are keyed by the order's current status.
+CREATE TABLE IF NOT EXISTS sales_daily_user (
+    user_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    status TEXT NOT NULL,
+    orders INTEGER NOT NULL DEFAULT 0,
+    spend REAL NOT NULL DEFAULT 0,
+    vat REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day, status)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sales_daily_product (
+    user_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    status TEXT NOT NULL,
+    orders INTEGER NOT NULL DEFAULT 0,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    spend REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, product_id, day, status)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sales_daily_category (
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    day TEXT NOT NULL,
+    status TEXT NOT NULL,
+    orders INTEGER NOT NULL DEFAULT 0,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    spend REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, category, day, status)
+) WITHOUT ROWID;
+
+-- Stored responses for Idempotency-Key retries (see idempotency.py)
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    status_code INTEGER NOT NULL,
+    response BLOB NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (scope, key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
@@ -1,8 +1,11 @@
 """
 Seed the database with demo products and test users
+
+For large synthetic datasets use generate_data.py instead.
 """
-from database import init_database, execute_insert, execute_update
+from database import init_database, transaction
 from auth import hash_password
+from passwords import BCRYPT_ROUNDS
 
 # Demo products data
 PRODUCTS = [
@@ -103,40 +106,44 @@ def seed_database():
     """Seed the database with demo data"""
     print("🌱 Seeding database...")
     
-    # Clear existing data
-    execute_update("DELETE FROM products")
-    print("🧹 Cleared existing products")
+    with transaction() as conn:
+        # Clear existing data
+        conn.execute("DELETE FROM products")
+        print("🧹 Cleared existing products")
 
-    # Seed products
-    for product in PRODUCTS:
-        execute_insert(
+        # Seed products
+        conn.executemany(
             """INSERT INTO products (name, category, base_price, unit, stock, description, image_url)
                VALUES (?, ?, ?, ?, ?, ?, ?)""",
-            (
-                product["name"],
-                product["category"],
-                product["base_price"],
-                product["unit"],
-                product["stock"],
-                product["description"],
-                product["image_url"]
-            )
+            [
+                (
+                    product["name"],
+                    product["category"],
+                    product["base_price"],
+                    product["unit"],
+                    product["stock"],
+                    product["description"],
+                    product["image_url"]
+                )
+                for product in PRODUCTS
+            ]
         )
-    print(f"✅ Seeded {len(PRODUCTS)} products")
-    
-    # Seed users
-    for user in USERS:
-        password_hash = hash_password(user["password"])
-        execute_insert(
+        print(f"✅ Seeded {len(PRODUCTS)} products")
+
+        # Seed users
+        conn.executemany(
             """INSERT INTO users (email, password_hash, company_name, country, region)
                VALUES (?, ?, ?, ?, ?)""",
-            (
-                user["email"],
-                password_hash,
-                user["company_name"],
-                user["country"],
-                user["region"]
-            )
+            [
+                (
+                    user["email"],
+                    hash_password(user["password"], BCRYPT_ROUNDS),
+                    user["company_name"],
+                    user["country"],
+                    user["region"]
+                )
+                for user in USERS
+            ]
         )
     print(f"✅ Seeded {len(USERS)} demo users")
     print("\n📝 Demo Credentials:")
@@ -0,0 +1,89 @@
+"""
+Multi-worker launcher for the WORLD DISTRIBUTION API
+
+    python serve.py --workers 4 --port 8000
+
+Runs uvicorn with N worker processes sharing the listening socket. Workers
+share sessions, the catalog version and leader locks through the state
+backend (STATE_BACKEND_URL). When several workers are requested and no
+shared backend is configured, a local resp_server.py stand-in is started
+for them; production deployments should point STATE_BACKEND_URL at Redis.
+"""
+import argparse
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import time
+
+import uvicorn
+from dotenv import load_dotenv
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Same .env as main.py, before anything below (or `import database`) reads the environment
+load_dotenv(os.path.join(BACKEND_DIR, ".env"))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_resp_standin() -> subprocess.Popen:
+    """Start resp_server.py on a free local port and point STATE_BACKEND_URL at it"""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "resp_server.py"), "--port", str(port)],
+        cwd=BACKEND_DIR
+    )
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    os.environ["STATE_BACKEND_URL"] = f"redis://127.0.0.1:{port}/0"
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with several worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    # Create or migrate the database once, before the workers start
+    import database
+    database.migrate_database()
+
+    standin = None
+    backend_url = os.getenv("STATE_BACKEND_URL", "memory://")
+    if args.workers > 1 and backend_url.startswith("memory"):
+        standin = start_resp_standin()
+        print(f"⚠️  No shared STATE_BACKEND_URL set; using local stand-in at {os.environ['STATE_BACKEND_URL']}")
+
+    if os.getenv("AUTH_MODE") == "token" and not os.getenv("TOKEN_SECRET"):
+        # Every worker must verify the others' tokens
+        os.environ["TOKEN_SECRET"] = secrets.token_urlsafe(32)
+        print("⚠️  No TOKEN_SECRET set; generated one for this run (tokens won't survive a restart)")
+
+    print(f"🚀 Starting {args.workers} worker(s) on {args.host}:{args.port}")
+    try:
+        uvicorn.run(
+            "main:app", host=args.host, port=args.port, workers=args.workers,
+            log_level=args.log_level, app_dir=BACKEND_DIR
+        )
+    finally:
+        if standin is not None:
+            standin.terminate()
+            standin.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Session cache for WORLD DISTRIBUTION
+
+Maps session_id -> resolved user dict, so authenticated requests can skip the
+sessions/users lookups. A single worker uses a bounded in-process LRU; with a
+shared state backend (STATE_BACKEND_URL=redis://...) entries live there so a
+logout on one worker is seen by every worker.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any, Tuple
+from state_backend import state, StateBackend, StateBackendError
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "60"))
+
+
+class SessionCache:
+    """Thread-safe LRU cache with a per-entry TTL capped at the session expiry"""
+
+    local = True
+
+    def __init__(self, max_entries: int = SESSION_CACHE_SIZE, ttl: float = SESSION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached user, or None on miss/expiry"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            deadline, user = entry
+            if deadline <= now:
+                del self._entries[session_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return dict(user)
+
+    def contains(self, session_id: str) -> bool:
+        """True if the session is cached and unexpired; not counted as a hit or miss"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            return entry is not None and entry[0] > time.time()
+
+    def put(self, session_id: str, user: Dict[str, Any], session_expires_at: datetime):
+        """Cache a resolved user until the TTL or the session expiry, whichever is first"""
+        if self.max_entries <= 0:
+            return
+        deadline = min(time.time() + self.ttl, session_expires_at.timestamp())
+        with self._lock:
+            self._entries[session_id] = (deadline, dict(user))
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, session_id: str):
+        """Drop a single session (e.g. on logout)"""
+        with self._lock:
+            if self._entries.pop(session_id, None) is not None:
+                self.invalidations += 1
+
+    def purge_expired(self) -> int:
+        """Drop all entries past their deadline; returns the number removed"""
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, (deadline, _) in self._entries.items() if deadline <= now]
+            for sid in expired:
+                del self._entries[sid]
+            self.invalidations += len(expired)
+            return len(expired)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class SharedSessionCache:
+    """SessionCache interface on top of a shared state backend; entries expire via backend TTLs"""
+
+    local = False
+
+    def __init__(self, backend: StateBackend, ttl: float = SESSION_CACHE_TTL, prefix: str = "session:"):
+        self.backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidations = 0
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = self.backend.get(self.prefix + session_id)
+        except StateBackendError:
+            # Fall back to the database
+            self.errors += 1
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def contains(self, session_id: str) -> bool:
+        try:
+            return self.backend.get(self.prefix + session_id) is not None
+        except StateBackendError:
+            self.errors += 1
+            return False
+
+    def put(self, session_id: str, user: Dict[str, Any], session_expires_at: datetime):
+        ttl = min(self.ttl, session_expires_at.timestamp() - time.time())
+        if ttl <= 0:
+            return
+        try:
+            self.backend.set(self.prefix + session_id, json.dumps(user, default=str), ttl=ttl)
+        except StateBackendError:
+            self.errors += 1
+
+    def invalidate(self, session_id: str):
+        try:
+            if self.backend.delete(self.prefix + session_id):
+                self.invalidations += 1
+        except StateBackendError:
+            self.errors += 1
+            logger.exception("Could not invalidate cached session; it stays valid for up to %ss", self.ttl)
+
+    def purge_expired(self) -> int:
+        """Nothing to do: the backend expires entries itself"""
+        return 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "invalidations": self.invalidations,
+        }
+
+
+session_cache = SharedSessionCache(state) if state.shared else SessionCache()
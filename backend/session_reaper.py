@@ -0,0 +1,131 @@
+"""
+Background session reaper for WORLD DISTRIBUTION
+
+Every login inserts a sessions row, so expired rows are deleted periodically
+in small batches (short write transactions that never block the API for
+long), each user is capped to their newest sessions, expired idempotency
+keys and unmatched webhook events are dropped, the catalog change log is trimmed, and freed pages are
+returned to the OS with an incremental vacuum.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional
+from database import get_db, run_in_db
+from session_cache import session_cache
+from catalog import prune_changes
+from idempotency import delete_expired_keys
+from webhooks import delete_expired_unmatched
+
+logger = logging.getLogger(__name__)
+
+SESSION_REAPER_ENABLED = os.getenv("SESSION_REAPER_ENABLED", "1") == "1"
+SESSION_REAP_INTERVAL = float(os.getenv("SESSION_REAP_INTERVAL", "3600"))
+SESSION_REAP_BATCH = int(os.getenv("SESSION_REAP_BATCH", "1000"))
+MAX_SESSIONS_PER_USER = int(os.getenv("MAX_SESSIONS_PER_USER", "20"))
+VACUUM_PAGES = int(os.getenv("SESSION_VACUUM_PAGES", "2000"))
+
+# Result of the most recent run, for operational endpoints
+last_report: Optional[Dict[str, Any]] = None
+
+
+def delete_expired_sessions(batch_size: int = SESSION_REAP_BATCH) -> int:
+    """Delete expired sessions in bounded batches; returns rows deleted"""
+    now = datetime.now().isoformat()
+    total = 0
+    while True:
+        with get_db() as conn:
+            deleted = conn.execute(
+                """DELETE FROM sessions WHERE session_id IN (
+                       SELECT session_id FROM sessions WHERE expires_at < ? LIMIT ?
+                   )""",
+                (now, batch_size)
+            ).rowcount
+        total += deleted
+        if deleted < batch_size:
+            break
+    session_cache.purge_expired()
+    return total
+
+
+def cap_sessions_per_user(max_sessions: int = MAX_SESSIONS_PER_USER) -> int:
+    """Keep only each user's newest sessions; returns rows deleted"""
+    if max_sessions <= 0:
+        return 0
+    with get_db() as conn:
+        user_ids = [
+            row['user_id'] for row in conn.execute(
+                "SELECT user_id FROM sessions GROUP BY user_id HAVING count(*) > ?",
+                (max_sessions,)
+            )
+        ]
+
+    total = 0
+    for user_id in user_ids:
+        with get_db() as conn:
+            stale = [
+                row['session_id'] for row in conn.execute(
+                    """SELECT session_id FROM sessions WHERE user_id = ?
+                       ORDER BY created_at DESC, expires_at DESC LIMIT -1 OFFSET ?""",
+                    (user_id, max_sessions)
+                )
+            ]
+            conn.executemany(
+                "DELETE FROM sessions WHERE session_id = ?",
+                [(session_id,) for session_id in stale]
+            )
+        for session_id in stale:
+            session_cache.invalidate(session_id)
+        total += len(stale)
+    return total
+
+
+def incremental_vacuum(pages: int = VACUUM_PAGES) -> int:
+    """Release up to `pages` free pages back to the filesystem; returns pages freed"""
+    with get_db() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # Only databases created with auto_vacuum=INCREMENTAL support this
+            return 0
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return before - after
+
+
+def reap_sessions() -> Dict[str, Any]:
+    """Run one full reaper pass and return its report"""
+    global last_report
+    started = time.perf_counter()
+    expired = delete_expired_sessions()
+    capped = cap_sessions_per_user()
+    keys = delete_expired_keys()
+    webhook_events = delete_expired_unmatched()
+    changes = prune_changes()
+    pages = incremental_vacuum()
+    last_report = {
+        "expired_deleted": expired,
+        "capped_deleted": capped,
+        "idempotency_keys_deleted": keys,
+        "webhook_events_expired": webhook_events,
+        "catalog_changes_pruned": changes,
+        "pages_freed": pages,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        "finished_at": datetime.now().isoformat(),
+    }
+    return last_report
+
+
+async def run_session_reaper(interval: float = SESSION_REAP_INTERVAL):
+    """Reap sessions forever; started from the app lifespan"""
+    while True:
+        try:
+            report = await run_in_db(reap_sessions)
+            logger.info(
+                "Session reaper: %(expired_deleted)d expired, %(capped_deleted)d over cap, "
+                "%(pages_freed)d pages freed in %(duration_ms)sms", report
+            )
+        except Exception:
+            logger.exception("Session reaper run failed")
+        await asyncio.sleep(interval)
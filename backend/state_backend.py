@@ -0,0 +1,371 @@
+"""
+Shared state backend for WORLD DISTRIBUTION
+
+Sessions, cache versions, counters and leader locks go through a small
+key/value interface so several workers (or hosts) can share them:
+
+- ``memory://`` (default) keeps everything in this process; fine for a
+  single worker.
+- ``redis://[:password@]host:port/db`` speaks the Redis protocol (RESP) to
+  Redis, or to resp_server.py as a local stand-in for tests and dev.
+
+Select one with STATE_BACKEND_URL.
+"""
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import suppress
+from queue import Queue, Empty, Full
+from typing import Optional, List, Dict, Any, Tuple, Union, Callable, Awaitable
+from urllib.parse import urlparse, unquote
+
+logger = logging.getLogger(__name__)
+
+STATE_BACKEND_URL = os.getenv("STATE_BACKEND_URL", "memory://")
+STATE_MEMORY_MAX_KEYS = int(os.getenv("STATE_MEMORY_MAX_KEYS", "100000"))
+STATE_POOL_SIZE = int(os.getenv("STATE_POOL_SIZE", "16"))
+STATE_TIMEOUT = float(os.getenv("STATE_TIMEOUT", "2"))
+
+
+class StateBackendError(Exception):
+    """The backend could not be reached or rejected a command"""
+
+
+class MemoryBackend:
+    """In-process key/value store with per-key TTL and LRU eviction"""
+
+    shared = False
+
+    def __init__(self, max_keys: int = STATE_MEMORY_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> (value, deadline or None)
+        self._data: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _live(self, key: str, now: float) -> Optional[Tuple[str, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def _store(self, key: str, value: str, deadline: Optional[float]):
+        self._data[key] = (value, deadline)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_keys:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._live(key, time.time())
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: Union[str, int], ttl: Optional[float] = None,
+            nx: bool = False, xx: bool = False) -> bool:
+        """Store a value; with nx/xx only if the key is absent/present. Returns whether it was set"""
+        now = time.time()
+        with self._lock:
+            exists = self._live(key, now) is not None
+            if (nx and exists) or (xx and not exists):
+                return False
+            self._store(key, str(value), now + ttl if ttl else None)
+            return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            now = time.time()
+            return sum(
+                1 for key in keys
+                if self._live(key, now) is not None and self._data.pop(key, None) is not None
+            )
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Add to an integer counter; ttl is applied when the counter is created"""
+        now = time.time()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is None:
+                value, deadline = amount, (now + ttl if ttl else None)
+            else:
+                value, deadline = int(entry[0]) + amount, entry[1]
+            self._store(key, str(value), deadline)
+            return value
+
+    def expire(self, key: str, ttl: float) -> bool:
+        with self._lock:
+            entry = self._live(key, time.time())
+            if entry is None:
+                return False
+            self._data[key] = (entry[0], time.time() + ttl)
+            return True
+
+    def flush(self):
+        with self._lock:
+            self._data.clear()
+
+    def ping(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"keys": len(self._data), "max_keys": self.max_keys, "evictions": self.evictions}
+
+
+# ============================================================================
+# REDIS PROTOCOL CLIENT
+# ============================================================================
+
+def encode_command(*args: Union[str, int, float, bytes]) -> bytes:
+    """RESP array of bulk strings"""
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+    return b"".join(parts)
+
+
+def read_reply(stream) -> Any:
+    """Parse one RESP reply from a buffered binary stream"""
+    line = stream.readline()
+    if not line:
+        raise StateBackendError("Connection closed by server")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode()
+    if kind == b"-":
+        raise StateBackendError(payload.decode())
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = stream.read(length + 2)
+        return data[:-2].decode("utf-8")
+    if kind == b"*":
+        length = int(payload)
+        return None if length < 0 else [read_reply(stream) for _ in range(length)]
+    raise StateBackendError(f"Unexpected reply {line!r}")
+
+
+class RespConnection:
+    """One blocking socket connection speaking RESP2"""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stream = self.sock.makefile("rb")
+
+    def call(self, *args) -> Any:
+        self.sock.sendall(encode_command(*args))
+        return read_reply(self.stream)
+
+    def close(self):
+        try:
+            self.stream.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RespBackend:
+    """Redis-protocol backend with a small thread-safe connection pool"""
+
+    shared = True
+
+    def __init__(self, url: str, pool_size: int = STATE_POOL_SIZE, timeout: float = STATE_TIMEOUT):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._idle: "Queue[RespConnection]" = Queue(maxsize=pool_size)
+        self.commands = 0
+        self.errors = 0
+
+    def _connect(self) -> RespConnection:
+        conn = RespConnection(self.host, self.port, self.timeout)
+        if self.password:
+            conn.call("AUTH", self.password)
+        if self.db:
+            conn.call("SELECT", self.db)
+        return conn
+
+    def execute(self, *args) -> Any:
+        """Run one command, retrying once on a fresh connection if a pooled one went stale"""
+        self.commands += 1
+        for attempt in range(2):
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                try:
+                    conn = self._connect()
+                except OSError as e:
+                    self.errors += 1
+                    raise StateBackendError(f"Cannot connect to {self.host}:{self.port}: {e}") from e
+            try:
+                reply = conn.call(*args)
+            except (OSError, StateBackendError) as e:
+                conn.close()
+                if isinstance(e, StateBackendError) and "Connection closed" not in str(e):
+                    self.errors += 1
+                    raise
+                if attempt:
+                    self.errors += 1
+                    raise StateBackendError(str(e)) from e
+                continue
+            try:
+                self._idle.put_nowait(conn)
+            except Full:
+                conn.close()
+            return reply
+
+    def get(self, key: str) -> Optional[str]:
+        return self.execute("GET", key)
+
+    def set(self, key: str, value: Union[str, int], ttl: Optional[float] = None,
+            nx: bool = False, xx: bool = False) -> bool:
+        args: List[Any] = ["SET", key, value]
+        if ttl:
+            args += ["PX", max(1, int(ttl * 1000))]
+        if nx:
+            args.append("NX")
+        if xx:
+            args.append("XX")
+        return self.execute(*args) == "OK"
+
+    def delete(self, *keys: str) -> int:
+        return self.execute("DEL", *keys) if keys else 0
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        value = self.execute("INCRBY", key, amount)
+        if ttl and value == amount:
+            self.execute("PEXPIRE", key, max(1, int(ttl * 1000)))
+        return value
+
+    def expire(self, key: str, ttl: float) -> bool:
+        return self.execute("PEXPIRE", key, max(1, int(ttl * 1000))) == 1
+
+    def flush(self):
+        self.execute("FLUSHDB")
+
+    def ping(self) -> bool:
+        return self.execute("PING") == "PONG"
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        return {"commands": self.commands, "errors": self.errors, "idle_connections": self._idle.qsize()}
+
+
+StateBackend = Union[MemoryBackend, RespBackend]
+
+
+def create_state_backend(url: str = STATE_BACKEND_URL) -> StateBackend:
+    """Backend for a STATE_BACKEND_URL"""
+    scheme = urlparse(url).scheme
+    if scheme in ("", "memory"):
+        return MemoryBackend()
+    if scheme == "redis":
+        return RespBackend(url)
+    raise ValueError(f"Unsupported STATE_BACKEND_URL scheme: {scheme!r}")
+
+
+state = create_state_backend()
+
+
+# ============================================================================
+# LEADER LOCK
+# ============================================================================
+
+class LeaderLock:
+    """Lease held by at most one worker, so background jobs run once per deployment.
+
+    The holder must renew() well within the TTL; if it dies, another worker
+    takes over once the lease expires.
+    """
+
+    def __init__(self, backend: StateBackend, name: str, ttl: float = 30):
+        self.backend = backend
+        self.key = f"leader:{name}"
+        self.ttl = ttl
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def acquire(self) -> bool:
+        """Take the lease if free, or extend it if already held"""
+        if self.backend.set(self.key, self.token, ttl=self.ttl, nx=True):
+            return True
+        return self.renew()
+
+    def renew(self) -> bool:
+        if self.backend.get(self.key) != self.token:
+            return False
+        return self.backend.set(self.key, self.token, ttl=self.ttl, xx=True)
+
+    def release(self):
+        if self.backend.get(self.key) == self.token:
+            self.backend.delete(self.key)
+
+
+LEADER_LOCK_TTL = float(os.getenv("LEADER_LOCK_TTL", "15"))
+
+
+async def run_as_leader(name: str, job: Callable[[], Awaitable[Any]], ttl: float = LEADER_LOCK_TTL):
+    """Run a long-lived background job only on the worker holding the named leader lock.
+
+    Without a shared backend every process is its own leader. Otherwise the
+    others keep polling and take over if the leader stops renewing.
+    """
+    if not state.shared:
+        return await job()
+
+    lock = LeaderLock(state, name, ttl)
+    while True:
+        try:
+            leader = await asyncio.to_thread(lock.acquire)
+        except StateBackendError:
+            leader = False
+        if not leader:
+            await asyncio.sleep(ttl / 3)
+            continue
+
+        logger.info("Acquired leader lock %s", lock.key)
+        task = asyncio.create_task(job())
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=ttl / 3)
+                if done:
+                    return task.result()
+                try:
+                    still_leader = await asyncio.to_thread(lock.renew)
+                except StateBackendError:
+                    still_leader = False
+                if not still_leader:
+                    logger.warning("Lost leader lock %s", lock.key)
+                    break
+        finally:
+            if not task.done():
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+            with suppress(StateBackendError):
+                await asyncio.to_thread(lock.release)
@@ -0,0 +1,69 @@
+"""
+Local Stripe API stub for WORLD DISTRIBUTION
+
+Implements just enough of POST /v1/payment_intents (including Idempotency-Key
+replay) to load-test checkout without network access:
+
+    uvicorn stripe_stub:app --port 12111
+    STRIPE_API_BASE=http://localhost:12111 STRIPE_SECRET_KEY=sk_test_stub uvicorn main:app
+
+STUB_LATENCY_MS adds artificial latency and STUB_FAILURE_RATE makes a
+fraction of requests fail with 500, to exercise retries and the breaker.
+"""
+import asyncio
+import os
+import random
+import secrets
+import time
+from urllib.parse import parse_qsl
+from typing import Optional, Dict, Any
+from fastapi import FastAPI, Request, Header
+from fastapi.responses import JSONResponse
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "0"))
+STUB_FAILURE_RATE = float(os.getenv("STUB_FAILURE_RATE", "0"))
+
+app = FastAPI(title="Stripe API stub")
+
+# Idempotency-Key -> previously returned PaymentIntent
+_responses: Dict[str, Dict[str, Any]] = {}
+
+
+@app.post("/v1/payment_intents")
+async def create_payment_intent(request: Request, idempotency_key: Optional[str] = Header(None)):
+    if STUB_LATENCY_MS:
+        await asyncio.sleep(STUB_LATENCY_MS / 1000)
+    if idempotency_key and idempotency_key in _responses:
+        return _responses[idempotency_key]
+    if random.random() < STUB_FAILURE_RATE:
+        return JSONResponse(status_code=500, content={"error": {"message": "Stub failure"}})
+
+    # Parse the form body directly so the stub needs no python-multipart
+    form = dict(parse_qsl((await request.body()).decode("utf-8")))
+    try:
+        amount = int(form.get("amount", ""))
+    except ValueError:
+        amount = 0
+    if amount < 50:
+        return JSONResponse(
+            status_code=400,
+            content={"error": {"type": "invalid_request_error", "message": "Amount must be at least 50 cents"}}
+        )
+
+    intent_id = "pi_" + secrets.token_hex(12)
+    intent = {
+        "id": intent_id,
+        "object": "payment_intent",
+        "amount": amount,
+        "currency": form.get("currency", "eur"),
+        "status": "requires_payment_method",
+        "client_secret": f"{intent_id}_secret_{secrets.token_hex(12)}",
+        "created": int(time.time()),
+        "livemode": False,
+        "metadata": {
+            key[len("metadata["):-1]: value for key, value in form.items() if key.startswith("metadata[")
+        },
+    }
+    if idempotency_key:
+        _responses[idempotency_key] = intent
+    return intent
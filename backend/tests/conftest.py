@@ -0,0 +1,20 @@
+"""
+Test setup for WORLD DISTRIBUTION
+
+Points DATABASE_PATH at a throwaway file before any app module is imported
+(importing database creates it from schema.sql), and puts the backend
+directory on sys.path so tests import modules the way the app does.
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_DIR = tempfile.mkdtemp(prefix="world_distribution_tests_")
+
+os.environ["DATABASE_PATH"] = os.path.join(TEST_DIR, "test.db")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.pop("STATE_BACKEND_URL", None)
+os.environ.pop("STRIPE_SECRET_KEY", None)
+sys.path.insert(0, BACKEND_DIR)
@@ -0,0 +1,35 @@
+from catalog import CatalogSnapshot
+
+
+def make_snapshot() -> CatalogSnapshot:
+    rows = [
+        {"id": 1, "name": "Rice", "category": "Grains", "stock": 100},
+        {"id": 2, "name": "Oats", "category": "Grains", "stock": 100},
+        {"id": 3, "name": "Olive Oil", "category": "Oils", "stock": 100},
+    ]
+    return CatalogSnapshot(rows, change_id=10)
+
+
+def test_with_stock_ignores_levels_older_than_the_snapshot():
+    snapshot = make_snapshot()
+    # Two orders commit at versions 12 and 11 but apply their levels in the opposite order
+    newer = snapshot.with_stock({1: 40}, change_id=12)
+    older = newer.with_stock({1: 70, 2: 90}, change_id=11)
+    assert older.by_id[1]["stock"] == 40
+    assert older.by_id[2]["stock"] == 90
+
+    # Levels from before the snapshot was loaded are already reflected in it
+    assert snapshot.with_stock({3: 1}, change_id=9).by_id[3]["stock"] == 100
+
+
+def test_with_stock_keeps_bodies_of_untouched_products_and_categories():
+    snapshot = make_snapshot()
+    for product_id in (1, 2, 3):
+        snapshot.item_body(product_id)
+    snapshot.list_body("Grains")
+    oils = snapshot.list_body("Oils")
+
+    updated = snapshot.with_stock({1: 50, 3: 100}, change_id=11)
+    assert sorted(updated._items) == [2, 3]
+    assert updated.list_body("Oils") is oils
+    assert b'"stock":50' in updated.item_body(1)[0]
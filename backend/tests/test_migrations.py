@@ -0,0 +1,77 @@
+import os
+import sqlite3
+
+import pytest
+
+import migrations
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_PATH = os.path.join(os.path.dirname(TESTS_DIR), "schema.sql")
+
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    """A database at the original (pre-migrations) schema with two orders"""
+    path = str(tmp_path / "baseline.db")
+    conn = sqlite3.connect(path)
+    with open(os.path.join(TESTS_DIR, "baseline_schema.sql")) as f:
+        conn.executescript(f.read())
+    conn.execute(
+        """INSERT INTO users (id, email, password_hash, company_name, country, region)
+           VALUES (1, 'buyer@example.com', 'x', 'Buyer', 'Greece', 'EU')"""
+    )
+    conn.executemany(
+        "INSERT INTO products (id, name, category, base_price, unit, stock) VALUES (?, ?, ?, ?, 'kg', 1000)",
+        [(1, "Rice", "Grains", 1.5), (2, "Olive Oil", "Oils", 8.0)]
+    )
+    conn.executemany(
+        """INSERT INTO orders (id, user_id, total_amount, vat_amount, status, payment_method, created_at)
+           VALUES (?, 1, ?, ?, ?, 'card', '2026-01-15 10:00:00')""",
+        [(1, 950.0, 180.5, "paid"), (2, 150.0, 28.5, "pending")]
+    )
+    conn.executemany(
+        """INSERT INTO order_items (order_id, product_id, quantity, price_per_unit, volume_tier)
+           VALUES (?, ?, ?, ?, '100kg')""",
+        [(1, 1, 100, 1.5), (1, 2, 100, 8.0), (2, 1, 100, 1.5), (2, 99, 1, 0.0)]
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_migrates_baseline_database_with_orders(baseline_db):
+    applied = migrations.migrate(baseline_db, backup=False)
+    assert applied == [version for version, _, _ in migrations.MIGRATIONS]
+
+    conn = sqlite3.connect(baseline_db)
+    # What ensure_schema() applies after migrating must fit the migrated tables
+    with open(SCHEMA_PATH) as f:
+        conn.executescript(f.read())
+
+    categories = conn.execute("SELECT product_id, category FROM order_items ORDER BY id").fetchall()
+    assert categories == [(1, "Grains"), (2, "Oils"), (1, "Grains"), (99, None)]
+
+    assert conn.execute(
+        "SELECT status, orders, spend FROM sales_daily_user ORDER BY status"
+    ).fetchall() == [("paid", 1, 950.0), ("pending", 1, 150.0)]
+    assert conn.execute(
+        "SELECT category, status, quantity FROM sales_daily_category ORDER BY category, status"
+    ).fetchall() == [("Grains", "paid", 100), ("Grains", "pending", 100), ("Oils", "paid", 100),
+                     ("Uncategorized", "pending", 1)]
+    conn.close()
+
+    assert migrations.migrate(baseline_db, backup=False) == []
+
+
+def test_category_migration_fills_databases_migrated_without_it(baseline_db):
+    # Databases that applied migration 2 before it added order_items.category
+    migrations.migrate(baseline_db, backup=False, target=4)
+    conn = migrations.connect(baseline_db)
+    conn.execute("ALTER TABLE order_items DROP COLUMN category")
+    conn.execute("DELETE FROM schema_migrations WHERE version = 5")
+    conn.close()
+
+    assert migrations.migrate(baseline_db, backup=False, target=5) == [5]
+    conn = sqlite3.connect(baseline_db)
+    assert conn.execute("SELECT count(*) FROM order_items WHERE category IS NULL").fetchone()[0] == 1
+    conn.close()
@@ -0,0 +1,83 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from database import get_db
+from idempotency import REPLAY_HEADER
+
+
+@pytest.fixture(scope="module")
+def client():
+    with get_db() as conn:
+        product_id = conn.execute(
+            """INSERT INTO products (name, category, base_price, unit, stock)
+               VALUES ('Basmati Rice', 'Grains', 1.2345, 'kg', 100000)"""
+        ).lastrowid
+    with TestClient(main.app) as client:
+        response = client.post("/api/auth/register", json={
+            "email": "orders@example.com", "password": "secret123",
+            "company_name": "Buyer", "country": "Greece",
+        })
+        assert response.status_code == 200
+        client.product_id = product_id
+        yield client
+
+
+def order_body(product_id: int, quantity: int = 600, price: float = 1.0493, tier: str = "500kg"):
+    return {
+        "items": [{"product_id": product_id, "quantity": quantity, "price_per_unit": price, "volume_tier": tier}],
+        "payment_method": "card",
+    }
+
+
+def order_count() -> int:
+    with get_db() as conn:
+        return conn.execute("SELECT count(*) FROM orders").fetchone()[0]
+
+
+def test_retried_order_replays_the_stored_response(client):
+    body = order_body(client.product_id)
+    before = order_count()
+
+    first = client.post("/api/orders", json=body, headers={"Idempotency-Key": "order-1"})
+    assert first.status_code == 200
+    assert REPLAY_HEADER not in first.headers
+
+    retry = client.post("/api/orders", json=body, headers={"Idempotency-Key": "order-1"})
+    assert retry.status_code == 200
+    assert retry.headers[REPLAY_HEADER] == "true"
+    assert retry.content == first.content
+    assert order_count() == before + 1
+
+    # The same key with a different body is a client error, not a replay
+    changed = client.post("/api/orders", json=order_body(client.product_id, quantity=700),
+                          headers={"Idempotency-Key": "order-1"})
+    assert changed.status_code == 422
+    assert order_count() == before + 1
+
+
+def test_orders_with_wrong_prices_or_tiers_are_rejected(client):
+    before = order_count()
+    for body in (
+        order_body(client.product_id, price=0.5),
+        order_body(client.product_id, quantity=100),
+        order_body(client.product_id, tier="5000kg"),
+        order_body(999999),
+    ):
+        response = client.post("/api/orders", json=body)
+        assert response.status_code == 400, body
+    assert order_count() == before
+
+
+def test_orders_are_stored_at_server_prices_with_quote_totals(client):
+    quote = client.post("/api/quote", json={"items": [{"product_id": client.product_id, "quantity": 777}]}).json()
+
+    response = client.post("/api/orders", json=order_body(client.product_id, quantity=777, price=1.053))
+    assert response.status_code == 200
+    order = response.json()
+    assert (order["total_amount"], order["vat_amount"]) == (quote["subtotal"], quote["vat_amount"])
+    with get_db() as conn:
+        stored = conn.execute(
+            "SELECT price_per_unit FROM order_items WHERE order_id = ?", (order["id"],)
+        ).fetchone()[0]
+    assert stored == quote["items"][0]["price_per_unit"]
@@ -0,0 +1,16 @@
+import asyncio
+
+from passwords import PasswordService
+
+
+def test_service_is_usable_after_shutdown():
+    service = PasswordService(workers=1, rounds=4)
+
+    async def round_trip():
+        hashed = await service.hash("secret123")
+        return await service.verify("secret123", hashed)
+
+    # Two app lifespans in one process (e.g. TestClient used twice, uvicorn reload)
+    for _ in range(2):
+        assert asyncio.run(round_trip())
+        service.shutdown()
@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+import pytest
+
+from payments import StripeClient, PaymentProviderError, PaymentProviderUnavailable
+
+
+def make_client(handler) -> StripeClient:
+    client = StripeClient(api_key="sk_test_123", max_retries=0)
+    client._client = httpx.AsyncClient(base_url="https://stripe.test", transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_half_open_breaker_lets_one_probe_through():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"id": "pi_1", "client_secret": "secret"})
+
+    async def scenario():
+        client = make_client(handler)
+        client.breaker.failures = client.breaker.failure_threshold
+        client.breaker.opened_at = 0.0  # cool-down long over: half-open
+        results = await asyncio.gather(
+            *(client.create_payment_intent(4500, "eur") for _ in range(5)), return_exceptions=True
+        )
+        await client.aclose()
+        return client, results
+
+    client, results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert sum(isinstance(r, dict) for r in results) == 1
+    assert sum(isinstance(r, PaymentProviderUnavailable) for r in results) == 4
+    assert client.breaker.state == "closed"
+
+
+@pytest.mark.parametrize("status", [403, 200])
+def test_non_json_body_maps_to_payment_errors(status):
+    async def handler(request):
+        return httpx.Response(status, text="<html>Bad gateway</html>", headers={"content-type": "text/html"})
+
+    async def scenario():
+        client = make_client(handler)
+        try:
+            await client.create_payment_intent(4500, "eur")
+        finally:
+            await client.aclose()
+
+    expected = PaymentProviderError if status >= 400 else PaymentProviderUnavailable
+    with pytest.raises(expected):
+        asyncio.run(scenario())
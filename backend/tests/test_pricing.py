@@ -0,0 +1,46 @@
+import pytest
+
+from catalog import CatalogSnapshot
+from models import OrderCreate, OrderItem
+from orders import calculate_totals
+from pricing import PriceTable, PricingError
+
+
+def make_table() -> PriceTable:
+    rows = [
+        {"id": 1, "name": "Rice", "category": "Grains", "base_price": 1.2345, "stock": 5000},
+        {"id": 2, "name": "Olive Oil", "category": "Oils", "base_price": 7.99, "stock": 5000},
+    ]
+    return PriceTable(CatalogSnapshot(rows))
+
+
+def test_validate_rejects_wrong_tiers_and_prices():
+    table = make_table()
+    items = [
+        OrderItem(product_id=1, quantity=100, price_per_unit=1.2345, volume_tier="2000kg"),
+        OrderItem(product_id=1, quantity=100, price_per_unit=1.0493, volume_tier="500kg"),
+        OrderItem(product_id=2, quantity=100, price_per_unit=1.0, volume_tier="100kg"),
+        OrderItem(product_id=9, quantity=100, price_per_unit=1.0, volume_tier="100kg"),
+    ]
+    with pytest.raises(PricingError) as excinfo:
+        table.validate(items)
+    assert [error.split(":")[0] for error in excinfo.value.errors] == [
+        "items[0]", "items[1]", "items[2]", "items[3]"
+    ]
+
+
+def test_orders_are_stored_at_server_prices_and_match_the_quote():
+    table = make_table()
+    # Within tolerance of the server prices, but not equal to them
+    order = OrderCreate(
+        payment_method="card",
+        items=[
+            OrderItem(product_id=1, quantity=777, price_per_unit=1.053, volume_tier="500kg"),
+            OrderItem(product_id=2, quantity=1000, price_per_unit=5.589, volume_tier="1000kg+"),
+        ],
+    )
+    table.validate(order.items)
+    assert [item.price_per_unit for item in order.items] == [1.0493, 5.593]
+
+    quote = table.quote([(1, 777), (2, 1000)])
+    assert calculate_totals(order) == (quote["subtotal"], quote["vat_amount"])
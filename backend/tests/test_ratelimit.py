@@ -0,0 +1,38 @@
+import asyncio
+import threading
+
+from ratelimit import TokenBuckets, ConcurrencyLimiter
+
+
+def test_token_buckets_survive_concurrent_threads():
+    buckets = TokenBuckets(max_keys=50)
+    errors = []
+
+    def hammer(worker: int):
+        try:
+            for i in range(5000):
+                buckets.take((worker, i % 200), rate=1000, burst=5)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=hammer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(buckets) <= 50
+
+
+def test_concurrency_limiter_works_across_event_loops():
+    limiter = ConcurrencyLimiter(limit=1, max_queued=1, timeout=0.01)
+
+    async def admit_twice():
+        assert await limiter.acquire()
+        # The only slot is taken: the second request waits briefly and is shed
+        assert not await limiter.acquire()
+        limiter.release()
+
+    asyncio.run(admit_twice())
+    limiter.reset()
+    asyncio.run(admit_twice())
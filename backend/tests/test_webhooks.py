@@ -0,0 +1,111 @@
+import json
+
+import pytest
+
+import webhooks
+from database import get_db
+
+
+def queue(event_id: str, event_type: str = "payment_intent.succeeded", payment_intent_id: str = "pi_test"):
+    event = {
+        "id": event_id,
+        "type": event_type,
+        "data": {"object": {"object": "payment_intent", "id": payment_intent_id}},
+    }
+    assert webhooks.enqueue_event(event, json.dumps(event).encode())
+
+
+def event_row(event_id: str):
+    with get_db() as conn:
+        return conn.execute("SELECT * FROM webhook_events WHERE event_id = ?", (event_id,)).fetchone()
+
+
+@pytest.fixture(autouse=True)
+def empty_queue():
+    with get_db() as conn:
+        conn.execute("DELETE FROM webhook_events")
+    yield
+
+
+def test_failing_event_backs_off_and_is_dead_lettered(monkeypatch):
+    def broken(conn, event_type, payment_intent_id):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(webhooks, "apply_event", broken)
+    queue("evt_broken")
+
+    assert webhooks.drain_queue(batch_size=1) == (1, 0)
+    row = event_row("evt_broken")
+    assert (row["status"], row["attempts"], row["error"]) == ("pending", 1, "boom")
+    # Backing off: the next drain does not pick it up again
+    assert webhooks.drain_queue(batch_size=1) == (0, 0)
+
+    for attempt in range(2, webhooks.WEBHOOK_MAX_ATTEMPTS + 1):
+        with get_db() as conn:
+            conn.execute("UPDATE webhook_events SET next_attempt_at = datetime('now', '-1 seconds')")
+        assert webhooks.drain_queue(batch_size=1) == (1, 0)
+        assert event_row("evt_broken")["attempts"] == attempt
+
+    assert event_row("evt_broken")["status"] == "failed"
+
+
+def test_expired_unmatched_events_are_deleted():
+    queue("evt_old", payment_intent_id="pi_nobody")
+    queue("evt_new", payment_intent_id="pi_nobody")
+    webhooks.drain_queue()
+    with get_db() as conn:
+        conn.execute(
+            "UPDATE webhook_events SET received_at = datetime('now', ?) WHERE event_id = 'evt_old'",
+            (f"-{webhooks.WEBHOOK_UNMATCHED_TTL + 60} seconds",)
+        )
+
+    assert webhooks.delete_expired_unmatched(batch_size=1) == 1
+    assert event_row("evt_old") is None
+    assert event_row("evt_new")["status"] == "unmatched"
+
+
+def order_with_intent(payment_intent_id: str) -> int:
+    with get_db() as conn:
+        conn.execute(
+            """INSERT OR IGNORE INTO users (id, email, password_hash, company_name, country, region)
+               VALUES (1, 'webhooks@example.com', 'x', 'Buyer', 'Greece', 'EU')"""
+        )
+        return conn.execute(
+            """INSERT INTO orders (user_id, total_amount, vat_amount, status, payment_method, payment_intent_id)
+               VALUES (1, 100.0, 19.0, 'pending', 'card', ?)""",
+            (payment_intent_id,)
+        ).lastrowid
+
+
+def order_status(order_id: int) -> str:
+    with get_db() as conn:
+        return conn.execute("SELECT status FROM orders WHERE id = ?", (order_id,)).fetchone()["status"]
+
+
+def test_status_transitions_never_regress_an_order():
+    order_id = order_with_intent("pi_transitions")
+
+    queue("evt_processing", "payment_intent.processing", "pi_transitions")
+    queue("evt_succeeded", "payment_intent.succeeded", "pi_transitions")
+    assert webhooks.drain_queue() == (2, 2)
+    assert order_status(order_id) == "paid"
+
+    # Late and replayed events are no-ops; refunds only apply to paid orders
+    queue("evt_late_failure", "payment_intent.payment_failed", "pi_transitions")
+    queue("evt_refunded", "charge.refunded", "pi_transitions")
+    assert webhooks.drain_queue() == (2, 1)
+    assert order_status(order_id) == "refunded"
+    assert not webhooks.enqueue_event({"id": "evt_succeeded", "type": "payment_intent.succeeded"}, b"{}")
+    assert event_row("evt_late_failure")["status"] == "processed"
+
+
+def test_unmatched_events_apply_when_the_order_appears():
+    queue("evt_early", "payment_intent.succeeded", "pi_early")
+    webhooks.drain_queue()
+    assert event_row("evt_early")["status"] == "unmatched"
+
+    order_id = order_with_intent("pi_early")
+    with get_db() as conn:
+        assert webhooks.apply_unmatched_events(conn, "pi_early") == 1
+    assert order_status(order_id) == "paid"
+    assert event_row("evt_early")["status"] == "processed"
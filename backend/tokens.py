@@ -0,0 +1,123 @@
+"""
+Signed session tokens for WORLD DISTRIBUTION
+
+With AUTH_MODE=token the session_id cookie carries a short-lived HS256 token
+with the user's id and profile instead of a bare session id, so requests are
+authenticated without a database lookup. Each token names the database
+session it was issued for (sid); when it expires it is re-issued from that
+session, and logging out revokes the sid until its tokens have expired.
+"""
+import logging
+import os
+import secrets
+import time
+import uuid
+from typing import Optional, Dict, Any
+from jose import jwt, JWTError, ExpiredSignatureError
+from state_backend import state, StateBackendError
+
+logger = logging.getLogger(__name__)
+
+AUTH_MODE = os.getenv("AUTH_MODE", "session")
+TOKEN_TTL = int(os.getenv("TOKEN_TTL", "900"))
+TOKEN_ALGORITHM = "HS256"
+PROFILE_CLAIMS = ("email", "company_name", "country", "region")
+
+TOKEN_SECRET = os.getenv("TOKEN_SECRET")
+if AUTH_MODE == "token" and not TOKEN_SECRET:
+    # Tokens then only validate in this process; set TOKEN_SECRET for several workers
+    logger.warning("TOKEN_SECRET is not set; using a random per-process secret")
+    TOKEN_SECRET = secrets.token_urlsafe(32)
+
+
+class TokenExpired(Exception):
+    """Signature is valid but the token is past its exp; carries the claims for refresh"""
+
+    def __init__(self, claims: Dict[str, Any]):
+        super().__init__("Token expired")
+        self.claims = claims
+
+
+def token_mode() -> bool:
+    return AUTH_MODE == "token"
+
+
+def looks_like_token(value: Optional[str]) -> bool:
+    return bool(value) and value.count(".") == 2
+
+
+def issue_token(user: Dict[str, Any], session_id: str, ttl: int = TOKEN_TTL) -> str:
+    """Sign a token for a resolved session user"""
+    now = int(time.time())
+    claims = {
+        "sub": str(user["id"]),
+        "sid": session_id,
+        "jti": uuid.uuid4().hex,
+        "iat": now,
+        "exp": now + ttl,
+    }
+    for claim in PROFILE_CLAIMS:
+        claims[claim] = user.get(claim)
+    return jwt.encode(claims, TOKEN_SECRET, algorithm=TOKEN_ALGORITHM)
+
+
+def decode_token(token: str) -> Dict[str, Any]:
+    """Verified claims; raises TokenExpired, or JWTError if the token is invalid"""
+    try:
+        return jwt.decode(token, TOKEN_SECRET, algorithms=[TOKEN_ALGORITHM])
+    except ExpiredSignatureError:
+        claims = jwt.decode(
+            token, TOKEN_SECRET, algorithms=[TOKEN_ALGORITHM], options={"verify_exp": False}
+        )
+        raise TokenExpired(claims)
+
+
+def user_from_claims(claims: Dict[str, Any]) -> Dict[str, Any]:
+    """Same shape as auth.get_user_from_session returns"""
+    user: Dict[str, Any] = {"id": int(claims["sub"])}
+    for claim in PROFILE_CLAIMS:
+        user[claim] = claims.get(claim)
+    return user
+
+
+def session_id_of(cookie: Optional[str]) -> Optional[str]:
+    """Database session id behind a cookie value (a token or a bare session id)"""
+    if not looks_like_token(cookie):
+        return cookie
+    try:
+        return decode_token(cookie).get("sid")
+    except TokenExpired as e:
+        return e.claims.get("sid")
+    except JWTError:
+        return None
+
+
+def revoke_session(session_id: str):
+    """Reject tokens issued for a session until they would have expired anyway"""
+    try:
+        state.set(f"revoked:{session_id}", 1, ttl=TOKEN_TTL + 60)
+    except StateBackendError:
+        logger.exception("Could not revoke tokens of a session; they stay valid for up to %ss", TOKEN_TTL)
+
+
+def is_revoked(session_id: Optional[str]) -> bool:
+    if not session_id:
+        return True
+    try:
+        return state.get(f"revoked:{session_id}") is not None
+    except StateBackendError:
+        # Fail closed: the caller falls back to the database session
+        return True
+
+
+def verify_token(token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """User for a valid, unexpired, unrevoked token, or None"""
+    if not looks_like_token(token):
+        return None
+    try:
+        claims = decode_token(token)
+    except (TokenExpired, JWTError):
+        return None
+    if is_revoked(claims.get("sid")):
+        return None
+    return user_from_claims(claims)
@@ -0,0 +1,269 @@
+"""
+Stripe webhook pipeline for WORLD DISTRIBUTION
+
+The endpoint only verifies the signature and appends the event to the
+durable webhook_events queue (deduplicated by Stripe event id), so it can
+acknowledge immediately even during bursts. A background worker drains the
+queue in batches and applies order status transitions by payment_intent_id.
+Events that arrive before their order exists are kept as 'unmatched' and
+applied when the order is placed.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Optional, Dict, Any, Tuple
+import stripe
+from database import get_db, transaction, run_in_db
+import analytics
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_TOLERANCE = int(os.getenv("STRIPE_WEBHOOK_TOLERANCE", "300"))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "200"))
+WEBHOOK_POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", "5"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+# A failed event is retried after this many seconds, doubling with each further attempt
+WEBHOOK_RETRY_DELAY = float(os.getenv("WEBHOOK_RETRY_DELAY", "30"))
+
+# Stripe event type -> resulting order status
+EVENT_STATUS = {
+    'payment_intent.processing': 'processing',
+    'payment_intent.succeeded': 'paid',
+    'payment_intent.payment_failed': 'failed',
+    'payment_intent.canceled': 'cancelled',
+    'charge.refunded': 'refunded',
+}
+
+# order status -> statuses it may be reached from (late or replayed events never regress an order)
+ALLOWED_FROM = {
+    'processing': ('pending',),
+    'paid': ('pending', 'processing', 'failed'),
+    'failed': ('pending', 'processing'),
+    'cancelled': ('pending', 'processing', 'failed'),
+    'refunded': ('paid',),
+}
+
+
+class WebhookVerificationError(ValueError):
+    """Raised when a webhook payload or signature is invalid"""
+
+
+def get_webhook_secret() -> Optional[str]:
+    """Configured signing secret, or None when webhooks are not set up"""
+    secret = os.getenv("STRIPE_WEBHOOK_SECRET")
+    if not secret or secret == "whsec_your_webhook_secret_here":
+        return None
+    return secret
+
+
+def verify_event(payload: bytes, signature: Optional[str], secret: str) -> Dict[str, Any]:
+    """Check the Stripe-Signature header and return the decoded event"""
+    try:
+        stripe.WebhookSignature.verify_header(payload, signature, secret, WEBHOOK_TOLERANCE)
+        event = json.loads(payload)
+    except (stripe.SignatureVerificationError, ValueError) as e:
+        raise WebhookVerificationError(str(e)) from e
+    if not isinstance(event, dict) or 'id' not in event or 'type' not in event:
+        raise WebhookVerificationError("Malformed event")
+    return event
+
+
+def payment_intent_of(event: Dict[str, Any]) -> Optional[str]:
+    """Extract the PaymentIntent id an event refers to"""
+    obj = (event.get('data') or {}).get('object') or {}
+    if obj.get('object') == 'payment_intent':
+        return obj.get('id')
+    return obj.get('payment_intent')
+
+
+def enqueue_event(event: Dict[str, Any], payload: bytes) -> bool:
+    """Store an event in the queue; returns False if it was already received"""
+    with get_db() as conn:
+        cursor = conn.execute(
+            """INSERT OR IGNORE INTO webhook_events (event_id, event_type, payment_intent_id, payload)
+               VALUES (?, ?, ?, ?)""",
+            (event['id'], event['type'], payment_intent_of(event), payload.decode('utf-8'))
+        )
+        return cursor.rowcount == 1
+
+
+# Events for a payment intent no order carries yet stay 'unmatched' this long,
+# and are applied when an order with that payment_intent_id is placed
+WEBHOOK_UNMATCHED_TTL = int(os.getenv("WEBHOOK_UNMATCHED_TTL", str(7 * 24 * 60 * 60)))
+
+MARK_EVENT = """UPDATE webhook_events SET status = ?, attempts = attempts + 1, error = NULL,
+                processed_at = CURRENT_TIMESTAMP WHERE event_id = ?"""
+FAIL_EVENT = """UPDATE webhook_events SET attempts = attempts + 1, error = ?,
+                status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE status END,
+                next_attempt_at = datetime('now', '+' || (? * (1 << attempts)) || ' seconds')
+                WHERE event_id = ?"""
+
+
+def apply_event(conn, event_type: str, payment_intent_id: Optional[str]) -> Optional[int]:
+    """Apply one event's status transition; returns orders updated, or None if no order has the intent"""
+    status = EVENT_STATUS.get(event_type)
+    if status is None or not payment_intent_id:
+        return 0
+    orders = conn.execute(
+        "SELECT id, status FROM orders WHERE payment_intent_id = ?", (payment_intent_id,)
+    ).fetchall()
+    if not orders:
+        return None
+    # ALLOWED_FROM makes replays and stale events no-ops
+    order_ids = [order['id'] for order in orders if order['status'] in ALLOWED_FROM[status]]
+    if not order_ids:
+        return 0
+    # Move the orders' sales rollups from the old status to the new one
+    analytics.record_orders(conn, order_ids, sign=-1)
+    conn.executemany(
+        "UPDATE orders SET status = ? WHERE id = ?",
+        [(status, order_id) for order_id in order_ids]
+    )
+    analytics.record_orders(conn, order_ids)
+    return len(order_ids)
+
+
+def apply_unmatched_events(conn, payment_intent_id: Optional[str]) -> int:
+    """Apply events that arrived before any order carried this payment intent; returns orders updated"""
+    if not payment_intent_id:
+        return 0
+    events = conn.execute(
+        """SELECT event_id, event_type FROM webhook_events
+           WHERE payment_intent_id = ? AND status = 'unmatched' AND received_at >= datetime('now', ?)
+           ORDER BY received_at, rowid""",
+        (payment_intent_id, f"-{WEBHOOK_UNMATCHED_TTL} seconds")
+    ).fetchall()
+    updated = 0
+    for event in events:
+        updated += apply_event(conn, event['event_type'], payment_intent_id) or 0
+        conn.execute(MARK_EVENT, ('processed', event['event_id']))
+    return updated
+
+
+def process_events_individually(events) -> int:
+    """Apply events one savepoint each, so a failing event only counts an attempt against itself"""
+    updated = 0
+    with transaction() as conn:
+        for event in events:
+            conn.execute("SAVEPOINT webhook_event")
+            try:
+                applied = apply_event(conn, event['event_type'], event['payment_intent_id'])
+                conn.execute(MARK_EVENT, ('unmatched' if applied is None else 'processed', event['event_id']))
+            except Exception as e:
+                conn.execute("ROLLBACK TO webhook_event")
+                conn.execute(FAIL_EVENT, (str(e), WEBHOOK_MAX_ATTEMPTS, WEBHOOK_RETRY_DELAY, event['event_id']))
+                logger.exception("Webhook event %s failed", event['event_id'])
+            else:
+                updated += applied or 0
+            conn.execute("RELEASE webhook_event")
+    return updated
+
+
+def process_batch(batch_size: int = WEBHOOK_BATCH_SIZE) -> Tuple[int, int]:
+    """Apply one batch of pending events that are not backing off; returns (events processed, orders updated)"""
+    with get_db() as conn:
+        events = conn.execute(
+            """SELECT event_id, event_type, payment_intent_id FROM webhook_events
+               WHERE status = 'pending' AND (next_attempt_at IS NULL OR next_attempt_at <= datetime('now'))
+               ORDER BY received_at, rowid LIMIT ?""",
+            (batch_size,)
+        ).fetchall()
+    if not events:
+        return 0, 0
+
+    try:
+        updated = 0
+        marks = []
+        with transaction() as conn:
+            # Events apply in arrival order
+            for event in events:
+                applied = apply_event(conn, event['event_type'], event['payment_intent_id'])
+                marks.append(('unmatched' if applied is None else 'processed', event['event_id']))
+                updated += applied or 0
+            conn.executemany(MARK_EVENT, marks)
+        return len(events), updated
+    except Exception:
+        logger.warning("Webhook batch failed; retrying its events one at a time", exc_info=True)
+    return len(events), process_events_individually(events)
+
+
+def delete_expired_unmatched(batch_size: int = WEBHOOK_BATCH_SIZE) -> int:
+    """Delete unmatched events older than WEBHOOK_UNMATCHED_TTL in bounded batches; returns rows deleted"""
+    total = 0
+    while True:
+        with get_db() as conn:
+            deleted = conn.execute(
+                """DELETE FROM webhook_events WHERE rowid IN (
+                       SELECT rowid FROM webhook_events
+                       WHERE status = 'unmatched' AND received_at < datetime('now', ?) LIMIT ?
+                   )""",
+                (f"-{WEBHOOK_UNMATCHED_TTL} seconds", batch_size)
+            ).rowcount
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+
+def drain_queue(batch_size: int = WEBHOOK_BATCH_SIZE) -> Tuple[int, int]:
+    """Process batches until the queue is empty; returns totals"""
+    processed = updated = 0
+    while True:
+        batch_processed, batch_updated = process_batch(batch_size)
+        processed += batch_processed
+        updated += batch_updated
+        if batch_processed < batch_size:
+            return processed, updated
+
+
+class WebhookWorker:
+    """Background consumer of the webhook_events queue"""
+
+    def __init__(self, poll_interval: float = WEBHOOK_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._wakeup: Optional[asyncio.Event] = None
+        self.processed = 0
+        self.orders_updated = 0
+        self.failures = 0
+
+    def notify(self):
+        """Wake the worker early because new events were queued"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self):
+        """Drain the queue whenever notified, or every poll interval"""
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            try:
+                processed, updated = await run_in_db(drain_queue)
+                self.processed += processed
+                self.orders_updated += updated
+            except Exception:
+                self.failures += 1
+                logger.exception("Webhook batch failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """Worker counters"""
+        return {
+            "processed": self.processed,
+            "orders_updated": self.orders_updated,
+            "failures": self.failures,
+        }
+
+
+webhook_worker = WebhookWorker()
+
+
+def queue_depth() -> Dict[str, int]:
+    """Number of queued events by status"""
+    with get_db() as conn:
+        rows = conn.execute(
+            "SELECT status, count(*) AS n FROM webhook_events GROUP BY status"
+        ).fetchall()
+    return {row['status']: row['n'] for row in rows}
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useMemo } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import { useCart } from '@/contexts/CartContext';
 import { useAuth } from '@/contexts/AuthContext';
@@ -22,6 +22,9 @@ export default function CheckoutPage() {
   // Calculate total in cents for Stripe
   const totalWithVAT = Math.round(totalAmount * 1.19 * 100); // Convert to cents
 
+  // One key per checkout amount and user, so repeated effect runs and retries reuse the same PaymentIntent
+  const idempotencyKey = useMemo(() => crypto.randomUUID(), [totalWithVAT, user?.id]);
+
   // Create PaymentIntent when component loads
   useEffect(() => {
     if (items.length > 0 && !clientSecret) {
@@ -30,6 +33,7 @@ export default function CheckoutPage() {
       createPaymentIntent({
         amount: totalWithVAT,
         currency: 'eur',
+        idempotencyKey,
         metadata: {
           userId: user?.id.toString() || '',
           companyName: user?.company_name || '',
@@ -58,7 +62,7 @@ export default function CheckoutPage() {
           setLoadingPaymentIntent(false);
         });
     }
-  }, [items.length, totalWithVAT, clientSecret, user]);
+  }, [items.length, totalWithVAT, clientSecret, user, idempotencyKey]);
 
   const handleStripeSuccess = () => {
     toast.success('Payment successful!', {
@@ -9,17 +9,21 @@ interface CreatePaymentIntentParams {
     amount: number; // Amount in cents
     currency?: string;
     metadata?: Record<string, string>;
+    idempotencyKey?: string; // Reuse across retries of one checkout to get the same PaymentIntent
 }
 
 export async function createPaymentIntent({
     amount,
     currency = 'eur',
     metadata = {},
+    idempotencyKey,
 }: CreatePaymentIntentParams): Promise<PaymentIntentResponse> {
     const response = await fetch(`${API_URL}/api/create-payment-intent`, {
         method: 'POST',
+        credentials: 'include', // Idempotency keys are scoped to the signed-in user
         headers: {
             'Content-Type': 'application/json',
+            ...(idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {}),
         },
         body: JSON.stringify({
             amount,